@@ -53,9 +53,12 @@ def run_migrations_online():
                 poolclass=pool.NullPool)
 
     connection = engine.connect()
+    # Every migration commits on its own, so the online ones can work on the
+    # tables changed by the previous ones from another connection
     context.configure(
                 connection=connection, 
-                target_metadata=target_metadata
+                target_metadata=target_metadata,
+                transaction_per_migration=True
                 )
 
     try:
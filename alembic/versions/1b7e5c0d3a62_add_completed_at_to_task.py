@@ -0,0 +1,36 @@
+"""add completed_at to task
+
+Revision ID: 1b7e5c0d3a62
+Revises: 2d3c6f1a9b84
+Create Date: 2015-01-28 09:47:12.604518
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '1b7e5c0d3a62'
+down_revision = '2d3c6f1a9b84'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('task', sa.Column('completed_at', sa.Text))
+    # A task was completed by its n_answers-th answer (or its last one, if
+    # n_answers was lowered afterwards)
+    query = '''UPDATE task SET completed_at=runs.finish_time
+               FROM (SELECT task_id, finish_time,
+                     ROW_NUMBER() OVER (PARTITION BY task_id
+                                        ORDER BY id) AS n,
+                     COUNT(id) OVER (PARTITION BY task_id) AS total
+                     FROM task_run) AS runs
+               WHERE task.id=runs.task_id AND task.state='completed'
+               AND runs.n=LEAST(task.n_answers, runs.total);'''
+    op.execute(query)
+    op.create_index('task_app_id_completed_at_idx', 'task',
+                    ['app_id', 'completed_at'])
+
+
+def downgrade():
+    op.drop_index('task_app_id_completed_at_idx', 'task')
+    op.drop_column('task', 'completed_at')
@@ -0,0 +1,45 @@
+"""add project stats rollups
+
+Revision ID: 2d3c6f1a9b84
+Revises: 4c1ad2e9b7f3
+Create Date: 2015-01-26 11:20:41.338126
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '2d3c6f1a9b84'
+down_revision = '4c1ad2e9b7f3'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.create_table(
+        'project_stats_day',
+        sa.Column('app_id', sa.Integer, primary_key=True,
+                  autoincrement=False),
+        sa.Column('day', sa.Date, primary_key=True),
+        sa.Column('anonymous', sa.Boolean, primary_key=True),
+        sa.Column('n_task_runs', sa.Integer, nullable=False, default=0))
+    op.create_table(
+        'project_stats_hour',
+        sa.Column('app_id', sa.Integer, primary_key=True,
+                  autoincrement=False),
+        sa.Column('hour', sa.Integer, primary_key=True, autoincrement=False),
+        sa.Column('anonymous', sa.Boolean, primary_key=True),
+        sa.Column('n_task_runs', sa.Integer, nullable=False, default=0))
+    op.create_table(
+        'stats_rollup_mark',
+        sa.Column('name', sa.Text, primary_key=True),
+        sa.Column('last_id', sa.Integer, nullable=False, default=0),
+        sa.Column('pending_id', sa.Integer, nullable=False, default=0))
+    # The update_stats_rollup job fills the rollups from the task runs
+    op.execute('''INSERT INTO stats_rollup_mark (name, last_id, pending_id)
+               VALUES ('task_run', 0, 0)''')
+
+
+def downgrade():
+    op.drop_table('stats_rollup_mark')
+    op.drop_table('project_stats_hour')
+    op.drop_table('project_stats_day')
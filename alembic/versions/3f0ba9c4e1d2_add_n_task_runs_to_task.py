@@ -0,0 +1,31 @@
+"""add n_task_runs to task
+
+Revision ID: 3f0ba9c4e1d2
+Revises: bbba2255e00
+Create Date: 2015-01-12 10:24:51.184305
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '3f0ba9c4e1d2'
+down_revision = 'bbba2255e00'
+
+from alembic import op
+import sqlalchemy as sa
+
+
+def upgrade():
+    op.add_column('task', sa.Column('n_task_runs', sa.Integer, default=0,
+                                    server_default='0', nullable=False))
+    query = '''UPDATE task SET n_task_runs=task_run_count.n_task_runs
+               FROM (SELECT task_id, COUNT(id) AS n_task_runs FROM task_run
+                     GROUP BY task_id) AS task_run_count
+               WHERE task.id=task_run_count.task_id;'''
+    op.execute(query)
+    op.create_index('task_app_id_n_task_runs_idx', 'task',
+                    ['app_id', 'n_task_runs', 'id'])
+
+
+def downgrade():
+    op.drop_index('task_app_id_n_task_runs_idx', 'task')
+    op.drop_column('task', 'n_task_runs')
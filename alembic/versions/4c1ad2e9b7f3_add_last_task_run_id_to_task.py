@@ -0,0 +1,40 @@
+"""add last_task_run_id to task
+
+Revision ID: 4c1ad2e9b7f3
+Revises: 3f0ba9c4e1d2
+Create Date: 2015-01-14 16:02:37.519204
+
+Also indexes task_run.task_id (unless it already is), as the last run of a
+task is looked up by it when one of its runs is deleted.
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '4c1ad2e9b7f3'
+down_revision = '3f0ba9c4e1d2'
+
+from alembic import op, context
+import sqlalchemy as sa
+
+
+def _task_id_indexed():
+    if context.is_offline_mode():
+        return False
+    indexes = sa.inspect(op.get_bind()).get_indexes('task_run')
+    return any(index['column_names'] == ['task_id'] for index in indexes)
+
+
+def upgrade():
+    if not _task_id_indexed():
+        op.create_index('task_run_task_id_idx', 'task_run', ['task_id'])
+    op.add_column('task', sa.Column('last_task_run_id', sa.Integer))
+    query = '''UPDATE task SET last_task_run_id=last_run.id
+               FROM (SELECT task_id, MAX(id) AS id FROM task_run
+                     GROUP BY task_id) AS last_run
+               WHERE task.id=last_run.task_id;'''
+    op.execute(query)
+
+
+def downgrade():
+    op.drop_column('task', 'last_task_run_id')
+    op.execute('DROP INDEX IF EXISTS task_run_task_id_idx')
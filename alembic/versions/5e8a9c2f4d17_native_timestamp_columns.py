@@ -0,0 +1,137 @@
+"""native timestamp columns
+
+Revision ID: 5e8a9c2f4d17
+Revises: 1b7e5c0d3a62
+Create Date: 2015-02-02 10:14:36.829410
+
+The text timestamps of the big tables become timestamp columns with btree
+indexes, without locking the tables while the rows are converted:
+
+    1. A <column>_ts timestamp column is added next to every text column,
+       and a trigger keeps it in sync with the rows written meanwhile.
+    2. The existing rows are converted in batches of ids, every batch in its
+       own short transaction.
+    3. The indexes are built concurrently on the new columns.
+    4. In the migration transaction, the text columns are dropped and the
+       new ones renamed, which only takes the table locks for an instant.
+
+Steps 1-3 run in a separate autocommit connection, and can be run again if
+the migration is interrupted. The offline (--sql) mode converts the columns
+in place instead.
+
+"""
+
+# revision identifiers, used by Alembic.
+revision = '5e8a9c2f4d17'
+down_revision = '1b7e5c0d3a62'
+
+from alembic import op, context
+import sqlalchemy as sa
+
+
+COLUMNS = [('task_run', ['created', 'finish_time']),
+           ('task', ['created', 'completed_at']),
+           ('app', ['created', 'updated']),
+           ('user', ['created'])]
+
+INDEXES = [('task_run_finish_time_idx', 'task_run', ['finish_time']),
+           ('task_run_app_id_finish_time_idx', 'task_run',
+            ['app_id', 'finish_time']),
+           ('task_app_id_completed_at_idx', 'task', ['app_id', 'completed_at']),
+           ('app_updated_idx', 'app', ['updated']),
+           ('user_created_idx', 'user', ['created'])]
+
+BATCH_SIZE = 10000
+
+ISO_FORMAT = 'YYYY-MM-DD"T"HH24:MI:SS.US'
+
+
+def _timestamp(column):
+    return "CAST(NULLIF(%s, '') AS TIMESTAMP)" % column
+
+
+def _index_columns(table, columns, suffix=''):
+    timestamps = dict(COLUMNS)[table]
+    return ', '.join(column + suffix if column in timestamps else column
+                     for column in columns)
+
+
+def _add_synced_columns(conn, table, columns):
+    existing = [column['name'] for column in
+                sa.inspect(conn).get_columns(table)]
+    for column in columns:
+        if column + '_ts' not in existing:
+            conn.execute('ALTER TABLE "%s" ADD COLUMN %s_ts TIMESTAMP' %
+                         (table, column))
+    sync = ' '.join('NEW.%s_ts := %s;' % (column, _timestamp('NEW.' + column))
+                    for column in columns)
+    conn.execute('''CREATE OR REPLACE FUNCTION %s_timestamps_sync()
+                    RETURNS trigger AS $$
+                    BEGIN %s RETURN NEW; END;
+                    $$ LANGUAGE plpgsql''' % (table, sync))
+    conn.execute('DROP TRIGGER IF EXISTS %s_timestamps_sync ON "%s"' %
+                 (table, table))
+    conn.execute('''CREATE TRIGGER %s_timestamps_sync
+                    BEFORE INSERT OR UPDATE ON "%s" FOR EACH ROW
+                    EXECUTE PROCEDURE %s_timestamps_sync()''' %
+                 (table, table, table))
+
+
+def _backfill(conn, table, columns):
+    # The rows inserted after the trigger was created are already in sync
+    max_id = conn.execute('SELECT COALESCE(MAX(id), 0) FROM "%s"' %
+                          table).scalar()
+    query = sa.text('UPDATE "%s" SET %s WHERE id > :from_id AND id <= :to_id'
+                    % (table, ', '.join('%s_ts=%s' % (column, _timestamp(column))
+                                        for column in columns)))
+    for from_id in range(0, max_id, BATCH_SIZE):
+        conn.execute(query, from_id=from_id, to_id=from_id + BATCH_SIZE)
+
+
+def _convert_in_place():
+    for table, columns in COLUMNS:
+        for column in columns:
+            op.execute('ALTER TABLE "%s" ALTER COLUMN %s TYPE TIMESTAMP '
+                       'USING %s' % (table, column, _timestamp(column)))
+    for name, table, columns in INDEXES:
+        if name != 'task_app_id_completed_at_idx':
+            op.create_index(name, table, columns)
+
+
+def upgrade():
+    if context.is_offline_mode():
+        return _convert_in_place()
+    conn = op.get_bind().engine.connect().execution_options(
+        isolation_level='AUTOCOMMIT')
+    try:
+        for table, columns in COLUMNS:
+            _add_synced_columns(conn, table, columns)
+            _backfill(conn, table, columns)
+        for name, table, columns in INDEXES:
+            conn.execute('DROP INDEX CONCURRENTLY IF EXISTS %s_new' % name)
+            conn.execute('CREATE INDEX CONCURRENTLY %s_new ON "%s" (%s)' %
+                         (name, table, _index_columns(table, columns, '_ts')))
+    finally:
+        conn.close()
+    op.execute('LOCK TABLE %s IN ACCESS EXCLUSIVE MODE' %
+               ', '.join('"%s"' % table for table, columns in COLUMNS))
+    for table, columns in COLUMNS:
+        op.execute('DROP TRIGGER %s_timestamps_sync ON "%s"' % (table, table))
+        op.execute('DROP FUNCTION %s_timestamps_sync()' % table)
+        for column in columns:
+            # Drops the indexes on the text column too
+            op.drop_column(table, column)
+            op.alter_column(table, column + '_ts', new_column_name=column)
+    for name, table, columns in INDEXES:
+        op.execute('ALTER INDEX %s_new RENAME TO %s' % (name, name))
+
+
+def downgrade():
+    for name, table, columns in INDEXES:
+        if name != 'task_app_id_completed_at_idx':
+            op.drop_index(name, table)
+    for table, columns in COLUMNS:
+        for column in columns:
+            op.execute('''ALTER TABLE "%s" ALTER COLUMN %s TYPE TEXT
+                          USING to_char(%s, '%s')''' %
+                       (table, column, column, ISO_FORMAT))
@@ -476,6 +476,66 @@ def resize_project_avatars():
 
 
 
+def rebuild_answered_sets():
+    """Rebuild the Redis sets of tasks answered by every user."""
+    from pybossa import answered_tasks
+    with app.app_context():
+        app_ids = [row.id for row in db.session.query(App.id).all()]
+        print "Rebuilding answered sets for %s projects" % len(app_ids)
+        for app_id in app_ids:
+            n_sets = answered_tasks.rebuild_project(app_id)
+            print "Project %s: %s sets rebuilt" % (app_id, n_sets)
+
+
+def rebuild_volunteers():
+    """Recount exactly the volunteers of every project and of the site."""
+    from pybossa import volunteers
+    with app.app_context():
+        app_ids = [row.id for row in db.session.query(App.id).all()]
+        print "Recounting the volunteers of %s projects" % len(app_ids)
+        for app_id in app_ids:
+            n_auth, n_anon = volunteers.rebuild(app_id)
+            print "Project %s: %s registered and %s anonymous volunteers" % (
+                app_id, n_auth, n_anon)
+        n_auth, n_anon = volunteers.rebuild()
+        print "Site: %s registered and %s anonymous volunteers" % (n_auth,
+                                                                   n_anon)
+
+
+def rebuild_stats_rollup():
+    """Compute the project stats rollups again from all the task runs."""
+    from pybossa import stats_rollup
+    with app.app_context():
+        stats_rollup.rebuild()
+        # The first update only sets the mark to the last task run
+        stats_rollup.update()
+        last_id = stats_rollup.update()
+        print "Task runs up to %s rolled up" % last_id
+
+
+def snapshot_cache():
+    """Snapshot the hottest cache entries to CACHE_SNAPSHOT_PATH."""
+    from pybossa.cache import snapshot
+    with app.app_context():
+        path = app.config.get('CACHE_SNAPSHOT_PATH')
+        n_entries = snapshot.take(path,
+                                  app.config.get('CACHE_SNAPSHOT_MAX_ENTRIES'))
+        print "%s cache entries written to %s" % (n_entries, path)
+
+
+def restore_cache(force=False):
+    """Restore the cache snapshot in CACHE_SNAPSHOT_PATH into Redis (only if
+    Redis lost the cache, unless --force is given)."""
+    from pybossa.cache import snapshot
+    with app.app_context():
+        path = app.config.get('CACHE_SNAPSHOT_PATH')
+        if not force and not snapshot.is_cold():
+            print ("Redis did not lose the cache, use --force to restore %s" %
+                   path)
+            return
+        n_entries = snapshot.restore(path, force=force)
+        print "%s cache entries restored from %s" % (n_entries, path)
+
 
 ## ==================================================
 ## Misc stuff for setting up a command line interface
@@ -505,6 +565,8 @@ Actions:
     # Optional: for a config file
     # parser.add_option('-c', '--config', dest='config',
     #         help='Config file to use.')
+    parser.add_option('--force', dest='force', action='store_true',
+                      help='Overwrite live data (restore_cache).')
     options, args = parser.parse_args()
 
     if not args or not args[0] in _methods:
@@ -512,10 +574,11 @@ Actions:
         sys.exit(1)
 
     method = args[0]
+    kwargs = dict(force=True) if options.force else {}
     if isobject:
-        getattr(functions_or_object(), method)(*args[1:])
+        getattr(functions_or_object(), method)(*args[1:], **kwargs)
     else:
-        _methods[method](*args[1:])
+        _methods[method](*args[1:], **kwargs)
 
 __all__ = [ '_main' ]
 
@@ -0,0 +1,214 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2014 SF Isle of Man Limited
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Answered tasks module for knowing which tasks a user has already done.
+
+For every (project, user) pair it keeps a Redis set with the ids of the tasks
+the user (authenticated or anonymous) has submitted a TaskRun for, so the
+schedulers do not need to run an anti-join against the task_run table.
+
+Sets are built lazily from the DB the first time they are read, and then kept
+up to date by the TaskRun model events. A set is built once it holds the
+built marker: the answers submitted while it is being built are added to it
+anyway, and the ones read from the DB are merged with them. The schedulers only check the ids of
+the candidate tasks they read against the set, and the open tasks answered
+by a user are counted in Redis against the task pool, so neither loads the
+whole set of a user: their cost does not grow with the tasks it answered.
+
+The members are encoded like in the task pool, so both can be intersected.
+If Redis is not available, the candidate tasks are checked against the
+task_run table instead.
+
+This module exports:
+    * get_answered: to get the ids of the tasks answered by a user
+    * filter_unanswered: to keep the task ids a user has not answered
+    * count_open_answered: to count the open tasks answered by a user
+    * add_answer: to add a task to the set of an user
+    * remove_answer: to remove a task from the set of an user
+    * rebuild_project: to rebuild the sets of all the users of a project
+
+"""
+from sqlalchemy.sql import text
+from redis.exceptions import ConnectionError
+from pybossa.core import db, sentinel
+from pybossa import task_pool
+
+
+ANSWERED_TIMEOUT = 7 * 24 * 60 * 60
+# Member stored in every built set, so an empty set still exists in Redis
+# and a set being built is told apart
+BUILT_MARKER = 'built'
+
+
+def _answered_key(app_id, user_id=None, user_ip=None):
+    if user_id and not user_ip:
+        return 'pybossa:answered_tasks:app:%s:user:%s' % (app_id, user_id)
+    return 'pybossa:answered_tasks:app:%s:ip:%s' % (app_id,
+                                                   user_ip or '127.0.0.1')
+
+
+def _member(task_id):
+    # Like the members of the task pool, so both sets can be intersected
+    return '%012d' % task_id
+
+
+def _write_set(key, task_ids, pipe, replace=False):
+    """Add the task ids and the built marker to a set, or write it anew if
+    replace is True."""
+    members = [_member(task_id) for task_id in task_ids]
+    if not replace:
+        # Keeps the answers added since the task ids were read from the DB
+        pipe.sadd(key, BUILT_MARKER, *members)
+        pipe.expire(key, ANSWERED_TIMEOUT)
+        return
+    tmp_key = '%s:building' % key
+    pipe.delete(tmp_key)
+    pipe.sadd(tmp_key, BUILT_MARKER, *members)
+    pipe.expire(tmp_key, ANSWERED_TIMEOUT)
+    pipe.rename(tmp_key, key)
+
+
+def build_answered(app_id, user_id=None, user_ip=None, redis_conn=None):
+    """Build the set of tasks answered by a user from the DB."""
+    redis_conn = redis_conn or sentinel.master
+    if user_id and not user_ip:
+        sql = text('''SELECT task_id FROM task_run WHERE app_id=:app_id
+                   AND user_id=:user_id;''')
+        params = dict(app_id=app_id, user_id=user_id)
+    else:
+        sql = text('''SELECT task_id FROM task_run WHERE app_id=:app_id
+                   AND user_ip=:user_ip;''')
+        params = dict(app_id=app_id, user_ip=user_ip or '127.0.0.1')
+    results = db.slave_session.execute(sql, params)
+    task_ids = set(row.task_id for row in results)
+    pipe = redis_conn.pipeline()
+    _write_set(_answered_key(app_id, user_id, user_ip), task_ids, pipe)
+    pipe.execute()
+    return task_ids
+
+
+def get_answered(app_id, user_id=None, user_ip=None, redis_conn=None):
+    """Return the set of task ids answered by a user in a project."""
+    redis_conn = redis_conn or sentinel.master
+    members = redis_conn.smembers(_answered_key(app_id, user_id, user_ip))
+    if BUILT_MARKER not in members:
+        return build_answered(app_id, user_id, user_ip, redis_conn)
+    return set(int(m) for m in members if m != BUILT_MARKER)
+
+
+def filter_unanswered(app_id, task_ids, user_id=None, user_ip=None,
+                      redis_conn=None):
+    """Return the task_ids the user has not answered, in the same order,
+    checking only those ids against the set."""
+    if not task_ids:
+        return []
+    redis_conn = redis_conn or sentinel.master
+    key = _answered_key(app_id, user_id, user_ip)
+    try:
+        pipe = redis_conn.pipeline(transaction=False)
+        pipe.sismember(key, BUILT_MARKER)
+        for task_id in task_ids:
+            pipe.sismember(key, _member(task_id))
+        values = pipe.execute()
+        if not values[0]:
+            answered = build_answered(app_id, user_id, user_ip, redis_conn)
+            return [task_id for task_id in task_ids
+                    if task_id not in answered]
+    except ConnectionError:
+        return _filter_unanswered_db(app_id, task_ids, user_id, user_ip)
+    return [task_id for task_id, answered in zip(task_ids, values[1:])
+            if not answered]
+
+
+def _filter_unanswered_db(app_id, task_ids, user_id=None, user_ip=None):
+    """Like filter_unanswered, with an anti-join against the task_run table"""
+    if user_id and not user_ip:
+        sql = text('''SELECT id FROM task WHERE id = ANY(:task_ids)
+                   AND NOT EXISTS (SELECT task_id FROM task_run
+                   WHERE app_id=:app_id AND user_id=:user_id
+                   AND task_id=task.id);''')
+        params = dict(app_id=app_id, user_id=user_id)
+    else:
+        sql = text('''SELECT id FROM task WHERE id = ANY(:task_ids)
+                   AND NOT EXISTS (SELECT task_id FROM task_run
+                   WHERE app_id=:app_id AND user_ip=:user_ip
+                   AND task_id=task.id);''')
+        params = dict(app_id=app_id, user_ip=user_ip or '127.0.0.1')
+    params['task_ids'] = list(task_ids)
+    unanswered = set(row.id for row in db.slave_session.execute(sql, params))
+    return [task_id for task_id in task_ids if task_id in unanswered]
+
+
+def count_open_answered(app_id, user_id=None, user_ip=None, redis_conn=None):
+    """Return the number of tasks in the pool of a project (the open ones)
+    answered by the user, intersecting both sets in Redis."""
+    redis_conn = redis_conn or sentinel.master
+    key = _answered_key(app_id, user_id, user_ip)
+    if not redis_conn.sismember(key, BUILT_MARKER):
+        build_answered(app_id, user_id, user_ip, redis_conn)
+    pool_key = task_pool.get_key(app_id, redis_conn)
+    tmp_key = '%s:open' % key
+    pipe = redis_conn.pipeline()
+    pipe.zinterstore(tmp_key, [pool_key, key])
+    pipe.delete(tmp_key)
+    n_tasks = pipe.execute()[0]
+    # Both sets hold the built marker
+    return max(n_tasks - 1, 0)
+
+
+def add_answer(app_id, task_id, user_id=None, user_ip=None, redis_conn=None):
+    """Add a task to the set of a user. If the set has not been built, it
+    is kept for the build to merge it."""
+    if not user_id and not user_ip:
+        return
+    redis_conn = redis_conn or sentinel.master
+    key = _answered_key(app_id, user_id, user_ip)
+    pipe = redis_conn.pipeline()
+    pipe.sadd(key, _member(task_id))
+    pipe.expire(key, ANSWERED_TIMEOUT)
+    pipe.execute()
+
+
+def remove_answer(app_id, task_id, user_id=None, user_ip=None,
+                  redis_conn=None):
+    """Remove a task from the set of a user."""
+    if not user_id and not user_ip:
+        return
+    redis_conn = redis_conn or sentinel.master
+    redis_conn.srem(_answered_key(app_id, user_id, user_ip), _member(task_id))
+
+
+def rebuild_project(app_id, redis_conn=None):
+    """Rebuild from the DB the sets of all the users of a project.
+
+    Returns the number of sets written."""
+    redis_conn = redis_conn or sentinel.master
+    sql = text('''SELECT task_id, user_id, user_ip FROM task_run
+               WHERE app_id=:app_id;''').execution_options(stream=True)
+    results = db.slave_session.execute(sql, dict(app_id=app_id))
+    answered = {}
+    for row in results:
+        if not row.user_id and not row.user_ip:
+            continue
+        key = _answered_key(app_id, row.user_id, row.user_ip)
+        answered.setdefault(key, set()).add(row.task_id)
+    pipe = redis_conn.pipeline()
+    for key, task_ids in answered.iteritems():
+        _write_set(key, task_ids, pipe, replace=True)
+    pipe.execute()
+    return len(answered)
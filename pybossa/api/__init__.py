@@ -30,15 +30,18 @@ This package adds GET, POST, PUT and DELETE methods for:
 """
 
 import json
-from flask import Blueprint, request, abort, Response, make_response
+from flask import Blueprint, request, abort, Response, make_response, \
+    current_app
 from flask.ext.login import current_user
 from werkzeug.exceptions import NotFound
+from redis.exceptions import ConnectionError
 from pybossa.util import jsonpify, crossdomain, get_user_id_or_ip
 import pybossa.model as model
 from pybossa.core import csrf, ratelimits, sentinel
 from pybossa.ratelimit import ratelimit
 from pybossa.cache.apps import n_tasks
 import pybossa.sched as sched
+from pybossa import task_router
 from pybossa.error import ErrorStatus
 from global_stats import GlobalStatsAPI
 from task import TaskAPI
@@ -56,6 +59,9 @@ cors_headers = ['Content-Type', 'Authorization']
 
 error = ErrorStatus()
 
+# Maximum number of tasks returned by a single newtasks request
+MAX_NEW_TASKS = 20
+
 
 @blueprint.route('/')
 @crossdomain(origin='*', headers=cors_headers)
@@ -114,15 +120,51 @@ def new_task(app_id):
     except Exception as e:
         return error.format_exception(e, target='app', action='GET')
 
+
+@jsonpify
+@blueprint.route('/app/<app_id>/newtasks')
+@crossdomain(origin='*', headers=cors_headers)
+@ratelimit(limit=ratelimits.get('LIMIT'), per=ratelimits.get('PER'))
+def new_tasks(app_id):
+    """Return a list of up to n new tasks for a project.
+
+    The number of tasks is given by the n argument (1 by default), and capped
+    to MAX_NEW_TASKS.
+
+    """
+    try:
+        tasks = _retrieve_new_tasks(app_id)
+        if tasks and tasks[0].id is not None:
+            _mark_tasks_as_requested_by_user(tasks, sentinel.master)
+        response = make_response(json.dumps([t.dictize() for t in tasks]))
+        response.mimetype = "application/json"
+        return response
+    except Exception as e:
+        return error.format_exception(e, target='app', action='GET')
+
+
+@jsonpify
+@blueprint.route('/newtask')
+@crossdomain(origin='*', headers=cors_headers)
+@ratelimit(limit=ratelimits.get('LIMIT'), per=ratelimits.get('PER'))
+def new_task_anywhere():
+    """Return a new task from any of the projects that need more answers."""
+    try:
+        task = _route_new_task()
+        if task is not None:
+            _mark_task_as_requested_by_user(task, sentinel.master)
+            response = make_response(json.dumps(task.dictize()))
+            response.mimetype = "application/json"
+            return response
+        return Response(json.dumps({}), mimetype="application/json")
+    except Exception as e:
+        return error.format_exception(e, target='app', action='GET')
+
+
 def _retrieve_new_task(app_id):
-    app = project_repo.get(app_id)
-    if app is None:
-        raise NotFound
+    app = _get_app_for_new_task(app_id)
     if not app.allow_anonymous_contributors and current_user.is_anonymous():
-        info = dict(
-            error="This project does not allow anonymous contributors")
-        error = model.task.Task(info=info)
-        return error
+        return _anonymous_not_allowed_task()
     if request.args.get('offset'):
         offset = int(request.args.get('offset'))
     else:
@@ -132,11 +174,60 @@ def _retrieve_new_task(app_id):
     task = sched.new_task(app_id, app.info.get('sched'), user_id, user_ip, offset)
     return task
 
+
+def _retrieve_new_tasks(app_id):
+    app = _get_app_for_new_task(app_id)
+    if not app.allow_anonymous_contributors and current_user.is_anonymous():
+        return [_anonymous_not_allowed_task()]
+    n = min(max(request.args.get('n', 1, type=int), 1), MAX_NEW_TASKS)
+    user_id = None if current_user.is_anonymous() else current_user.id
+    user_ip = request.remote_addr if current_user.is_anonymous() else None
+    return sched.new_tasks(app_id, app.info.get('sched'), user_id, user_ip, n)
+
+
+def _route_new_task():
+    anonymous = current_user.is_anonymous()
+    user_id = None if anonymous else current_user.id
+    user_ip = request.remote_addr if anonymous else None
+    for app_id in task_router.pick_projects(anonymous=anonymous):
+        app = project_repo.get(app_id)
+        if (app is None or app.hidden or app.needs_password() or
+                (anonymous and not app.allow_anonymous_contributors)):
+            continue
+        task = sched.new_task(app.id, app.info.get('sched'), user_id, user_ip)
+        if task is not None:
+            return task
+    return None
+
+
+def _get_app_for_new_task(app_id):
+    app = project_repo.get(app_id)
+    if app is None:
+        raise NotFound
+    return app
+
+
+def _anonymous_not_allowed_task():
+    info = dict(error="This project does not allow anonymous contributors")
+    return model.task.Task(info=info)
+
+
 def _mark_task_as_requested_by_user(task, redis_conn):
+    _mark_tasks_as_requested_by_user([task], redis_conn)
+
+
+def _mark_tasks_as_requested_by_user(tasks, redis_conn):
     usr = get_user_id_or_ip()['user_id'] or get_user_id_or_ip()['user_ip']
-    key = 'pybossa:task_requested:user:%s:task:%s' % (usr, task.id)
     timeout = 60 * 60
-    redis_conn.setex(key, timeout, True)
+    pipe = redis_conn.pipeline()
+    for task in tasks:
+        key = 'pybossa:task_requested:user:%s:task:%s' % (usr, task.id)
+        pipe.setex(key, timeout, True)
+    try:
+        pipe.execute()
+    except ConnectionError as e:
+        # Not worth failing the request: the task is given anyway
+        current_app.logger.warning(e)
 
 
 @jsonpify
@@ -65,6 +65,10 @@ class APIBase(MethodView):
 
     hateoas = Hateoas()
 
+    # Attributes kept up to date by PyBossa, which are ignored when they are
+    # sent in a POST or PUT request
+    reserved_keys = ()
+
     def valid_args(self):
         """Check if the domain object args are valid."""
         for k in request.args.keys():
@@ -186,6 +190,7 @@ class APIBase(MethodView):
             save_func = repos[self.__class__.__name__]['save']
             getattr(repo, save_func)(inst)
             self._log_changes(None, inst)
+            self._after_save(inst)
             return json.dumps(inst.dictize())
         except Exception as e:
             return error.format_exception(
@@ -195,6 +200,7 @@ class APIBase(MethodView):
 
     def _create_instance_from_request(self, data):
         data = self.hateoas.remove_links(data)
+        data = self._remove_reserved_keys(data)
         inst = self.__class__(**data)
         self._update_object(inst)
         getattr(require, self.__class__.__name__.lower()).create(inst)
@@ -274,6 +280,7 @@ class APIBase(MethodView):
         data = json.loads(request.data)
         # Remove hateoas links
         data = self.hateoas.remove_links(data)
+        data = self._remove_reserved_keys(data)
         # may be missing the id as we allow partial updates
         data['id'] = oid
         self.__class__(**data)
@@ -287,6 +294,11 @@ class APIBase(MethodView):
         return existing
 
 
+    def _remove_reserved_keys(self, data):
+        for key in self.reserved_keys:
+            data.pop(key, None)
+        return data
+
     def _update_object(self, data_dict):
         """Update object.
 
@@ -328,3 +340,8 @@ class APIBase(MethodView):
     def _log_changes(self, old_obj, new_obj):
         """Method to be overriden by inheriting classes for logging purposes"""
         pass
+
+    def _after_save(self, instance):
+        """Method to be overriden by inheriting classes which need to act once
+        a new domain object (POST) has been stored"""
+        pass
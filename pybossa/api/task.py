@@ -31,3 +31,5 @@ class TaskAPI(APIBase):
     """Class for domain object Task."""
 
     __class__ = Task
+
+    reserved_keys = ('n_task_runs', 'last_task_run_id', 'completed_at')
@@ -30,6 +30,7 @@ from werkzeug.exceptions import Forbidden
 from api_base import APIBase
 from pybossa.util import get_user_id_or_ip
 from pybossa.core import task_repo, sentinel
+from pybossa import task_leases
 
 
 class TaskRunAPI(APIBase):
@@ -55,6 +56,12 @@ class TaskRunAPI(APIBase):
         else:
             taskrun.user_id = current_user.id
 
+    def _after_save(self, taskrun):
+        """Release the lease the user held on the task."""
+        user_id_ip = get_user_id_or_ip()
+        task_leases.release(taskrun.task_id, user_id_ip['user_id'],
+                            user_id_ip['user_ip'])
+
 
 def _check_task_requested_by_user(taskrun, redis_conn):
     user_id_ip = get_user_id_or_ip()
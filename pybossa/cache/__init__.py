@@ -19,17 +19,38 @@
 """
 This module exports a set of decorators for caching functions.
 
+While Redis is not available, cached functions are served from (and computed
+into) a small in process fallback cache.
+
+The values of both decorators can belong to families (tags, e.g. 'app:42'),
+so they can be removed at once with delete_tag. Their tags argument is either
+a list with the families of every value, or a function returning, for the
+arguments of a call, the families of its value.
+
 It exports:
     * cache: for caching functions without parameters
     * memoize: for caching functions using its arguments as part of the key
     * delete_cached: to remove a cached value
     * delete_memoized: to remove a cached value from the memoize decorator
+    * delete_tag: to remove all the cached values of a family (tag)
+    * get_many: to get the values of many calls to memoized functions at once
+    * local_cache: the per worker cache in front of Redis (if enabled)
+    * metrics: the hits, misses and recomputations of the cached functions
+    * key_patterns: the Redis keys (or key patterns) of every cached function
 
 """
 import os
 import hashlib
+import math
+import random
+import time
+import uuid
 from functools import wraps
+from redis.exceptions import ConnectionError
 from pybossa.core import sentinel
+from pybossa.cache.local import LocalCache, FAMILY_PREFIX
+from pybossa.cache.metrics import CacheMetrics
+from pybossa.cache.serializers import Serializer
 
 try:
     import cPickle as pickle
@@ -47,6 +68,44 @@ ONE_HOUR = 60 * 60
 HALF_HOUR = 30 * 60
 FIVE_MINUTES = 5 * 60
 
+INVALIDATION_CHANNEL = 'pybossa:cache:invalidate'
+
+# Marks the cached entries with the format
+# [version, output, delta, expiration, generations]
+ENTRY_VERSION = 'pybossa:cache:3'
+# Seconds a worker may spend recomputing a value while the rest wait for it
+LOCK_TIMEOUT = 30
+LOCK_WAIT = 0.05
+# The bigger, the earlier values are recomputed before they expire
+EARLY_REFRESH_BETA = 1.0
+
+_UNLOCK_SCRIPT = """
+if redis.call('GET', KEYS[1]) == ARGV[1] then
+    return redis.call('DEL', KEYS[1])
+end
+return 0
+"""
+
+serializer = Serializer(
+    getattr(settings, 'CACHE_SERIALIZER', 'pickle'),
+    compress_min_bytes=getattr(settings, 'CACHE_COMPRESS_MIN_BYTES', 4096))
+
+local_cache = LocalCache(
+    max_bytes=getattr(settings, 'LOCAL_CACHE_MAX_BYTES', 0),
+    timeout=getattr(settings, 'LOCAL_CACHE_TIMEOUT', 60))
+
+# Used instead of Redis while it is not available
+fallback_cache = LocalCache(
+    max_bytes=getattr(settings, 'CACHE_FALLBACK_MAX_BYTES', 8 * 1024 * 1024),
+    timeout=getattr(settings, 'LOCAL_CACHE_TIMEOUT', 60))
+
+# Cached function name (as in the metrics) -> pattern of its keys
+key_patterns = {}
+
+metrics = CacheMetrics(
+    enabled=getattr(settings, 'CACHE_METRICS', True),
+    flush_interval=getattr(settings, 'CACHE_METRICS_FLUSH_INTERVAL', 10))
+
 
 def get_key_to_hash(*args, **kwargs):
     """Return key to hash for *args and **kwargs."""
@@ -67,72 +126,427 @@ def get_hash_key(prefix, key_to_hash):
     return key
 
 
-def cache(key_prefix, timeout=300):
+def _function_name(f):
+    return '%s.%s' % (f.__module__, f.__name__)
+
+
+def _generation_key(name):
+    return '%s:generation:%s' % (settings.REDIS_KEYPREFIX, name)
+
+
+def _generations(generation_keys):
+    if not generation_keys:
+        return ()
+    return tuple(int(generation or 0)
+                 for generation in sentinel.slave.mget(generation_keys))
+
+
+def _get(key, generation_keys=()):
+    """Return the serialized entry of key, and the current generations of its
+    families. Entries from the local cache come with None generations, as the
+    local caches are already invalidated when a family changes."""
+    if local_cache.enabled:
+        local_cache.listen(sentinel.master, INVALIDATION_CHANNEL)
+        payload = local_cache.get(key)
+        if payload is not None:
+            return payload, None
+    values = sentinel.slave.mget([key] + list(generation_keys))
+    return values[0], tuple(int(generation or 0) for generation in values[1:])
+
+
+def _set(key, output, timeout, generation_keys=()):
+    sentinel.master.setex(key, timeout, output)
+    if local_cache.enabled:
+        local_cache.set(key, output, timeout, families=generation_keys)
+
+
+def _invalidate(message):
+    """Evict a key, a prefix ending in *, or a family, from every local
+    cache."""
+    if local_cache.enabled:
+        local_cache.invalidate(message)
+        sentinel.master.publish(INVALIDATION_CHANNEL, message)
+
+
+def _lock(key):
+    """Try to get the lock for recomputing key, returning its token."""
+    token = uuid.uuid4().hex
+    if sentinel.master.set(key + ':lock', token, nx=True, ex=LOCK_TIMEOUT):
+        return token
+    return None
+
+
+def _unlock(key, token):
+    sentinel.master.eval(_UNLOCK_SCRIPT, 1, key + ':lock', token)
+
+
+def _refresh_early(delta, expiration):
+    """Decide whether a value is recomputed before it expires, more likely as
+    the expiration gets closer and the slower the function is (XFetch)."""
+    return (time.time() - delta * EARLY_REFRESH_BETA *
+            math.log(random.random() or 1e-10)) >= expiration
+
+
+def _compute(key, generation_keys, f, args, kwargs, timeout, stale):
+    # Read before computing, so a family invalidated meanwhile is not missed
+    generations = _generations(generation_keys)
+    start = time.time()
+    output = f(*args, **kwargs)
+    delta = time.time() - start
+    entry = [ENTRY_VERSION, output, delta, time.time() + timeout,
+             list(generations)]
+    payload = serializer.dumps(entry)
+    _set(key, payload, timeout + stale, generation_keys)
+    metrics.computed(_function_name(f), delta, len(payload))
+    return output
+
+
+def _load(payload, generations=None):
+    """Return the (output, delta, expiration) stored in payload, or None if it
+    was stored by an older version or any of its families was invalidated.
+
+    Any output, even None, 0 or an empty list, is a hit."""
+    if not payload:
+        return None
+    try:
+        entry = serializer.loads(payload)
+    except ValueError:
+        return None
+    if not (isinstance(entry, (list, tuple)) and len(entry) == 5 and
+            entry[0] == ENTRY_VERSION):
+        return None
+    if generations is not None and tuple(entry[4]) != generations:
+        return None
+    return tuple(entry[1:4])
+
+
+def _wait_for(key):
+    """Wait for the worker holding the lock of key to store its value."""
+    deadline = time.time() + LOCK_TIMEOUT
+    while time.time() < deadline:
+        time.sleep(LOCK_WAIT)
+        payload = sentinel.master.get(key)
+        if payload:
+            return payload
+        if not sentinel.master.exists(key + ':lock'):
+            break
+    return None
+
+
+def _enqueue_refresh(f, args, kwargs):
+    from rq import Queue
+    queue = Queue('high', connection=sentinel.master)
+    queue.enqueue('pybossa.jobs.refresh_memoized',
+                  f.__module__, f.__name__, args, kwargs)
+
+
+def _cached_call(key, generation_keys, f, args, kwargs, timeout, stale):
+    """Return the cached value of key, computing it if needed so only one
+    worker at a time runs f for the same key."""
+    payload, generations = _get(key, generation_keys)
+    entry = _load(payload, generations)
+    compute = lambda: _compute(key, generation_keys, f, args, kwargs,
+                               timeout, stale)
+    if entry is not None:
+        metrics.hit(_function_name(f), local=generations is None)
+        if generations is not None and local_cache.enabled:
+            local_cache.set(key, payload, families=generation_keys)
+        output, delta, expiration = entry
+        if not _refresh_early(delta, expiration):
+            return output
+        token = _lock(key)
+        if token is None:
+            # Somebody else is already recomputing it
+            return output
+        if stale:
+            # The job recomputing it releases the lock
+            _enqueue_refresh(f, args, kwargs)
+            return output
+        try:
+            return compute()
+        finally:
+            _unlock(key, token)
+    metrics.miss(_function_name(f))
+    token = _lock(key)
+    if token is None:
+        entry = _load(_wait_for(key), generations)
+        if entry is not None:
+            return entry[0]
+    try:
+        return compute()
+    finally:
+        if token:
+            _unlock(key, token)
+
+
+def _fallback_call(key, f, args, kwargs, timeout):
+    """Return the value of key from the fallback cache, computing it there,
+    while Redis is not available."""
+    payload = fallback_cache.get(key)
+    if payload is not None:
+        return serializer.loads(payload)
+    output = f(*args, **kwargs)
+    fallback_cache.set(key, serializer.dumps(output), timeout)
+    return output
+
+
+def _call(key, generation_keys, f, args, kwargs, timeout, stale):
+    try:
+        return _cached_call(key, generation_keys, f, args, kwargs, timeout,
+                            stale)
+    except ConnectionError:
+        return _fallback_call(key, f, args, kwargs, timeout)
+
+
+def _invalidate_locally(message):
+    """Evict a key, or a prefix ending in *, from the caches of this worker
+    when the invalidation can not reach Redis."""
+    local_cache.invalidate(message)
+    fallback_cache.invalidate(message)
+
+
+def _refresh(key, generation_keys, f, args, kwargs, timeout, stale):
+    output = _compute(key, generation_keys, f, args, kwargs, timeout, stale)
+    _invalidate(key)
+    sentinel.master.delete(key + ':lock')
+    return output
+
+
+def _function_generation_key(function):
+    return _generation_key('function:%s' % function.__name__)
+
+
+def _tag_generation_key(tag):
+    return _generation_key('tag:%s' % tag)
+
+
+def _tag_generation_keys(tags, args, kwargs):
+    """Return the generation keys of the families (a list, or a function of
+    the arguments of the call) of a call."""
+    if callable(tags):
+        tags = tags(*args, **kwargs)
+    return [_tag_generation_key(tag) for tag in tags or ()]
+
+
+def cache(key_prefix, timeout=300, stale=0, tags=None):
     """
     Decorator for caching functions.
 
-    Returns the function value from cache, or the function if cache disabled
+    Returns the function value from cache, or the function if cache disabled.
+    See memoize for the stale argument, and the module for tags.
 
     """
     if timeout is None:
         timeout = 300
     def decorator(f):
+        key = "%s::%s" % (settings.REDIS_KEYPREFIX, key_prefix)
+        key_patterns[_function_name(f)] = key
+
         @wraps(f)
         def wrapper(*args, **kwargs):
-            key = "%s::%s" % (settings.REDIS_KEYPREFIX, key_prefix)
             if os.environ.get('PYBOSSA_REDIS_CACHE_DISABLED') is None:
-                output = sentinel.slave.get(key)
-                if output:
-                    return pickle.loads(output)
-                output = f(*args, **kwargs)
-                sentinel.master.setex(key, timeout, pickle.dumps(output))
-                return output
+                return _call(key, _tag_generation_keys(tags, args, kwargs),
+                             f, args, kwargs, timeout, stale)
             output = f(*args, **kwargs)
             sentinel.master.setex(key, timeout, pickle.dumps(output))
             return output
+
+        def refresh(*args, **kwargs):
+            return _refresh(key, _tag_generation_keys(tags, args, kwargs),
+                            f, args, kwargs, timeout, stale)
+        wrapper.refresh = refresh
         return wrapper
     return decorator
 
 
-def memoize(timeout=300):
+def memoize(timeout=300, stale=0, tags=None, batch=None):
     """
     Decorator for caching functions using its arguments as part of the key.
 
-    Returns the cached value, or the function if the cache is disabled
+    Returns the cached value, or the function if the cache is disabled.
+
+    Only one worker at a time computes a missing value, while the rest wait
+    for it, and values are sometimes recomputed shortly before they expire so
+    they do not expire for everybody at once. With stale (in seconds), expired
+    values are kept that long and served while a background job recomputes
+    them (stale-while-revalidate). See the module for the tags argument.
+
+    batch is a function computing the values of many calls at once, e.g. with
+    a single query, used by get_many. It gets the list of the arguments (as
+    tuples) of the calls, and returns the list of their values.
 
     """
     if timeout is None:
         timeout = 300
     def decorator(f):
-        @wraps(f)
-        def wrapper(*args, **kwargs):
+        key_patterns[_function_name(f)] = "%s:%s_args:*" % (
+            settings.REDIS_KEYPREFIX, f.__name__)
+
+        def get_key(*args, **kwargs):
             key = "%s:%s_args:" % (settings.REDIS_KEYPREFIX, f.__name__)
             key_to_hash = get_key_to_hash(*args, **kwargs)
-            key = get_hash_key(key, key_to_hash)
+            return get_hash_key(key, key_to_hash)
+
+        def get_generation_keys(*args, **kwargs):
+            return ([_function_generation_key(f)] +
+                    _tag_generation_keys(tags, args, kwargs))
+
+        @wraps(f)
+        def wrapper(*args, **kwargs):
+            key = get_key(*args, **kwargs)
             if os.environ.get('PYBOSSA_REDIS_CACHE_DISABLED') is None:
-                output = sentinel.slave.get(key)
-                if output:
-                    return pickle.loads(output)
-                output = f(*args, **kwargs)
-                sentinel.master.setex(key, timeout, pickle.dumps(output))
-                return output
+                return _call(key, get_generation_keys(*args, **kwargs),
+                             f, args, kwargs, timeout, stale)
             output = f(*args, **kwargs)
             sentinel.master.setex(key, timeout, pickle.dumps(output))
             return output
+
+        def refresh(*args, **kwargs):
+            return _refresh(get_key(*args, **kwargs),
+                            get_generation_keys(*args, **kwargs),
+                            f, args, kwargs, timeout, stale)
+        wrapper.refresh = refresh
+        wrapper.get_key = get_key
+        wrapper.get_generation_keys = get_generation_keys
+        wrapper.function = f
+        wrapper.batch = batch
+        wrapper.timeout = timeout
+        wrapper.stale = stale
         return wrapper
     return decorator
 
 
+def _compute_many(calls):
+    """Return the (output, delta) of every (memoized function, args) call,
+    running the batch function of each memoized function once."""
+    results = [None] * len(calls)
+    groups = {}
+    for i, (function, args) in enumerate(calls):
+        groups.setdefault(function, []).append(i)
+    for function, indexes in groups.iteritems():
+        start = time.time()
+        if function.batch is not None:
+            outputs = function.batch([calls[i][1] for i in indexes])
+        else:
+            outputs = [function.function(*calls[i][1]) for i in indexes]
+        delta = (time.time() - start) / len(indexes)
+        for i, output in zip(indexes, outputs):
+            results[i] = (output, delta)
+    return results
+
+
+def _get_many(calls):
+    keys = [function.get_key(*args) for function, args in calls]
+    outputs = [None] * len(calls)
+    pending = []
+    if local_cache.enabled:
+        local_cache.listen(sentinel.master, INVALIDATION_CHANNEL)
+    for i, key in enumerate(keys):
+        entry = _load(local_cache.get(key)) if local_cache.enabled else None
+        if entry is not None:
+            outputs[i] = entry[0]
+            metrics.hit(_function_name(calls[i][0].function), local=True)
+        else:
+            pending.append(i)
+    if not pending:
+        return outputs
+    call_generation_keys = dict(
+        (i, calls[i][0].get_generation_keys(*calls[i][1])) for i in pending)
+    generation_keys = sorted(set(generation_key
+                                 for i in pending
+                                 for generation_key in call_generation_keys[i]))
+    values = sentinel.slave.mget([keys[i] for i in pending] + generation_keys)
+    generations = dict(zip(generation_keys,
+                           [int(generation or 0)
+                            for generation in values[len(pending):]]))
+    missing = []
+    for i, payload in zip(pending, values):
+        call_generations = tuple(generations[generation_key]
+                                 for generation_key in call_generation_keys[i])
+        entry = _load(payload, call_generations)
+        name = _function_name(calls[i][0].function)
+        if entry is None:
+            metrics.miss(name)
+            missing.append((i, call_generations))
+            continue
+        metrics.hit(name)
+        outputs[i] = entry[0]
+        if local_cache.enabled:
+            local_cache.set(keys[i], payload,
+                            families=call_generation_keys[i])
+    if not missing:
+        return outputs
+    results = _compute_many([calls[i] for i, call_generations in missing])
+    pipe = sentinel.master.pipeline(transaction=False)
+    for (i, call_generations), (output, delta) in zip(missing, results):
+        function = calls[i][0]
+        entry = [ENTRY_VERSION, output, delta, time.time() + function.timeout,
+                 list(call_generations)]
+        payload = serializer.dumps(entry)
+        metrics.computed(_function_name(function.function), delta,
+                         len(payload))
+        pipe.setex(keys[i], function.timeout + function.stale, payload)
+        if local_cache.enabled:
+            local_cache.set(keys[i], payload, function.timeout,
+                            families=call_generation_keys[i])
+        outputs[i] = output
+    pipe.execute()
+    return outputs
+
+
+def _fallback_many(calls):
+    """Return the values of many calls from the fallback cache, computing the
+    missing ones there, while Redis is not available."""
+    keys = [function.get_key(*args) for function, args in calls]
+    payloads = [fallback_cache.get(key) for key in keys]
+    missing = [i for i, payload in enumerate(payloads) if payload is None]
+    results = _compute_many([calls[i] for i in missing])
+    outputs = [serializer.loads(payload) if payload is not None else None
+               for payload in payloads]
+    for i, (output, delta) in zip(missing, results):
+        fallback_cache.set(keys[i], serializer.dumps(output),
+                           calls[i][0].timeout)
+        outputs[i] = output
+    return outputs
+
+
+def get_many(calls):
+    """
+    Return the values of many calls to memoized functions, given as a list of
+    (memoized function, args tuple) pairs.
+
+    The cached values and the generations of their families are read with a
+    single MGET. The missing ones are computed together, with the batch
+    function of their memoized function if it has one, and stored with a
+    single pipeline. Unlike a memoized call, missing values are not locked
+    while they are computed.
+
+    """
+    if os.environ.get('PYBOSSA_REDIS_CACHE_DISABLED') is not None:
+        return [output for output, delta in _compute_many(calls)]
+    try:
+        return _get_many(calls)
+    except ConnectionError:
+        return _fallback_many(calls)
+
+
 def delete_cached(key):
     """
     Delete a cached value from the cache.
 
-    Returns True if success or no cache is enabled
+    Returns True if success or no cache is enabled, and False if Redis is not
+    available (the value is only removed from this worker then)
 
     """
     if os.environ.get('PYBOSSA_REDIS_CACHE_DISABLED') is None:
         key = "%s::%s" % (settings.REDIS_KEYPREFIX, key)
-        return bool(sentinel.master.delete(key))
+        try:
+            deleted = sentinel.master.delete(key)
+            _invalidate(key)
+        except ConnectionError:
+            _invalidate_locally(key)
+            return False
+        return bool(deleted)
     return True
 
 
@@ -140,7 +554,12 @@ def delete_memoized(function, *args, **kwargs):
     """
     Delete a memoized value from the cache.
 
-    Returns True if success or no cache is enabled
+    Without arguments, all the values of the function are deleted at once by
+    increasing its generation, so the stored ones are not valid anymore (and
+    expire by themselves).
+
+    Returns True if success or no cache is enabled, and False if Redis is not
+    available (the values are only removed from this worker then)
 
     """
     if os.environ.get('PYBOSSA_REDIS_CACHE_DISABLED') is None:
@@ -148,9 +567,36 @@ def delete_memoized(function, *args, **kwargs):
         if args or kwargs:
             key_to_hash = get_key_to_hash(*args, **kwargs)
             key = get_hash_key(key, key_to_hash)
-            return bool(sentinel.master.delete(key))
-        keys_to_delete = sentinel.slave.keys(pattern=key + '*')
-        if not keys_to_delete:
+        else:
+            key += '*'
+        try:
+            if args or kwargs:
+                deleted = sentinel.master.delete(key)
+                _invalidate(key)
+                return bool(deleted)
+            sentinel.master.incr(_function_generation_key(function))
+            _invalidate(key)
+        except ConnectionError:
+            _invalidate_locally(key)
+            return False
+    return True
+
+
+def delete_tag(tag):
+    """
+    Delete all the cached values of a family (tag), by increasing its
+    generation.
+
+    Returns True, or False if Redis is not available (the values are only
+    removed from this worker then)
+
+    """
+    if os.environ.get('PYBOSSA_REDIS_CACHE_DISABLED') is None:
+        try:
+            generation_key = _tag_generation_key(tag)
+            sentinel.master.incr(generation_key)
+            _invalidate(FAMILY_PREFIX + generation_key)
+        except ConnectionError:
+            _invalidate_locally('*')
             return False
-        return bool(sentinel.master.delete(*keys_to_delete))
     return True
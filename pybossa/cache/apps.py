@@ -18,15 +18,79 @@
 
 from sqlalchemy.sql import text
 from pybossa.core import db, timeouts
+from pybossa import volunteers
+from pybossa.model import isoformat
 from pybossa.model.app import App
 from pybossa.util import pretty_date
-from pybossa.cache import memoize, cache, delete_memoized, delete_cached
+from pybossa.cache import memoize, cache, delete_memoized, delete_cached, \
+    delete_tag, get_many
+from pybossa.statements import Statement
 
 import json
 
 
 session = db.slave_session
 
+# Cache families, so they can be removed at once with delete_tag
+LISTINGS_TAG = 'apps_listings'
+
+
+def _app_tags(app_id, *args, **kwargs):
+    return ['app:%s' % app_id]
+
+
+def _listings_tags(*args, **kwargs):
+    return [LISTINGS_TAG]
+
+
+_browse_tasks_sql = Statement('apps_browse_tasks', '''
+    SELECT task.id, task.n_task_runs, task.n_answers FROM task
+    WHERE task.app_id=:app_id ORDER BY task.id''')
+
+_n_tasks_sql = Statement('apps_n_tasks', '''
+    SELECT COUNT(task.id) AS n_tasks FROM task WHERE task.app_id=:app_id''')
+
+_n_completed_tasks_sql = Statement('apps_n_completed_tasks', '''
+    SELECT COUNT(task.id) AS n_completed_tasks FROM task
+    WHERE task.app_id=:app_id AND task.state='completed'
+    ''')
+
+_n_task_runs_sql = Statement('apps_n_task_runs', '''
+    SELECT COUNT(task_run.id) AS n_task_runs FROM task_run
+    WHERE task_run.app_id=:app_id''')
+
+_last_activity_sql = Statement('apps_last_activity', '''
+    SELECT finish_time FROM task_run WHERE app_id=:app_id
+    ORDER BY finish_time DESC LIMIT 1''')
+
+# The same queries for many projects at once, for the listings
+_n_tasks_by_app_sql = Statement('apps_n_tasks_by_app', '''
+    SELECT task.app_id, COUNT(task.id) FROM task
+    WHERE task.app_id = ANY(:app_ids) GROUP BY task.app_id''')
+
+_n_completed_tasks_by_app_sql = Statement('apps_n_completed_tasks_by_app', '''
+    SELECT task.app_id, COUNT(task.id) FROM task
+    WHERE task.app_id = ANY(:app_ids) AND task.state='completed'
+    GROUP BY task.app_id''')
+
+_last_activity_by_app_sql = Statement('apps_last_activity_by_app', '''
+    SELECT app_id, MAX(finish_time) FROM task_run
+    WHERE app_id = ANY(:app_ids) GROUP BY app_id''')
+
+
+def _by_app(statement, default=0, convert=None):
+    """Return a batch function (see memoize) for a function of app_id, which
+    runs a statement grouped by app_id once for all the projects (passing
+    the values through convert, if given)."""
+    def batch(calls):
+        app_ids = [args[0] for args in calls]
+        results = statement.execute(session, dict(app_ids=app_ids))
+        values = dict((row[0], convert(row[1]) if convert else row[1])
+                      for row in results)
+        return [values.get(app_id, default) for app_id in app_ids]
+    return batch
+
+
 @memoize(timeout=timeouts.get('APP_TIMEOUT'))
 def get_app(short_name):
     app = session.query(App).filter_by(short_name=short_name).first()
@@ -34,7 +98,7 @@ def get_app(short_name):
 
 
 @cache(timeout=timeouts.get('STATS_FRONTPAGE_TIMEOUT'),
-       key_prefix="front_page_top_apps")
+       key_prefix="front_page_top_apps", tags=[LISTINGS_TAG])
 def get_top(n=4):
     """Return top n=4 apps"""
     sql = text('''SELECT app.id, app.name, app.short_name, app.description, app.info,
@@ -46,20 +110,20 @@ def get_top(n=4):
     for row in results:
         app = dict(id=row.id, name=row.name, short_name=row.short_name,
                    description=row.description,
-                   info=json.loads(row.info),
-                   n_volunteers=n_volunteers(row.id),
-                   n_completed_tasks=n_completed_tasks(row.id))
+                   info=json.loads(row.info))
         top_apps.append(app)
+    calls = [(function, (app['id'],)) for app in top_apps
+             for function in (n_volunteers, n_completed_tasks)]
+    values = iter(get_many(calls))
+    for app in top_apps:
+        app['n_volunteers'] = next(values)
+        app['n_completed_tasks'] = next(values)
     return top_apps
 
 
-@memoize(timeout=timeouts.get('BROWSE_TASKS_TIMEOUT'))
+@memoize(timeout=timeouts.get('BROWSE_TASKS_TIMEOUT'), tags=_app_tags)
 def browse_tasks(project_id):
-    sql = text('''
-               SELECT task.id, count(task_run.id) as n_task_runs, task.n_answers
-               FROM task LEFT OUTER JOIN task_run ON (task.id=task_run.task_id)
-               WHERE task.app_id=:app_id GROUP BY task.id ORDER BY task.id''')
-    results = session.execute(sql, dict(app_id=project_id))
+    results = _browse_tasks_sql.execute(session, dict(app_id=project_id))
     tasks = []
     for row in results:
         task = dict(id=row.id, n_task_runs=row.n_task_runs,
@@ -79,75 +143,79 @@ def _pct_status(n_task_runs, n_answers):
     return float(0)
 
 
-@memoize(timeout=timeouts.get('APP_TIMEOUT'))
+@memoize(timeout=timeouts.get('APP_TIMEOUT'), tags=_app_tags,
+         batch=_by_app(_n_tasks_by_app_sql))
 def n_tasks(app_id):
-    sql = text('''SELECT COUNT(task.id) AS n_tasks FROM task
-                  WHERE task.app_id=:app_id''')
-    results = session.execute(sql, dict(app_id=app_id))
+    results = _n_tasks_sql.execute(session, dict(app_id=app_id))
     n_tasks = 0
     for row in results:
         n_tasks = row.n_tasks
     return n_tasks
 
 
-@memoize(timeout=timeouts.get('APP_TIMEOUT'))
+@memoize(timeout=timeouts.get('APP_TIMEOUT'), tags=_app_tags,
+         batch=_by_app(_n_completed_tasks_by_app_sql))
 def n_completed_tasks(app_id):
-    sql = text('''SELECT COUNT(task.id) AS n_completed_tasks FROM task
-                WHERE task.app_id=:app_id AND task.state=\'completed\';''')
-
-    results = session.execute(sql, dict(app_id=app_id))
+    results = _n_completed_tasks_sql.execute(session, dict(app_id=app_id))
     n_completed_tasks = 0
     for row in results:
         n_completed_tasks = row.n_completed_tasks
     return n_completed_tasks
 
 
-@memoize(timeout=timeouts.get('REGISTERED_USERS_TIMEOUT'))
-def n_registered_volunteers(app_id):
-    sql = text('''SELECT COUNT(DISTINCT(task_run.user_id)) AS n_registered_volunteers FROM task_run
-           WHERE task_run.user_id IS NOT NULL AND
-           task_run.user_ip IS NULL AND
-           task_run.app_id=:app_id;''')
+def _n_volunteers_by_app(anonymous):
+    """Return a batch function (see memoize) counting the registered or the
+    anonymous volunteers of many projects with their sketches."""
+    def batch(calls):
+        counts = volunteers.count_many([args[0] for args in calls])
+        return [n_anon if anonymous else n_auth for n_auth, n_anon in counts]
+    return batch
 
-    results = session.execute(sql, dict(app_id=app_id))
-    n_registered_volunteers = 0
-    for row in results:
-        n_registered_volunteers = row.n_registered_volunteers
+
+@memoize(timeout=timeouts.get('REGISTERED_USERS_TIMEOUT'),
+         tags=_app_tags, batch=_n_volunteers_by_app(anonymous=False))
+def n_registered_volunteers(app_id):
+    n_registered_volunteers, n_anonymous_volunteers = volunteers.count(app_id)
     return n_registered_volunteers
 
 
-@memoize(timeout=timeouts.get('ANON_USERS_TIMEOUT'))
+@memoize(timeout=timeouts.get('ANON_USERS_TIMEOUT'),
+         tags=_app_tags, batch=_n_volunteers_by_app(anonymous=True))
 def n_anonymous_volunteers(app_id):
-    sql = text('''SELECT COUNT(DISTINCT(task_run.user_ip)) AS n_anonymous_volunteers FROM task_run
-           WHERE task_run.user_ip IS NOT NULL AND
-           task_run.user_id IS NULL AND
-           task_run.app_id=:app_id;''')
-
-    results = session.execute(sql, dict(app_id=app_id))
-    n_anonymous_volunteers = 0
-    for row in results:
-        n_anonymous_volunteers = row.n_anonymous_volunteers
+    n_registered_volunteers, n_anonymous_volunteers = volunteers.count(app_id)
     return n_anonymous_volunteers
 
 
-@memoize()
+def _n_volunteers_many(calls):
+    values = get_many([(function, args) for args in calls
+                       for function in (n_anonymous_volunteers,
+                                        n_registered_volunteers)])
+    return [sum(values[i:i + 2]) for i in range(0, len(values), 2)]
+
+
+@memoize(tags=_app_tags, batch=_n_volunteers_many)
 def n_volunteers(app_id):
     return n_anonymous_volunteers(app_id) + n_registered_volunteers(app_id)
 
 
-@memoize(timeout=timeouts.get('APP_TIMEOUT'))
+@memoize(timeout=timeouts.get('APP_TIMEOUT'), tags=_app_tags)
 def n_task_runs(app_id):
-    sql = text('''SELECT COUNT(task_run.id) AS n_task_runs FROM task_run
-                  WHERE task_run.app_id=:app_id''')
-
-    results = session.execute(sql, dict(app_id=app_id))
+    results = _n_task_runs_sql.execute(session, dict(app_id=app_id))
     n_task_runs = 0
     for row in results:
         n_task_runs = row.n_task_runs
     return n_task_runs
 
 
-@memoize(timeout=timeouts.get('APP_TIMEOUT'))
+def _overall_progress_many(calls):
+    values = get_many([(function, args) for args in calls
+                       for function in (n_tasks, n_completed_tasks)])
+    return [(values[i + 1] * 100) / values[i] if values[i] != 0 else 0
+            for i in range(0, len(values), 2)]
+
+
+@memoize(timeout=timeouts.get('APP_TIMEOUT'), tags=_app_tags,
+         batch=_overall_progress_many)
 def overall_progress(app_id):
     """Returns the percentage of submitted Tasks Runs done when a task is
     completed"""
@@ -157,22 +225,37 @@ def overall_progress(app_id):
         return 0
 
 
-@memoize(timeout=timeouts.get('APP_TIMEOUT'))
+@memoize(timeout=timeouts.get('APP_TIMEOUT'), tags=_app_tags,
+         batch=_by_app(_last_activity_by_app_sql, default=None,
+                       convert=isoformat))
 def last_activity(app_id):
-    sql = text('''SELECT finish_time FROM task_run WHERE app_id=:app_id
-               ORDER BY finish_time DESC LIMIT 1''')
-
-    results = session.execute(sql, dict(app_id=app_id))
+    results = _last_activity_sql.execute(session, dict(app_id=app_id))
     for row in results:
         if row is not None:
-            return row[0]
+            return isoformat(row[0])
         else:  # pragma: no cover
             return None
 
 
+def _add_stats(apps):
+    """Add the stats shown in the listings to a page of apps, reading them
+    from the cache at once and computing the missing ones together"""
+    calls = [(function, (app['id'],)) for app in apps
+             for function in (last_activity, overall_progress, n_tasks,
+                              n_volunteers)]
+    values = iter(get_many(calls))
+    for app in apps:
+        app['last_activity_raw'] = next(values)
+        app['last_activity'] = pretty_date(app['last_activity_raw'])
+        app['overall_progress'] = next(values)
+        app['n_tasks'] = next(values)
+        app['n_volunteers'] = next(values)
+    return apps
+
+
 # This function does not change too much, so cache it for a longer time
 @cache(timeout=timeouts.get('STATS_FRONTPAGE_TIMEOUT'),
-       key_prefix="number_featured_apps")
+       key_prefix="number_featured_apps", tags=[LISTINGS_TAG])
 def _n_featured():
     """Return number of featured apps"""
     sql = text('''SELECT COUNT(*) FROM app WHERE featured=true;''')
@@ -184,7 +267,8 @@ def _n_featured():
 
 
 # This function does not change too much, so cache it for a longer time
-@memoize(timeout=timeouts.get('STATS_FRONTPAGE_TIMEOUT'))
+@memoize(timeout=timeouts.get('STATS_FRONTPAGE_TIMEOUT'),
+         tags=_listings_tags)
 def get_featured(category=None, page=1, per_page=5):
     """Return a list of featured apps with a pagination"""
     sql = text('''SELECT app.id, app.name, app.short_name, app.info, app.created,
@@ -200,20 +284,15 @@ def get_featured(category=None, page=1, per_page=5):
     apps = []
     for row in results:
         app = dict(id=row.id, name=row.name, short_name=row.short_name,
-                   created=row.created, description=row.description,
-                   last_activity=pretty_date(last_activity(row.id)),
-                   last_activity_raw=last_activity(row.id),
+                   created=isoformat(row.created), description=row.description,
                    owner=row.owner,
-                   overall_progress=overall_progress(row.id),
-                   n_tasks=n_tasks(row.id),
-                   n_volunteers=n_volunteers(row.id),
                    info=dict(json.loads(row.info)))
         apps.append(app)
-    return apps
+    return _add_stats(apps)
 
 
 @cache(key_prefix="number_published_apps",
-       timeout=timeouts.get('STATS_APP_TIMEOUT'))
+       timeout=timeouts.get('STATS_APP_TIMEOUT'), tags=[LISTINGS_TAG])
 def n_published():
     """Return number of published apps"""
     sql = text('''
@@ -232,7 +311,7 @@ def n_published():
 
 # Cache it for longer times, as this is only shown to admin users
 @cache(timeout=timeouts.get('STATS_DRAFT_TIMEOUT'),
-       key_prefix="number_draft_apps")
+       key_prefix="number_draft_apps", tags=[LISTINGS_TAG])
 def _n_draft():
     """Return number of draft projects"""
     sql = text('''SELECT COUNT(app.id) FROM app
@@ -246,7 +325,8 @@ def _n_draft():
     return count
 
 
-@memoize(timeout=timeouts.get('STATS_FRONTPAGE_TIMEOUT'))
+@memoize(timeout=timeouts.get('STATS_FRONTPAGE_TIMEOUT'),
+         tags=_listings_tags)
 def get_draft(category=None, page=1, per_page=5):
     """Return list of draft projects"""
     sql = text('''SELECT app.id, app.name, app.short_name, app.created,
@@ -263,20 +343,16 @@ def get_draft(category=None, page=1, per_page=5):
     apps = []
     for row in results:
         app = dict(id=row.id, name=row.name, short_name=row.short_name,
-                   created=row.created,
+                   created=isoformat(row.created),
                    description=row.description,
                    owner=row.owner,
-                   last_activity=pretty_date(last_activity(row.id)),
-                   last_activity_raw=last_activity(row.id),
-                   overall_progress=overall_progress(row.id),
-                   n_tasks=n_tasks(row.id),
-                   n_volunteers=n_volunteers(row.id),
                    info=dict(json.loads(row.info)))
         apps.append(app)
-    return apps
+    return _add_stats(apps)
 
 
-@memoize(timeout=timeouts.get('N_APPS_PER_CATEGORY_TIMEOUT'))
+@memoize(timeout=timeouts.get('N_APPS_PER_CATEGORY_TIMEOUT'),
+         tags=_listings_tags)
 def n_count(category):
     """Count the number of apps in a given category"""
     if category == 'featured':
@@ -303,7 +379,8 @@ def n_count(category):
     return count
 
 
-@memoize(timeout=timeouts.get('APP_TIMEOUT'))
+@memoize(timeout=timeouts.get('APP_TIMEOUT'),
+         tags=_listings_tags)
 def get(category, page=1, per_page=5):
     """Return a list of apps with at least one task and a task_presenter
        with a pagination for a given category"""
@@ -327,18 +404,13 @@ def get(category, page=1, per_page=5):
     for row in results:
         app = dict(id=row.id,
                    name=row.name, short_name=row.short_name,
-                   created=row.created,
+                   created=isoformat(row.created),
                    description=row.description,
                    owner=row.owner,
                    featured=row.featured,
-                   last_activity=pretty_date(last_activity(row.id)),
-                   last_activity_raw=last_activity(row.id),
-                   overall_progress=overall_progress(row.id),
-                   n_tasks=n_tasks(row.id),
-                   n_volunteers=n_volunteers(row.id),
                    info=dict(json.loads(row.info)))
         apps.append(app)
-    return apps
+    return _add_stats(apps)
 
 
 # TODO: find a convenient cache timeout and cache, if needed
@@ -355,17 +427,8 @@ def get_from_pro_user():
 
 
 def reset():
-    """Clean the cache"""
-    delete_cached("index_front_page")
-    delete_cached('front_page_featured_apps')
-    delete_cached('front_page_top_apps')
-    delete_cached('number_featured_apps')
-    delete_cached('number_published_apps')
-    delete_cached('number_draft_apps')
-    delete_memoized(get_featured)
-    delete_memoized(get_draft)
-    delete_memoized(n_count)
-    delete_memoized(get)
+    """Clean the cache of the projects listings"""
+    delete_tag(LISTINGS_TAG)
 
 
 def delete_app(short_name):
@@ -416,11 +479,4 @@ def delete_n_volunteers(app_id):
 def clean(app_id):
     """Clean all items in cache"""
     reset()
-    delete_n_tasks(app_id)
-    delete_n_completed_tasks(app_id)
-    delete_n_task_runs(app_id)
-    delete_overall_progress(app_id)
-    delete_last_activity(app_id)
-    delete_n_registered_volunteers(app_id)
-    delete_n_anonymous_volunteers(app_id)
-    delete_n_volunteers(app_id)
+    delete_tag('app:%s' % app_id)
@@ -17,8 +17,9 @@
 # along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
 
 from sqlalchemy.sql import text
+from redis.exceptions import ConnectionError
 from pybossa.core import db
-from pybossa.cache import memoize, ONE_HOUR
+from pybossa import answered_tasks, task_pool
 from pybossa.cache.apps import overall_progress
 
 
@@ -26,11 +27,24 @@ from pybossa.cache.apps import overall_progress
 session = db.slave_session
 
 
-@memoize(timeout=ONE_HOUR * 3)
 def n_available_tasks(app_id, user_id=None, user_ip=None):
     """Returns the number of tasks for a given app a user can contribute to,
     based on the completion of the app tasks, and previous task_runs submitted
-    by the user"""
+    by the user. It is counted in Redis, so it is not cached"""
+    try:
+        # The open tasks are the ones in the task pool
+        n_tasks = task_pool.count_tasks(app_id)
+        if n_tasks > 0:
+            n_tasks -= answered_tasks.count_open_answered(app_id, user_id,
+                                                          user_ip)
+        return n_tasks
+    except ConnectionError:
+        return _n_available_tasks_db(app_id, user_id, user_ip)
+
+
+def _n_available_tasks_db(app_id, user_id=None, user_ip=None):
+    """Like n_available_tasks, with an anti-join against the task_run table,
+    for when Redis is not available"""
     if user_id and not user_ip:
         query = text('''SELECT COUNT(id) AS n_tasks FROM task WHERE NOT EXISTS
                        (SELECT task_id FROM task_run WHERE
@@ -44,7 +58,6 @@ def n_available_tasks(app_id, user_id=None, user_ip=None):
                        (SELECT task_id FROM task_run WHERE
                        app_id=:app_id AND user_ip=:user_ip AND task_id=task.id)
                        AND app_id=:app_id AND state !='completed';''')
-
         result = session.execute(query, dict(app_id=app_id, user_ip=user_ip))
     n_tasks = 0
     for row in result:
@@ -0,0 +1,175 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2014 SF Isle of Man Limited
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Local cache module for keeping the hottest cached values in the worker.
+
+The local cache sits in front of the Redis cache: values found there are
+served from the memory of the worker process, without a round trip to Redis.
+Values are kept serialized, so callers never share (and mutate) the same
+object, and the memory bound counts their real size. Every entry may belong
+to some families (the generation keys of the Redis cache), indexed so a
+whole family can be evicted at once.
+
+As every worker has its own copy, invalidations are broadcasted to all of them
+over a Redis pub/sub channel, and each entry lives at most LOCAL_CACHE_TIMEOUT
+seconds (60 by default) in case a message is lost.
+
+This module exports:
+    * LocalCache: a LRU cache with TTL and a memory bound
+    * FAMILY_PREFIX: the prefix of the invalidation messages of a family
+
+"""
+import logging
+import os
+import threading
+import time
+from collections import OrderedDict
+
+
+log = logging.getLogger(__name__)
+
+FAMILY_PREFIX = 'family:'
+
+
+class LocalCache(object):
+
+    """LRU cache with a TTL per entry and a bound on the stored bytes."""
+
+    def __init__(self, max_bytes=0, timeout=60):
+        self.max_bytes = max_bytes
+        self.timeout = timeout
+        self.n_bytes = 0
+        self._entries = OrderedDict()
+        # Family -> keys of its entries
+        self._families = {}
+        self._lock = threading.Lock()
+        self._listener_pid = None
+
+    @property
+    def enabled(self):
+        return self.max_bytes > 0
+
+    def get(self, key):
+        """Return the value of key, or None if it is not in the cache."""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expiration, families = entry
+            if expiration < time.time():
+                self._pop(key)
+                return None
+            # Move it to the end, as the most recently used
+            self._entries[key] = self._entries.pop(key)
+            return value
+
+    def set(self, key, value, timeout=None, families=()):
+        """Store a serialized value for timeout seconds at most, as a member
+        of families."""
+        if len(value) > self.max_bytes:
+            return
+        timeout = min(timeout or self.timeout, self.timeout)
+        with self._lock:
+            self._pop(key)
+            self._entries[key] = (value, time.time() + timeout,
+                                  tuple(families))
+            self.n_bytes += len(value)
+            for family in families:
+                self._families.setdefault(family, set()).add(key)
+            while self.n_bytes > self.max_bytes:
+                self._pop(next(iter(self._entries)))
+
+    def _pop(self, key):
+        """Remove an entry, with the lock held."""
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        value, expiration, families = entry
+        self.n_bytes -= len(value)
+        for family in families:
+            keys = self._families.get(family)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._families[family]
+
+    def delete(self, key):
+        with self._lock:
+            self._pop(key)
+
+    def delete_prefix(self, prefix):
+        with self._lock:
+            for key in [k for k in self._entries if k.startswith(prefix)]:
+                self._pop(key)
+
+    def delete_family(self, family):
+        with self._lock:
+            for key in list(self._families.get(family, ())):
+                self._pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._families.clear()
+            self.n_bytes = 0
+
+    def invalidate(self, message):
+        """Apply an invalidation message: a key, a prefix ending in *, or a
+        family prefixed by FAMILY_PREFIX."""
+        if message.startswith(FAMILY_PREFIX):
+            self.delete_family(message[len(FAMILY_PREFIX):])
+        elif message.endswith('*'):
+            self.delete_prefix(message[:-1])
+        else:
+            self.delete(message)
+
+    def listen(self, redis_conn, channel):
+        """Start (once per process) a thread applying the invalidations
+        published in channel."""
+        if self._listener_pid == os.getpid():
+            return
+        self._listener_pid = os.getpid()
+        # Workers forked from a process with entries start from scratch
+        self.clear()
+        thread = threading.Thread(target=self._listen,
+                                  args=(redis_conn, channel))
+        thread.daemon = True
+        thread.start()
+
+    def _listen(self, redis_conn, channel):  # pragma: no cover
+        while True:
+            try:
+                pubsub = redis_conn.pubsub()
+                pubsub.subscribe(channel)
+                for message in pubsub.listen():
+                    self._on_message(message)
+            except Exception as e:
+                log.error('Local cache invalidations listener: %s', e)
+            # Invalidations may have been lost while disconnected
+            self.clear()
+            time.sleep(1)
+
+    def _on_message(self, message):
+        """Apply a message received by the listener. A message that can not
+        be applied is logged, without dropping the rest of the cache."""
+        if message['type'] != 'message':
+            return
+        try:
+            self.invalidate(message['data'])
+        except Exception as e:
+            log.error('Local cache invalidation %r: %s', message['data'], e)
@@ -0,0 +1,175 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2014 SF Isle of Man Limited
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Cache metrics module for instrumenting the cached functions.
+
+For every cached function it keeps a Redis hash with the number of hits
+(and how many of them came from the local cache), misses, recomputations,
+their compute time, a compute time histogram and the bytes stored, so the
+least effective and most expensive cached functions can be found.
+
+Every worker counts in memory and adds its counts to Redis at most once every
+flush interval, so cache hits do not cost an extra Redis write. If Redis is
+not available, the counts are kept until the next flush.
+
+This module exports:
+    * CacheMetrics: to count the hits, misses and recomputations of a worker
+    * get_metrics: to get the metrics of every cached function
+
+"""
+import threading
+import time
+from redis.exceptions import ConnectionError
+from pybossa.core import sentinel
+
+
+METRICS_TIMEOUT = 7 * 24 * 60 * 60
+# Upper bounds (in ms) of the compute time histogram buckets
+COMPUTE_BUCKETS = [1, 5, 10, 50, 100, 250, 500, 1000, 2500, 5000, 10000]
+KEYS_INDEX = 'pybossa:cache_metrics:functions'
+
+
+def _metrics_key(function):
+    return 'pybossa:cache_metrics:%s' % function
+
+
+def _bucket(compute_ms):
+    for bound in COMPUTE_BUCKETS:
+        if compute_ms <= bound:
+            return str(bound)
+    return 'inf'
+
+
+class CacheMetrics(object):
+
+    """Count the cache hits, misses and recomputations of every function in
+    this worker, adding them to Redis every flush_interval seconds."""
+
+    def __init__(self, enabled=True, flush_interval=10):
+        self.enabled = enabled
+        self.flush_interval = flush_interval
+        self._counts = {}
+        self._last_flush = time.time()
+        self._lock = threading.Lock()
+
+    def _add(self, function, field, value=1):
+        with self._lock:
+            counts = self._counts.setdefault(function, {})
+            counts[field] = counts.get(field, 0) + value
+        if time.time() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def hit(self, function, local=False):
+        """Count a value of function served from the cache."""
+        if not self.enabled:
+            return
+        if local:
+            self._add(function, 'local_hits')
+        self._add(function, 'hits')
+
+    def miss(self, function):
+        """Count a value of function missing from the cache."""
+        if self.enabled:
+            self._add(function, 'misses')
+
+    def computed(self, function, seconds, n_bytes):
+        """Count a (re)computation of function that took seconds, storing a
+        payload of n_bytes."""
+        if not self.enabled:
+            return
+        compute_ms = seconds * 1000
+        self._add(function, 'computations')
+        self._add(function, 'compute_ms', compute_ms)
+        self._add(function, 'le_%s' % _bucket(compute_ms))
+        self._add(function, 'bytes', n_bytes)
+
+    def flush(self, redis_conn=None):
+        """Add the counts of this worker to Redis, keeping them for the next
+        flush if Redis is not available."""
+        with self._lock:
+            counts, self._counts = self._counts, {}
+            self._last_flush = time.time()
+        if not counts:
+            return
+        redis_conn = redis_conn or sentinel.master
+        pipe = redis_conn.pipeline(transaction=False)
+        for function, fields in counts.iteritems():
+            key = _metrics_key(function)
+            for field, value in fields.iteritems():
+                if isinstance(value, float):
+                    pipe.hincrbyfloat(key, field, value)
+                else:
+                    pipe.hincrby(key, field, value)
+            pipe.expire(key, METRICS_TIMEOUT)
+            pipe.sadd(KEYS_INDEX, function)
+        try:
+            pipe.execute()
+        except ConnectionError:
+            self._restore(counts)
+
+    def _restore(self, counts):
+        with self._lock:
+            for function, fields in counts.iteritems():
+                current = self._counts.setdefault(function, {})
+                for field, value in fields.iteritems():
+                    current[field] = current.get(field, 0) + value
+
+
+def _percentile(histogram, total, pct):
+    """Return the upper bound of the bucket holding the pct percentile."""
+    seen = 0
+    for bound in [str(b) for b in COMPUTE_BUCKETS] + ['inf']:
+        seen += histogram.get(bound, 0)
+        if seen >= total * pct / 100.0:
+            return float(bound)
+    return float('inf')
+
+
+def get_metrics(redis_conn=None):
+    """Return the metrics of every cached function, the ones spending the
+    most time recomputing their values first."""
+    redis_conn = redis_conn or sentinel.slave
+    functions = sorted(redis_conn.smembers(KEYS_INDEX))
+    pipe = redis_conn.pipeline(transaction=False)
+    for function in functions:
+        pipe.hgetall(_metrics_key(function))
+    metrics = []
+    for function, values in zip(functions, pipe.execute()):
+        hits = int(values.get('hits', 0))
+        misses = int(values.get('misses', 0))
+        computations = int(values.get('computations', 0))
+        if hits + misses + computations == 0:
+            continue
+        compute_ms = float(values.get('compute_ms', 0))
+        histogram = dict((field[3:], int(value))
+                         for field, value in values.iteritems()
+                         if field.startswith('le_'))
+        metrics.append(dict(
+            function=function,
+            hits=hits,
+            local_hits=int(values.get('local_hits', 0)),
+            misses=misses,
+            hit_ratio=float(hits) / (hits + misses) if hits + misses else 0,
+            computations=computations,
+            compute_ms=compute_ms,
+            avg_compute_ms=compute_ms / computations if computations else 0,
+            p95_compute_ms=(_percentile(histogram, computations, 95)
+                            if computations else 0),
+            avg_bytes=(float(values.get('bytes', 0)) / computations
+                       if computations else 0)))
+    return sorted(metrics, key=lambda m: m['compute_ms'], reverse=True)
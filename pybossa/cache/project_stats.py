@@ -19,7 +19,8 @@
 from flask import current_app
 from sqlalchemy.sql import text
 from pybossa.core import db
-from pybossa.cache import memoize, ONE_DAY
+from pybossa.cache import memoize, ONE_DAY, ONE_HOUR
+from pybossa import stats_rollup, volunteers
 
 import pygeoip
 import operator
@@ -55,15 +56,6 @@ def stats_users(app_id):
     for row in results:
         auth_users.append([row.user_id, row.n_tasks])
 
-    sql = text('''SELECT count(distinct(task_run.user_id)) AS user_id FROM task_run
-               WHERE task_run.user_id IS NOT NULL AND
-               task_run.user_ip IS NULL AND
-               task_run.app_id=:app_id;''')
-
-    results = session.execute(sql, dict(app_id=app_id))
-    for row in results:
-        users['n_auth'] = row[0]
-
     # Get all Anonymous Users
     sql = text('''SELECT task_run.user_ip AS user_ip,
                COUNT(task_run.id) as n_tasks FROM task_run
@@ -76,15 +68,7 @@ def stats_users(app_id):
     for row in results:
         anon_users.append([row.user_ip, row.n_tasks])
 
-    sql = text('''SELECT COUNT(DISTINCT(task_run.user_ip)) AS user_ip FROM task_run
-               WHERE task_run.user_ip IS NOT NULL AND
-               task_run.user_id IS NULL AND
-               task_run.app_id=:app_id;''')
-
-    results = session.execute(sql, dict(app_id=app_id))
-
-    for row in results:
-        users['n_anon'] = row[0]
+    users['n_auth'], users['n_anon'] = volunteers.count(app_id)
 
     return users, anon_users, auth_users
 
@@ -97,32 +81,17 @@ def stats_dates(app_id):
 
     n_tasks(app_id)
 
-    # Get all completed tasks
+    # Get the tasks completed per day in the last two weeks
     sql = text('''
-            WITH answers AS (
-             SELECT
-             TO_DATE(task_run.finish_time, 'YYYY-MM-DD\THH24:MI:SS.US')
-             AS day, task.id, task.n_answers AS n_answers,
-             COUNT(task_run.id) AS day_answers
-             FROM task_run, task WHERE task_run.app_id=:app_id
-             AND task.id=task_run.task_id AND
-             TO_DATE(task_run.finish_time, 'YYYY-MM-DD\THH24:MI:SS.US') >= NOW()
-               - '2 week':: INTERVAL GROUP BY day, task.id)
-            SELECT to_char(day_of_completion, 'YYYY-MM-DD') AS day,
-               COUNT(task_id) AS completed_tasks FROM (
-                SELECT MIN(day) AS day_of_completion, task_id FROM (
-                    SELECT ans1.day, ans1.id as task_id,
-                    floor(avg(ans1.n_answers)) AS n_answers,
-                    sum(ans2.day_answers) AS accum_answers
-                    FROM answers AS ans1 INNER JOIN answers AS ans2
-                    ON ans1.id=ans2.id WHERE ans1.day >= ans2.day
-                    GROUP BY ans1.id, ans1.day) AS answers_day_task
-                WHERE n_answers <= accum_answers
-                GROUP BY task_id) AS completed_tasks_by_day
-            GROUP BY day;
-               ''').execution_options(stream=True)
-
-    results = session.execute(sql, dict(app_id=app_id))
+               SELECT to_char(completed_at, 'YYYY-MM-DD') AS day,
+               COUNT(id) AS completed_tasks FROM task
+               WHERE app_id=:app_id AND completed_at >= :since
+               GROUP BY day;
+               ''')
+    since = datetime.datetime.utcnow() - datetime.timedelta(days=13)
+
+    results = session.execute(sql, dict(app_id=app_id,
+                                        since=since.strftime('%Y-%m-%d')))
     for row in results:
         dates[row.day] = row.completed_tasks
 
@@ -133,31 +102,12 @@ def stats_dates(app_id):
             tmp_date = base - datetime.timedelta(days=x)
             dates[tmp_date.strftime('%Y-%m-%d')] = 0
 
-    # Get all answers per date for auth
-    sql = text('''
-                WITH myquery AS (
-                    SELECT TO_DATE(finish_time, 'YYYY-MM-DD\THH24:MI:SS.US') as d,
-                                   COUNT(id)
-                    FROM task_run WHERE app_id=:app_id AND user_ip IS NULL GROUP BY d)
-               SELECT to_char(d, 'YYYY-MM-DD') as d, count from myquery;
-               ''').execution_options(stream=True)
-
-    results = session.execute(sql, dict(app_id=app_id))
-    for row in results:
-        dates_auth[row.d] = row.count
-
-    # Get all answers per date for anon
-    sql = text('''
-                WITH myquery AS (
-                    SELECT TO_DATE(finish_time, 'YYYY-MM-DD\THH24:MI:SS.US') as d,
-                                   COUNT(id)
-                    FROM task_run WHERE app_id=:app_id AND user_id IS NULL GROUP BY d)
-               SELECT to_char(d, 'YYYY-MM-DD') as d, count  from myquery;
-               ''').execution_options(stream=True)
-
-    results = session.execute(sql, dict(app_id=app_id))
-    for row in results:
-        dates_anon[row.d] = row.count
+    # Get all answers per date for auth and anon
+    for (day, anonymous), count in stats_rollup.days(app_id).iteritems():
+        if anonymous:
+            dates_anon[day] = count
+        else:
+            dates_auth[day] = count
 
     return dates, dates_anon, dates_auth
 
@@ -167,9 +117,6 @@ def stats_hours(app_id):
     hours = {}
     hours_anon = {}
     hours_auth = {}
-    max_hours = 0
-    max_hours_anon = 0
-    max_hours_auth = 0
 
     # initialize hours keys
     for i in range(0, 24):
@@ -177,105 +124,25 @@ def stats_hours(app_id):
         hours_anon[str(i).zfill(2)] = 0
         hours_auth[str(i).zfill(2)] = 0
 
-    # Get hour stats for all users
-    sql = text('''
-               WITH myquery AS
-                (SELECT to_char(
-                    DATE_TRUNC('hour',
-                        TO_TIMESTAMP(finish_time, 'YYYY-MM-DD"T"HH24:MI:SS.US')
-                    ),
-                    'HH24') AS h, COUNT(id)
-                    FROM task_run WHERE app_id=:app_id GROUP BY h)
-               SELECT h, count from myquery;
-               ''').execution_options(stream=True)
-
-    results = session.execute(sql, dict(app_id=app_id))
-
-    for row in results:
-        hours[row.h] = row.count
-
-    # Get maximum stats for all users
-    sql = text('''
-               WITH myquery AS
-                (SELECT to_char(
-                    DATE_TRUNC('hour',
-                        TO_TIMESTAMP(finish_time, 'YYYY-MM-DD"T"HH24:MI:SS.US')
-                    ),
-                    'HH24') AS h, COUNT(id)
-                    FROM task_run WHERE app_id=:app_id GROUP BY h)
-               SELECT max(count) from myquery;
-               ''').execution_options(stream=True)
-
-    results = session.execute(sql, dict(app_id=app_id))
-    for row in results:
-        max_hours = row.max
-
-    # Get hour stats for Anonymous users
-    sql = text('''
-               WITH myquery AS
-                (SELECT to_char(
-                    DATE_TRUNC('hour',
-                        TO_TIMESTAMP(finish_time, 'YYYY-MM-DD"T"HH24:MI:SS.US')
-                    ),
-                    'HH24') AS h, COUNT(id)
-                    FROM task_run WHERE app_id=:app_id AND user_id IS NULL GROUP BY h)
-               SELECT h, count from myquery;
-               ''').execution_options(stream=True)
-
-    results = session.execute(sql, dict(app_id=app_id))
-
-    for row in results:
-        hours_anon[row.h] = row.count
-
-    # Get maximum stats for Anonymous users
-    sql = text('''
-               WITH myquery AS
-                (SELECT to_char(
-                    DATE_TRUNC('hour',
-                        TO_TIMESTAMP(finish_time, 'YYYY-MM-DD"T"HH24:MI:SS.US')
-                    ),
-                    'HH24') AS h, COUNT(id)
-                    FROM task_run WHERE app_id=:app_id AND user_id IS NULL GROUP BY h)
-               SELECT max(count) from myquery;
-               ''').execution_options(stream=True)
-
-    results = session.execute(sql, dict(app_id=app_id))
-    for row in results:
-        max_hours_anon = row.max
-
-
-    # Get hour stats for Auth users
-    sql = text('''
-               WITH myquery AS
-                (SELECT to_char(
-                    DATE_TRUNC('hour',
-                        TO_TIMESTAMP(finish_time, 'YYYY-MM-DD"T"HH24:MI:SS.US')
-                    ),
-                    'HH24') AS h, COUNT(id)
-                    FROM task_run WHERE app_id=:app_id AND user_ip IS NULL GROUP BY h)
-               SELECT h, count from myquery;
-               ''').execution_options(stream=True)
-
-    results = session.execute(sql, dict(app_id=app_id))
-
-    for row in results:
-        hours_auth[row.h] = row.count
+    # Get hour stats for all, anonymous and authenticated users
+    counts = dict()
+    counts_anon = dict()
+    counts_auth = dict()
+    for (hour, anonymous), count in stats_rollup.hours(app_id).iteritems():
+        h = str(hour).zfill(2)
+        counts[h] = counts.get(h, 0) + count
+        if anonymous:
+            counts_anon[h] = count
+        else:
+            counts_auth[h] = count
+    hours.update(counts)
+    hours_anon.update(counts_anon)
+    hours_auth.update(counts_auth)
 
-    # Get hour stats for Anon users
-    sql = text('''
-               WITH myquery AS
-                (SELECT to_char(
-                    DATE_TRUNC('hour',
-                        TO_TIMESTAMP(finish_time, 'YYYY-MM-DD"T"HH24:MI:SS.US')
-                    ),
-                    'HH24') AS h, COUNT(id)
-                    FROM task_run WHERE app_id=:app_id AND user_ip IS NULL GROUP BY h)
-               SELECT max(count) from myquery;
-               ''').execution_options(stream=True)
-
-    results = session.execute(sql, dict(app_id=app_id))
-    for row in results:
-        max_hours_auth = row.max
+    # Get maximum stats (None without task runs)
+    max_hours = max(counts.values()) if counts else None
+    max_hours_anon = max(counts_anon.values()) if counts_anon else None
+    max_hours_auth = max(counts_auth.values()) if counts_auth else None
 
     return hours, hours_anon, hours_auth, max_hours, max_hours_anon, max_hours_auth
 
@@ -426,7 +293,7 @@ def stats_format_users(app_id, users, anon_users, auth_users, geo=False):
                 n_anon=users['n_anon'], n_auth=users['n_auth'])
 
 
-@memoize(timeout=ONE_DAY)
+@memoize(timeout=ONE_DAY, stale=ONE_HOUR)
 def get_stats(app_id, geo=False):
     """Return the stats of a given app"""
     hours, hours_anon, hours_auth, max_hours, \
@@ -0,0 +1,124 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2014 SF Isle of Man Limited
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Serializers module for storing the cached values in Redis.
+
+Payloads start with a byte telling how they were encoded, so values encoded
+with a different serializer (e.g. after changing the CACHE_SERIALIZER setting)
+can still be read:
+
+    * P: binary pickle, for any value
+    * J: JSON, only for plain values (see is_plain)
+    * M: msgpack, only for plain values, if msgpack is installed
+    * Z: zlib compressed payload, for payloads bigger than a threshold
+
+JSON and msgpack do not keep tuples, dicts with non string keys or objects,
+so values having any of them are always pickled.
+
+This module exports:
+    * Serializer: to encode and decode the cached values
+    * is_plain: to check if a value is encoded the same with JSON and pickle
+
+"""
+import json
+import zlib
+
+try:
+    import cPickle as pickle
+except ImportError:  # pragma: no cover
+    import pickle
+
+try:
+    import msgpack
+except ImportError:  # pragma: no cover
+    msgpack = None
+
+
+COMPRESS_LEVEL = 1
+_SCALARS = (type(None), bool, int, long, float, unicode)
+
+
+def is_plain(value):
+    """Return True if value only has lists, dicts with string keys and JSON
+    scalars, so it is the same after a JSON or msgpack round trip."""
+    if isinstance(value, _SCALARS):
+        return True
+    if isinstance(value, str):
+        try:
+            value.decode('utf-8')
+            return True
+        except UnicodeDecodeError:
+            return False
+    if type(value) is list:
+        return all(is_plain(item) for item in value)
+    if type(value) is dict:
+        return all(isinstance(key, basestring) and is_plain(item)
+                   for key, item in value.iteritems())
+    return False
+
+
+def _pickle_dumps(value):
+    return pickle.dumps(value, pickle.HIGHEST_PROTOCOL)
+
+
+def _msgpack_dumps(value):
+    return msgpack.packb(value, use_bin_type=True)
+
+
+def _msgpack_loads(payload):
+    return msgpack.unpackb(payload, encoding='utf-8')
+
+
+_DUMPS = dict(P=_pickle_dumps, J=json.dumps, M=_msgpack_dumps)
+_LOADS = dict(P=pickle.loads, J=json.loads, M=_msgpack_loads)
+_FORMATS = dict(pickle='P', json='J', msgpack='M')
+
+
+class Serializer(object):
+
+    """Encode values with pickle, JSON or msgpack, compressing the big ones.
+    """
+
+    def __init__(self, name='pickle', compress_min_bytes=4096):
+        if name not in _FORMATS:
+            raise ValueError('Unknown cache serializer %s' % name)
+        if name == 'msgpack' and msgpack is None:  # pragma: no cover
+            name = 'json'
+        self.name = name
+        self.compress_min_bytes = compress_min_bytes
+
+    def dumps(self, value, plain=None):
+        """Encode value. plain tells if value is plain, when already known.
+        """
+        fmt = _FORMATS[self.name]
+        if fmt != 'P' and not (is_plain(value) if plain is None else plain):
+            fmt = 'P'
+        payload = fmt + _DUMPS[fmt](value)
+        if self.compress_min_bytes and len(payload) >= self.compress_min_bytes:
+            return 'Z' + zlib.compress(payload, COMPRESS_LEVEL)
+        return payload
+
+    def loads(self, payload):
+        """Decode a payload, raising ValueError if it has an unknown format.
+        """
+        if payload[:1] == 'Z':
+            payload = zlib.decompress(payload[1:])
+        fmt = payload[:1]
+        if fmt not in _LOADS:
+            raise ValueError('Unknown cache payload format')
+        return _LOADS[fmt](payload[1:])
@@ -22,6 +22,7 @@ from sqlalchemy.sql import text
 from flask import current_app
 
 from pybossa.core import db
+from pybossa import volunteers, trending
 from pybossa.cache import cache, ONE_DAY
 
 session = db.slave_session
@@ -35,15 +36,11 @@ def n_auth_users():
     return n_auth or 0
 
 
-@cache(timeout=ONE_DAY, key_prefix="site_n_anon_users")
 def n_anon_users():
-    sql = text('''SELECT COUNT(DISTINCT(task_run.user_ip))
-               AS n_anon FROM task_run;''')
-
-    results = session.execute(sql)
-    for row in results:
-        n_anon = row.n_anon
-    return n_anon or 0
+    """Return the number of anonymous volunteers of the site, counted with
+    its sketch (so it is not cached)."""
+    n_auth, n_anon = volunteers.count()
+    return n_anon
 
 
 @cache(timeout=ONE_DAY, key_prefix="site_n_tasks")
@@ -73,45 +70,47 @@ def n_task_runs_site():
     return n_task_runs or 0
 
 
-@cache(timeout=ONE_DAY, key_prefix="site_top5_apps_24_hours")
 def get_top5_apps_24_hours():
-    # Top 5 Most active apps in last 24 hours
-    sql = text('''SELECT app.id, app.name, app.short_name, app.info,
-               COUNT(task_run.app_id) AS n_answers FROM app, task_run
-               WHERE app.id=task_run.app_id
-               AND app.hidden=0
-               AND DATE(task_run.finish_time) > NOW() - INTERVAL '24 hour'
-               AND DATE(task_run.finish_time) <= NOW()
-               GROUP BY app.id
-               ORDER BY n_answers DESC LIMIT 5;''')
-
-    results = session.execute(sql, dict(limit=5))
+    """Return the 5 most active (and not hidden) projects of the last 24
+    hours, ranked with the trending sets (so they are not cached)."""
+    # Some of the most active projects could be hidden
+    ranking = trending.top_apps(n=20)
+    if not ranking:
+        return []
+    sql = text('''SELECT app.id, app.name, app.short_name, app.info FROM app
+               WHERE app.id = ANY(:app_ids) AND app.hidden=0;''')
+    app_ids = [app_id for app_id, n_answers in ranking]
+    results = session.execute(sql, dict(app_ids=app_ids))
+    apps = dict((row.id, row) for row in results)
     top5_apps_24_hours = []
-    for row in results:
-        tmp = dict(id=row.id, name=row.name, short_name=row.short_name,
-                   info=dict(json.loads(row.info)), n_answers=row.n_answers)
-        top5_apps_24_hours.append(tmp)
-    return top5_apps_24_hours
+    for app_id, n_answers in ranking:
+        row = apps.get(app_id)
+        if row is not None:
+            tmp = dict(id=row.id, name=row.name, short_name=row.short_name,
+                       info=dict(json.loads(row.info)), n_answers=n_answers)
+            top5_apps_24_hours.append(tmp)
+    return top5_apps_24_hours[:5]
 
 
-@cache(timeout=ONE_DAY, key_prefix="site_top5_users_24_hours")
 def get_top5_users_24_hours():
-    # Top 5 Most active users in last 24 hours
-    sql = text('''SELECT "user".id, "user".fullname, "user".name,
-               COUNT(task_run.app_id) AS n_answers FROM "user", task_run
-               WHERE "user".id=task_run.user_id
-               AND DATE(task_run.finish_time) > NOW() - INTERVAL '24 hour'
-               AND DATE(task_run.finish_time) <= NOW()
-               GROUP BY "user".id
-               ORDER BY n_answers DESC LIMIT 5;''')
-
-    results = session.execute(sql, dict(limit=5))
+    """Return the 5 most active users of the last 24 hours, ranked with the
+    trending sets (so they are not cached)."""
+    ranking = trending.top_users(n=5)
+    if not ranking:
+        return []
+    sql = text('''SELECT "user".id, "user".fullname, "user".name FROM "user"
+               WHERE "user".id = ANY(:user_ids);''')
+    user_ids = [user_id for user_id, n_answers in ranking]
+    results = session.execute(sql, dict(user_ids=user_ids))
+    users = dict((row.id, row) for row in results)
     top5_users_24_hours = []
-    for row in results:
-        user = dict(id=row.id, fullname=row.fullname,
-                    name=row.name,
-                    n_answers=row.n_answers)
-        top5_users_24_hours.append(user)
+    for user_id, n_answers in ranking:
+        row = users.get(user_id)
+        if row is not None:
+            user = dict(id=row.id, fullname=row.fullname,
+                        name=row.name,
+                        n_answers=n_answers)
+            top5_users_24_hours.append(user)
     return top5_users_24_hours
 
 
@@ -0,0 +1,190 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2014 SF Isle of Man Limited
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Cache snapshot module for pre-warming Redis after a deploy, flush or failover.
+
+A snapshot is a gzipped file with the entries of the hottest cached
+functions, the ones whose values would cost the most to recompute cold
+according to the cache metrics (calls times average compute time), along
+with the generations of the cache families so the entries stay valid.
+
+Entries are restored with the TTL they had left (minus the snapshot age) and
+never overwrite the values already in Redis. The generations of the families
+are restored only if they are missing: a family whose generation is already
+in Redis may have been invalidated since the snapshot (from a counter reset
+to zero by the data loss), so its generation is bumped past both the live and
+the snapshot values, and its restored entries are never served. A marker key
+tells whether Redis still has the cache the last snapshot was taken from:
+when it is missing, Redis lost its data and the snapshot is restored. A
+snapshot is not restored into a warm cache unless forced, as bumping its
+generations would invalidate every family.
+
+This module exports:
+    * take: to write a snapshot of the hottest cache entries
+    * restore: to load a snapshot into Redis
+    * is_cold: to check if Redis lost the cache since the last snapshot
+
+"""
+import gzip
+import os
+import time
+from pybossa.core import sentinel
+from pybossa.cache import key_patterns, settings, _invalidate
+from pybossa.cache.metrics import get_metrics
+# Imported so their cached functions are in key_patterns
+import pybossa.cache.apps
+import pybossa.cache.categories
+import pybossa.cache.helpers
+import pybossa.cache.project_stats
+import pybossa.cache.site_stats
+import pybossa.cache.users
+
+try:
+    import cPickle as pickle
+except ImportError:  # pragma: no cover
+    import pickle
+
+
+SNAPSHOT_VERSION = 1
+MARKER_KEY = 'pybossa:cache:snapshot:marker'
+BATCH_SIZE = 500
+
+# Sets the generations missing in Redis to their snapshot values, and bumps
+# the rest past both their live and snapshot values. Returns the number of
+# generations bumped.
+_RESTORE_GENERATIONS_SCRIPT = """
+local bumped = 0
+for i, key in ipairs(KEYS) do
+    if not redis.call('SET', key, ARGV[i], 'NX') then
+        local live = tonumber(redis.call('GET', key)) or 0
+        redis.call('SET', key, math.max(live, tonumber(ARGV[i])) + 1)
+        bumped = bumped + 1
+    end
+end
+return bumped
+"""
+
+
+def _ranked_functions():
+    """Return the cached functions, the most expensive to run cold first."""
+    ranked = sorted(get_metrics(),
+                    key=lambda m: (m['hits'] + m['misses']) *
+                    m['avg_compute_ms'], reverse=True)
+    return [m['function'] for m in ranked if m['function'] in key_patterns]
+
+
+def _scan(redis_conn):
+    """Return the cache keys of every key pattern, and the generation keys,
+    scanning the keys of the cache once."""
+    keys = dict((pattern, []) for pattern in key_patterns.itervalues())
+    generation_prefix = '%s:generation:' % settings.REDIS_KEYPREFIX
+    generation_keys = []
+    for key in redis_conn.scan_iter(match='%s:*' % settings.REDIS_KEYPREFIX,
+                                    count=1000):
+        if key.endswith(':lock'):
+            continue
+        if key.startswith(generation_prefix):
+            generation_keys.append(key)
+        elif key in keys:
+            keys[key].append(key)
+        else:
+            # The keys of a memoized function are <pattern without *><hash>
+            pattern = key.rsplit(':', 1)[0] + ':*'
+            if pattern in keys:
+                keys[pattern].append(key)
+    return keys, generation_keys
+
+
+def _read(keys, redis_conn):
+    """Return the (key, ttl in ms, payload) of the keys still in Redis."""
+    entries = []
+    for i in range(0, len(keys), BATCH_SIZE):
+        batch = keys[i:i + BATCH_SIZE]
+        pipe = redis_conn.pipeline(transaction=False)
+        for key in batch:
+            pipe.pttl(key)
+            pipe.get(key)
+        values = pipe.execute()
+        for key, ttl, payload in zip(batch, values[::2], values[1::2]):
+            if payload is not None and ttl > 0:
+                entries.append((key, ttl, payload))
+    return entries
+
+
+def take(path, max_entries=10000, redis_conn=None):
+    """Write a snapshot of the entries of the hottest cached functions to
+    path, returning the number of entries."""
+    redis_conn = redis_conn or sentinel.slave
+    keys, generation_keys = _scan(redis_conn)
+    entries = []
+    for function in _ranked_functions():
+        function_keys = keys[key_patterns[function]]
+        entries += _read(function_keys[:max_entries - len(entries)],
+                         redis_conn)
+        if len(entries) >= max_entries:
+            break
+    generations = zip(generation_keys, redis_conn.mget(generation_keys)
+                      if generation_keys else [])
+    snapshot = dict(version=SNAPSHOT_VERSION, created=time.time(),
+                    generations=generations, entries=entries)
+    tmp_path = path + '.tmp'
+    with gzip.open(tmp_path, 'wb') as f:
+        pickle.dump(snapshot, f, pickle.HIGHEST_PROTOCOL)
+    os.rename(tmp_path, path)
+    sentinel.master.set(MARKER_KEY, snapshot['created'])
+    return len(entries)
+
+
+def restore(path, redis_conn=None, force=False):
+    """Load the snapshot in path into Redis, returning the number of entries
+    restored (0 if there is no snapshot, or Redis did not lose the cache and
+    force is False)."""
+    redis_conn = redis_conn or sentinel.master
+    if not force and not is_cold(redis_conn):
+        return 0
+    redis_conn.set(MARKER_KEY, time.time())
+    if not os.path.exists(path):
+        return 0
+    with gzip.open(path, 'rb') as f:
+        snapshot = pickle.load(f)
+    if snapshot.get('version') != SNAPSHOT_VERSION:
+        return 0
+    age_ms = int((time.time() - snapshot['created']) * 1000)
+    generations = [(key, generation)
+                   for key, generation in snapshot['generations']
+                   if generation is not None]
+    if generations:
+        keys, values = zip(*generations)
+        args = list(keys) + list(values)
+        if redis_conn.eval(_RESTORE_GENERATIONS_SCRIPT, len(keys), *args):
+            # Entries of the bumped families may be in the local caches
+            _invalidate('*')
+    pipe = redis_conn.pipeline(transaction=False)
+    n_entries = 0
+    for key, ttl, payload in snapshot['entries']:
+        if ttl - age_ms > 0:
+            pipe.set(key, payload, px=ttl - age_ms, nx=True)
+            n_entries += 1
+    pipe.execute()
+    return n_entries
+
+
+def is_cold(redis_conn=None):
+    """Return True if Redis lost the cache since the last snapshot."""
+    redis_conn = redis_conn or sentinel.master
+    return not redis_conn.exists(MARKER_KEY)
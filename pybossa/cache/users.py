@@ -17,8 +17,9 @@
 # along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
 from sqlalchemy.sql import text
 from pybossa.core import db, timeouts
-from pybossa.cache import cache, memoize, delete_memoized
+from pybossa.cache import cache, memoize, delete_memoized, FIVE_MINUTES
 from pybossa.util import pretty_date
+from pybossa.model import isoformat
 from pybossa.model.user import User
 from pybossa.cache.apps import overall_progress, n_tasks, n_volunteers
 import json
@@ -26,7 +27,7 @@ import json
 
 session = db.slave_session
 
-@memoize(timeout=timeouts.get('USER_TIMEOUT'))
+@memoize(timeout=timeouts.get('USER_TIMEOUT'), stale=FIVE_MINUTES)
 def get_leaderboard(n, user_id):
     """Return the top n users with their rank."""
     sql = text('''
@@ -108,7 +109,7 @@ def get_top(n=10):
     for row in results:
         user = dict(id=row.id, name=row.name, fullname=row.fullname,
                     email_addr=row.email_addr,
-                    created=row.created,
+                    created=isoformat(row.created),
                     task_runs=row.task_runs,
                     info=dict(json.loads(row.info)))
         top_users.append(user)
@@ -131,7 +132,7 @@ def get_user_summary(name):
     user = dict()
     for row in results:
         user = dict(id=row.id, name=row.name, fullname=row.fullname,
-                    created=row.created, api_key=row.api_key,
+                    created=isoformat(row.created), api_key=row.api_key,
                     twitter_user_id=row.twitter_user_id,
                     google_user_id=row.google_user_id,
                     facebook_user_id=row.facebook_user_id,
@@ -139,7 +140,7 @@ def get_user_summary(name):
                     email_addr=row.email_addr, n_answers=row.n_answers,
                     valid_email=row.valid_email,
                     confirmation_email_sent=row.confirmation_email_sent,
-                    registered_ago=pretty_date(row.created))
+                    registered_ago=pretty_date(isoformat(row.created)))
     if user:
         rank_score = rank_and_score(user['id'])
         user['rank'] = rank_score['rank']
@@ -307,9 +308,9 @@ def get_users_page(page, per_page=24):
     accounts = []
     for row in results:
         user = dict(id=row.id, name=row.name, fullname=row.fullname,
-                    email_addr=row.email_addr, created=row.created,
+                    email_addr=row.email_addr, created=isoformat(row.created),
                     task_runs=row.task_runs, info=dict(json.loads(row.info)),
-                    registered_ago=pretty_date(row.created))
+                    registered_ago=pretty_date(isoformat(row.created)))
         accounts.append(user)
     return accounts
 
@@ -25,7 +25,8 @@ from pybossa.model.task_run import TaskRun
 
 class Ckan(object):
     def _field_setup(self, obj):
-        int_fields = ['id', 'app_id', 'task_id', 'user_id', 'n_answers', 'timeout',
+        int_fields = ['id', 'app_id', 'task_id', 'user_id', 'n_answers',
+                      'n_task_runs', 'last_task_run_id', 'timeout',
                       'calibration', 'quorum']
         text_fields = ['state', 'user_ip']
         float_fields = ['priority_0']
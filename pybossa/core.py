@@ -48,6 +48,7 @@ def create_app(run_as_server=True):
     setup_markdown(app)
     setup_db(app)
     setup_repositories()
+    setup_schedulers(app)
     setup_exporter(app)
     mail.init_app(app)
     sentinel.init_app(app)
@@ -126,6 +127,8 @@ def setup_db(app):
         options = dict(bind=engine,scopefunc=_app_ctx_stack.__ident_func__)
         slave_session = db.create_scoped_session(options=options)
         return slave_session
+    from pybossa import statements
+    statements.enabled = app.config.get('SQL_PREPARED_STATEMENTS', True)
     db.app = app
     db.init_app(app)
     db.slave_session = create_slave_session(db, bind='slave')
@@ -157,6 +160,12 @@ def setup_repositories():
     auditlog_repo = AuditlogRepository(db)
 
 
+def setup_schedulers(app):
+    """Register the task schedulers added by the deployment."""
+    from pybossa.sched import load_schedulers
+    load_schedulers(app.config)
+
+
 def setup_error_email(app):
     from logging.handlers import SMTPHandler
     ADMINS = app.config.get('ADMINS', '')
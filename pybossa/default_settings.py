@@ -59,8 +59,17 @@ REDIS_SENTINEL = [('localhost', 26379)]
 REDIS_MASTER = 'mymaster'
 REDIS_DB = 0
 
+# Fail fast, without waiting for the socket timeout, after this many Redis
+# connection errors in a row, probing for recovery every few seconds
+REDIS_BREAKER_MAX_FAILURES = 5
+REDIS_BREAKER_RESET_TIMEOUT = 10
+
 REDIS_KEYPREFIX = 'pybossa_cache'
 
+# Snapshot of the hottest cache entries, restored after a flush or failover
+CACHE_SNAPSHOT_PATH = '/tmp/pybossa_cache_snapshot.gz'
+CACHE_SNAPSHOT_MAX_ENTRIES = 10000
+
 ## Default cache timeouts
 # App cache
 APP_TIMEOUT = 15 * 60
@@ -92,6 +101,9 @@ TEMPLATE_TASKS = {
 LIMIT = 300
 PER = 15 * 60
 
+# Send the hot scheduler and counter queries as prepared statements
+SQL_PREPARED_STATEMENTS = True
+
 # Expiration time for password protected project cookies
 PASSWD_COOKIE_TIMEOUT = 60 * 30
 
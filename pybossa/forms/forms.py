@@ -97,6 +97,8 @@ class TaskSchedulerForm(Form):
                         choices=[('default', lazy_gettext('Default')),
                                  ('breadth_first', lazy_gettext('Breadth First')),
                                  ('depth_first', lazy_gettext('Depth First')),
+                                 ('depth_first_pool', lazy_gettext('Depth First (task pool)')),
+                                 ('depth_first_lease', lazy_gettext('Depth First (task leases)')),
                                  ('random', lazy_gettext('Random'))])
 
 
@@ -84,6 +84,12 @@ def get_scheduled_jobs(): # pragma: no cover
         dict(name=warn_old_project_owners, args=[], kwargs={},
              timeout=(10 * MINUTE), queue='low'),
         dict(name=warm_cache, args=[], kwargs={},
+             timeout=(10 * MINUTE), queue='super'),
+        dict(name=update_task_router, args=[], kwargs={},
+             timeout=(10 * MINUTE), queue='super'),
+        dict(name=snapshot_cache, args=[], kwargs={},
+             timeout=(10 * MINUTE), queue='super'),
+        dict(name=update_stats_rollup, args=[], kwargs={},
              timeout=(10 * MINUTE), queue='super')]
     # Create ZIPs for all projects
     zip_jobs = get_export_task_jobs()
@@ -199,6 +205,56 @@ def warm_up_stats(): # pragma: no cover
     return True
 
 
+def refresh_memoized(module, name, args, kwargs):
+    """Background job for recomputing a cached value served stale."""
+    from werkzeug.utils import import_string
+    function = import_string('%s.%s' % (module, name))
+    return function.refresh(*args, **kwargs)
+
+
+def build_volunteers(app_id=None): # pragma: no cover
+    """Background job for building the volunteers sketches of a project, or
+    of the site."""
+    print "Running on the background build_volunteers"
+    from pybossa import volunteers
+    volunteers.build(app_id)
+    return True
+
+
+def update_task_router(): # pragma: no cover
+    """Background job for updating the projects availability of the
+    task router."""
+    print "Running on the background update_task_router"
+    from pybossa.task_router import build_availability
+    build_availability()
+    return True
+
+
+def update_stats_rollup(): # pragma: no cover
+    """Background job for adding the new task runs to the project stats
+    rollups."""
+    print "Running on the background update_stats_rollup"
+    from pybossa import stats_rollup
+    stats_rollup.update()
+    return True
+
+
+def snapshot_cache(): # pragma: no cover
+    """Background job for snapshotting the hottest cache entries, or
+    restoring the last snapshot if Redis lost them (e.g. after a
+    failover)."""
+    from pybossa.cache import snapshot
+    path = current_app.config.get('CACHE_SNAPSHOT_PATH')
+    if snapshot.is_cold():
+        print "Restoring the cache snapshot %s" % path
+        snapshot.restore(path)
+    else:
+        print "Running on the background snapshot_cache"
+        snapshot.take(path,
+                      current_app.config.get('CACHE_SNAPSHOT_MAX_ENTRIES'))
+    return True
+
+
 @with_cache_disabled
 def warm_cache():  # pragma: no cover
     """Background job to warm cache."""
@@ -265,8 +321,8 @@ def get_non_updated_apps():
     from sqlalchemy.sql import text
     from pybossa.model.app import App
     from pybossa.core import db
-    sql = text('''SELECT id FROM app WHERE TO_DATE(updated,
-                'YYYY-MM-DD\THH24:MI:SS.US') <= NOW() - '3 month':: INTERVAL
+    sql = text('''SELECT id FROM app
+               WHERE updated <= (NOW() AT TIME ZONE 'UTC') - '3 month'::INTERVAL
                AND contacted != True LIMIT 25''')
     results = db.slave_session.execute(sql)
     apps = []
@@ -341,8 +397,9 @@ def get_inactive_users_jobs(queue='quaterly'):
     # First users that have participated once but more than 3 months ago
     sql = text('''SELECT user_id FROM task_run
                WHERE user_id IS NOT NULL
-               AND TO_DATE(task_run.finish_time, 'YYYY-MM-DD\THH24:MI:SS.US')
-               <= NOW() - '3 month'::INTERVAL GROUP BY task_run.user_id;''')
+               AND task_run.finish_time
+               <= (NOW() AT TIME ZONE 'UTC') - '3 month'::INTERVAL
+               GROUP BY task_run.user_id;''')
     results = db.slave_session.execute(sql)
     jobs = []
     for row in results:
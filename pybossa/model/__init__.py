@@ -21,8 +21,9 @@ import json
 import uuid
 import requests
 
-from sqlalchemy import Text
-from sqlalchemy.orm import relationship, backref, class_mapper
+from sqlalchemy import Text, DateTime
+from sqlalchemy.orm import relationship, backref, class_mapper, \
+    object_session, Session
 from sqlalchemy.ext.mutable import Mutable
 from sqlalchemy.types import TypeDecorator
 from sqlalchemy import event
@@ -37,6 +38,7 @@ from sqlalchemy.schema import (
 
 import logging
 from time import time
+from redis.exceptions import ConnectionError
 
 
 try:
@@ -151,9 +153,36 @@ class MutableDict(Mutable, dict):
 
 MutableDict.associate_with(JSONEncodedDict)
 
+
+class ISOTimestamp(TypeDecorator):
+    """Represents a UTC timestamp as a native timestamp column, read back as
+    the ISO 8601 string PyBossa has always used (see make_timestamp).
+
+    The column can be indexed and compared as a timestamp by the database,
+    while the domain objects, the API and the exporters keep the strings.
+    """
+
+    impl = DateTime
+
+    def process_bind_param(self, value, dialect):
+        # ISO strings are parsed by the database itself
+        return value
+
+    def process_result_value(self, value, dialect):
+        return isoformat(value)
+
+
+def isoformat(timestamp):
+    """Return a timestamp read with a raw SQL query as the ISO 8601 string of
+    the ISOTimestamp columns."""
+    if isinstance(timestamp, datetime.datetime):
+        # Unlike isoformat(), keeps the microseconds when they are 0
+        return timestamp.strftime('%Y-%m-%dT%H:%M:%S.%f')
+    return timestamp
+
 def make_timestamp():
     now = datetime.datetime.utcnow()
-    return now.isoformat()
+    return isoformat(now)
 
 
 def make_uuid():
@@ -168,6 +197,33 @@ def update_redis(obj):
     p.execute()
 
 
+def after_commit(target, function, *args):
+    """Call function(*args) once the transaction of the session of target is
+    committed, so Redis is not updated with changes that may still be rolled
+    back. It is called at once if target is not in a session."""
+    session = object_session(target)
+    if session is None:
+        return function(*args)
+    session.info.setdefault('pybossa_after_commit', []).append((function,
+                                                                 args))
+
+
+@event.listens_for(Session, 'after_commit')
+def _call_after_commit(session):
+    for function, args in session.info.pop('pybossa_after_commit', []):
+        try:
+            function(*args)
+        except ConnectionError as e:
+            # The transaction is already committed
+            log.warning('%s%r not called after commit: %s',
+                        function.__name__, args, e)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _discard_after_commit(session, previous_transaction):
+    session.info.pop('pybossa_after_commit', None)
+
+
 def update_app_timestamp(mapper, conn, target):
     """Update method to be used by the relationship objects."""
     sql_query = ("update app set updated='%s' where id=%s" %
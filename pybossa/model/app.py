@@ -17,13 +17,14 @@
 # along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
 
 from sqlalchemy import Integer, Boolean, Unicode, Float, UnicodeText, Text
-from sqlalchemy.schema import Column, ForeignKey
+from sqlalchemy.schema import Column, ForeignKey, Index
 from sqlalchemy.orm import relationship, backref
 from sqlalchemy import event
 
 
 from pybossa.core import db, signer
-from pybossa.model import DomainObject, JSONType, JSONEncodedDict, make_timestamp, update_redis
+from pybossa.model import DomainObject, JSONType, JSONEncodedDict, ISOTimestamp, \
+    make_timestamp, update_redis
 from pybossa.model.task import Task
 from pybossa.model.task_run import TaskRun
 from pybossa.model.category import Category
@@ -39,9 +40,9 @@ class App(db.Model, DomainObject):
     #: ID of the project
     id = Column(Integer, primary_key=True)
     #: UTC timestamp when the project is created
-    created = Column(Text, default=make_timestamp)
+    created = Column(ISOTimestamp, default=make_timestamp)
     #: UTC timestamp when the project is updated (or any of its relationships)
-    updated = Column(Text, default=make_timestamp, onupdate=make_timestamp)
+    updated = Column(ISOTimestamp, default=make_timestamp, onupdate=make_timestamp)
     #: Project name
     name = Column(Unicode(length=255), unique=True, nullable=False)
     #: Project slug for the URL
@@ -81,6 +82,9 @@ class App(db.Model, DomainObject):
     category = relationship(Category)
     blogposts = relationship(Blogpost, cascade='all, delete-orphan', backref='app')
 
+    # Lets the jobs find the projects not updated for months
+    __table_args__ = (Index('app_updated_idx', 'updated'),)
+
     def needs_password(self):
         return self.get_passwd_hash() is not None
 
@@ -0,0 +1,68 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2015 SF Isle of Man Limited
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+
+from sqlalchemy import Integer, Text, Date, Boolean
+from sqlalchemy.schema import Column
+
+from pybossa.core import db
+from pybossa.model import DomainObject
+
+
+class ProjectStatsDay(db.Model, DomainObject):
+    '''Number of task runs of a project per day, for anonymous and
+    authenticated users.'''
+
+    __tablename__ = 'project_stats_day'
+
+    #: App.id
+    app_id = Column(Integer, primary_key=True, autoincrement=False)
+    #: Day the task runs were finished (UTC)
+    day = Column(Date, primary_key=True)
+    #: Whether the task runs were sent by anonymous users
+    anonymous = Column(Boolean, primary_key=True)
+    #: Number of task runs
+    n_task_runs = Column(Integer, nullable=False, default=0)
+
+
+class ProjectStatsHour(db.Model, DomainObject):
+    '''Number of task runs of a project per hour of the day, for anonymous
+    and authenticated users.'''
+
+    __tablename__ = 'project_stats_hour'
+
+    #: App.id
+    app_id = Column(Integer, primary_key=True, autoincrement=False)
+    #: Hour of the day (0-23, UTC) the task runs were finished
+    hour = Column(Integer, primary_key=True, autoincrement=False)
+    #: Whether the task runs were sent by anonymous users
+    anonymous = Column(Boolean, primary_key=True)
+    #: Number of task runs
+    n_task_runs = Column(Integer, nullable=False, default=0)
+
+
+class StatsRollupMark(db.Model, DomainObject):
+    '''High-water mark of the task runs already added to the rollups.'''
+
+    __tablename__ = 'stats_rollup_mark'
+
+    #: Name of the rolled up table
+    name = Column(Text, primary_key=True)
+    #: The task runs up to this id are in the rollups
+    last_id = Column(Integer, nullable=False, default=0)
+    #: Max task_run.id seen by the previous update, rolled up by the next one
+    pending_id = Column(Integer, nullable=False, default=0)
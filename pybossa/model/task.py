@@ -17,14 +17,16 @@
 # along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
 
 from sqlalchemy import Integer, Boolean, Float, UnicodeText, Text
-from sqlalchemy.schema import Column, ForeignKey
+from sqlalchemy.schema import Column, ForeignKey, Index
 from sqlalchemy.orm import relationship, backref
 from sqlalchemy import event
 
 from pybossa.core import db
 from pybossa.model import DomainObject, JSONType, JSONEncodedDict, \
-    make_timestamp, update_redis, update_app_timestamp
+    ISOTimestamp, make_timestamp, update_redis, update_app_timestamp, \
+    after_commit
 from pybossa.model.task_run import TaskRun
+from pybossa import task_pool
 
 
 
@@ -39,7 +41,7 @@ class Task(db.Model, DomainObject):
     #: Task.ID
     id = Column(Integer, primary_key=True)
     #: UTC timestamp when the task was created.
-    created = Column(Text, default=make_timestamp)
+    created = Column(ISOTimestamp, default=make_timestamp)
     #: Project.ID that this task is associated with.
     app_id = Column(Integer, ForeignKey('app.id', ondelete='CASCADE'), nullable=False)
     #: Task.state: ongoing or completed.
@@ -53,14 +55,29 @@ class Task(db.Model, DomainObject):
     info = Column(JSONType, default=dict)
     #: Number of answers to collect for this task.
     n_answers = Column(Integer, default=30)
+    #: Number of answers (TaskRuns) collected for this task.
+    n_task_runs = Column(Integer, default=0, nullable=False)
+    #: TaskRun.ID of the last answer submitted for this task.
+    last_task_run_id = Column(Integer)
+    #: UTC timestamp when the task was completed (finish_time of its
+    #: n_answers-th answer).
+    completed_at = Column(ISOTimestamp)
 
     task_runs = relationship(TaskRun, cascade='all, delete, delete-orphan', backref='task')
 
+    # Lets the breadth first scheduler read the open tasks of a project
+    # sorted by their number of answers with an index range scan
+    __table_args__ = (Index('task_app_id_n_task_runs_idx',
+                            'app_id', 'n_task_runs', 'id'),
+                      # Lets the stats count the tasks completed per day
+                      Index('task_app_id_completed_at_idx',
+                            'app_id', 'completed_at'))
+
 
     def pct_status(self):
         """Returns the percentage of Tasks that are completed"""
         if self.n_answers != 0 and self.n_answers is not None:
-            return float(len(self.task_runs)) / self.n_answers
+            return float(self.n_task_runs or 0) / self.n_answers
         else:  # pragma: no cover
             return float(0)
 
@@ -87,3 +104,20 @@ def add_event(mapper, conn, target):
 def update_app(mapper, conn, target):
     """Update app updated timestamp."""
     update_app_timestamp(mapper, conn, target)
+
+
+@event.listens_for(Task, 'after_insert')
+@event.listens_for(Task, 'after_update')
+def update_task_pool(mapper, conn, target):
+    """Add, reprioritise or remove the task in the project's task pool."""
+    if target.state == 'completed':
+        after_commit(target, task_pool.remove_task, target.app_id, target.id)
+    else:
+        after_commit(target, task_pool.add_task, target.app_id, target.id,
+                     target.priority_0)
+
+
+@event.listens_for(Task, 'after_delete')
+def remove_from_task_pool(mapper, conn, target):
+    """Remove the deleted task from the project's task pool."""
+    after_commit(target, task_pool.remove_task, target.app_id, target.id)
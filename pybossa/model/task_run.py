@@ -18,13 +18,16 @@
 
 from datetime import datetime
 from sqlalchemy import Integer, Text
-from sqlalchemy.schema import Column, ForeignKey
+from sqlalchemy.sql import text
+from sqlalchemy.schema import Column, ForeignKey, Index
 from sqlalchemy import event
 from rq import Queue
 
 from pybossa.core import db, sentinel
-from pybossa.model import DomainObject, JSONType, make_timestamp, update_redis, \
-    update_app_timestamp, webhook
+from pybossa.model import DomainObject, JSONType, ISOTimestamp, \
+    make_timestamp, update_redis, update_app_timestamp, webhook, after_commit
+from pybossa import task_pool, answered_tasks, volunteers, trending, \
+    stats_rollup
 
 
 webhook_queue = Queue('high', connection=sentinel.master)
@@ -38,7 +41,7 @@ class TaskRun(db.Model, DomainObject):
     #: ID of the TaskRun
     id = Column(Integer, primary_key=True)
     #: UTC timestamp for when TaskRun is created.
-    created = Column(Text, default=make_timestamp)
+    created = Column(ISOTimestamp, default=make_timestamp)
     #: Project.id of the project associated with this TaskRun.
     app_id = Column(Integer, ForeignKey('app.id'), nullable=False)
     #: Task.id of the task associated with this TaskRun.
@@ -48,7 +51,7 @@ class TaskRun(db.Model, DomainObject):
     user_id = Column(Integer, ForeignKey('user.id'))
     #: User.ip of the user contributing the TaskRun (only if anonymous)
     user_ip = Column(Text)
-    finish_time = Column(Text, default=make_timestamp)
+    finish_time = Column(ISOTimestamp, default=make_timestamp)
     timeout = Column(Integer)
     calibration = Column(Integer)
     #: Value of the answer.
@@ -61,6 +64,13 @@ class TaskRun(db.Model, DomainObject):
         }
     '''
 
+    __table_args__ = (Index('task_run_finish_time_idx', 'finish_time'),
+                      # Lets the listings find the last activity of a project
+                      Index('task_run_app_id_finish_time_idx',
+                            'app_id', 'finish_time'),
+                      # Lets the task run events find the last run of a task
+                      Index('task_run_task_id_idx', 'task_id'))
+
 
 @event.listens_for(TaskRun, 'after_insert')
 def update_task_state(mapper, conn, target):
@@ -96,17 +106,20 @@ def update_task_state(mapper, conn, target):
                        action_updated='UserContribution')
         # Add the event
         update_redis(obj)
-    # Check if Task.state should be updated
-    sql_query = ('select count(id) from task_run \
-                 where task_run.task_id=%s') % target.task_id
-    n_answers = conn.scalar(sql_query)
-    sql_query = ('select n_answers from task \
-                 where task.id=%s') % target.task_id
-    task_n_answers = conn.scalar(sql_query)
+    # Count the answer, and check if Task.state should be updated
+    sql_query = ('UPDATE task SET n_task_runs=n_task_runs + 1, \
+                 last_task_run_id=%s where id=%s \
+                 RETURNING n_task_runs, n_answers') % (target.id, target.task_id)
+    n_answers, task_n_answers = conn.execute(sql_query).first()
     if (n_answers) >= task_n_answers:
-        sql_query = ("UPDATE task SET state=\'completed\' \
-                     where id=%s") % target.task_id
-        conn.execute(sql_query)
+        sql_query = text('''UPDATE task SET state='completed',
+                         completed_at=COALESCE(completed_at, :completed_at)
+                         WHERE id=:task_id''')
+        conn.execute(sql_query, dict(
+            completed_at=target.finish_time or make_timestamp(),
+            task_id=target.task_id))
+        after_commit(target, task_pool.remove_task, target.app_id,
+                     target.task_id)
         update_redis(app_obj)
         # PUSH changes via the webhook
         if app_obj['webhook']:
@@ -119,8 +132,60 @@ def update_task_state(mapper, conn, target):
 
 
 
+@event.listens_for(TaskRun, 'after_delete')
+def decrease_task_n_task_runs(mapper, conn, target):
+    """Discount the deleted answer from task.n_task_runs, and point
+    task.last_task_run_id to the previous answer if it was the last one."""
+    sql_query = ('UPDATE task SET n_task_runs=GREATEST(n_task_runs - 1, 0), \
+                 last_task_run_id=CASE WHEN last_task_run_id=%(id)s THEN \
+                 (SELECT MAX(id) FROM task_run WHERE task_id=%(task_id)s \
+                 AND id != %(id)s) ELSE last_task_run_id END \
+                 where id=%(task_id)s') % dict(id=target.id,
+                                               task_id=target.task_id)
+    conn.execute(sql_query)
+
+
+@event.listens_for(TaskRun, 'after_delete')
+def remove_from_stats_rollup(mapper, conn, target):
+    """Discount the deleted answer from the contributions rollups."""
+    stats_rollup.remove(conn, target)
+
+
 @event.listens_for(TaskRun, 'after_insert')
 @event.listens_for(TaskRun, 'after_update')
 def update_app(mapper, conn, target):
     """Update app updated timestamp."""
     update_app_timestamp(mapper, conn, target)
+
+
+@event.listens_for(TaskRun, 'after_insert')
+def add_answered_task(mapper, conn, target):
+    """Add the task to the set of tasks answered by the user."""
+    answered_tasks.add_answer(target.app_id, target.task_id,
+                              target.user_id, target.user_ip)
+
+
+@event.listens_for(TaskRun, 'after_delete')
+def remove_answered_task(mapper, conn, target):
+    """Remove the task from the set of tasks answered by the user."""
+    answered_tasks.remove_answer(target.app_id, target.task_id,
+                                 target.user_id, target.user_ip)
+
+
+@event.listens_for(TaskRun, 'after_insert')
+def add_volunteer(mapper, conn, target):
+    """Add the user to the volunteers sketches of the project."""
+    volunteers.add_volunteer(target.app_id, target.user_id, target.user_ip)
+
+
+@event.listens_for(TaskRun, 'after_delete')
+def reset_volunteers(mapper, conn, target):
+    """Count the volunteers of the project again, without the deleted
+    answer."""
+    volunteers.reset(target.app_id)
+
+
+@event.listens_for(TaskRun, 'after_insert')
+def add_trending_contribution(mapper, conn, target):
+    """Count the answer in the rankings of the last 24 hours."""
+    trending.add_contribution(target.app_id, target.user_id)
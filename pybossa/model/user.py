@@ -17,13 +17,14 @@
 # along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
 
 from sqlalchemy import Integer, Boolean, Unicode, Text, String, BigInteger
-from sqlalchemy.schema import Column, ForeignKey
+from sqlalchemy.schema import Column, ForeignKey, Index
 from sqlalchemy.orm import relationship, backref
 from sqlalchemy import event
 from flask.ext.login import UserMixin
 
 from pybossa.core import db, signer
-from pybossa.model import DomainObject, make_timestamp, JSONEncodedDict, make_uuid, update_redis
+from pybossa.model import DomainObject, make_timestamp, JSONEncodedDict, \
+    ISOTimestamp, make_uuid, update_redis
 from pybossa.model.app import App
 from pybossa.model.task_run import TaskRun
 from pybossa.model.blogpost import Blogpost
@@ -38,7 +39,7 @@ class User(db.Model, DomainObject, UserMixin):
 
     id = Column(Integer, primary_key=True)
     #: UTC timestamp of the user when it's created.
-    created = Column(Text, default=make_timestamp)
+    created = Column(ISOTimestamp, default=make_timestamp)
     email_addr = Column(Unicode(length=254), unique=True, nullable=False)
     #: Name of the user (this is used as the nickname).
     name = Column(Unicode(length=254), unique=True, nullable=False)
@@ -67,6 +68,9 @@ class User(db.Model, DomainObject, UserMixin):
     apps = relationship(App, backref='owner')
     blogposts = relationship(Blogpost, backref='owner')
 
+    # Lets the users page list the latest users first
+    __table_args__ = (Index('user_created_idx', 'created'),)
+
 
     def get_id(self):
         '''id for login system. equates to name'''
@@ -28,6 +28,7 @@ import time
 from functools import update_wrapper, wraps
 from flask import request, g
 from werkzeug.exceptions import TooManyRequests
+from redis.exceptions import ConnectionError
 from pybossa.core import sentinel
 from pybossa.error import ErrorStatus
 
@@ -40,7 +41,8 @@ class RateLimit(object):
     Limit the number of requests.
 
     It uses a Redis pipe from the master node (configured via Sentinel) to
-    limit the number of requests.
+    limit the number of requests. While Redis is not available, the requests
+    are counted in the memory of the worker instead.
 
     """
 
@@ -53,16 +55,37 @@ class RateLimit(object):
         self.per = per
         self.send_x_headers = send_x_headers
 
-        p = sentinel.master.pipeline()
-        p.incr(self.key)
-        p.expireat(self.key, self.reset + self.expiration_window)
+        try:
+            p = sentinel.master.pipeline()
+            p.incr(self.key)
+            p.expireat(self.key, self.reset + self.expiration_window)
+            current = p.execute()[0]
+        except ConnectionError:
+            current = _local_incr(self.key,
+                                  self.reset + self.expiration_window)
 
-        self.current = min(p.execute()[0], limit)
+        self.current = min(current, limit)
 
     remaining = property(lambda x: x.limit - x.current)
     over_limit = property(lambda x: x.current >= x.limit)
 
 
+# Counters used while Redis is not available: key -> [count, expireat]
+_local_counters = {}
+
+
+def _local_incr(key, expireat):
+    """Increase a counter of this worker, dropping the expired ones."""
+    if key not in _local_counters:
+        now = time.time()
+        for expired in [k for k, (count, at) in _local_counters.items()
+                        if at < now]:
+            _local_counters.pop(expired, None)
+        _local_counters[key] = [0, expireat]
+    _local_counters[key][0] += 1
+    return _local_counters[key][0]
+
+
 def get_view_rate_limit():
     """Return the rate limit values."""
     return getattr(g, '_view_rate_limit', None)
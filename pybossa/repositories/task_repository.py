@@ -22,6 +22,7 @@ from sqlalchemy.exc import IntegrityError
 from pybossa.model.task import Task
 from pybossa.model.task_run import TaskRun
 from pybossa.exc import WrongObjectError, DBIntegrityError
+from pybossa import task_pool
 
 
 
@@ -109,23 +110,17 @@ class TaskRepository(object):
         Use raw SQL for performance"""
         sql = text('''
                    UPDATE task SET n_answers=:n_answers,
-                   state='ongoing' WHERE app_id=:app_id''')
-        self.db.session.execute(sql, dict(n_answers=n_answer, app_id=project.id))
-        # Update task.state according to their new n_answers value
-        sql = text('''
-                   WITH project_tasks AS (
-                   SELECT task.id, task.n_answers,
-                   COUNT(task_run.id) AS n_task_runs, task.state
-                   FROM task, task_run
-                   WHERE task_run.task_id=task.id AND task.app_id=:app_id
-                   GROUP BY task.id)
-                   UPDATE task SET state='completed'
-                   FROM project_tasks
-                   WHERE (project_tasks.n_task_runs >=:n_answers)
-                   and project_tasks.id=task.id
-                   ''')
+                   state=CASE WHEN n_task_runs >= :n_answers
+                   THEN 'completed' ELSE 'ongoing' END,
+                   completed_at=CASE WHEN n_task_runs >= :n_answers
+                   THEN (SELECT finish_time FROM task_run
+                         WHERE task_id=task.id ORDER BY id
+                         LIMIT 1 OFFSET :n_answers - 1)
+                   ELSE NULL END
+                   WHERE app_id=:app_id''')
         self.db.session.execute(sql, dict(n_answers=n_answer, app_id=project.id))
         self.db.session.commit()
+        task_pool.delete_pool(project.id)
 
 
     def _validate_can_be(self, action, element):
@@ -19,111 +19,331 @@
 #import json
 #from flask import Blueprint, request, url_for, flash, redirect, abort
 #from flask import abort, request, make_response, current_app
-from sqlalchemy.sql import text
-from pybossa.model.app import App
 from pybossa.model.task import Task
 from pybossa.model.task_run import TaskRun
 from pybossa.core import db
+from pybossa import task_pool, answered_tasks, task_leases, sched_stats
+from pybossa.statements import Statement
+from redis.exceptions import ConnectionError
+from werkzeug.utils import import_string
+import pkg_resources
 import random
+import threading
+import time
 
 
 
 session = db.slave_session
 
+# Number of candidate tasks the lease scheduler tries to get a lease for
+LEASE_CANDIDATES = 50
+# Number of random picks from the task pool before falling back to a scan
+RANDOM_ATTEMPTS = 10
+# Number of candidate tasks read at a time, checking them against the tasks
+# answered by the user
+PAGE_SIZE = 100
+
+# Registered schedulers: name -> dict(task=function, tasks=batch function)
+schedulers = {}
+
+# Number of candidate tasks considered by the current scheduler call
+_calls = threading.local()
+
+# The candidate statements are read a page at a time, each page starting
+# after the sort key of the last row of the previous one
+_breadth_first_sql = Statement('sched_breadth_first', '''
+    SELECT id, n_task_runs, n_answers FROM task
+    WHERE app_id=:app_id AND state !='completed' AND n_task_runs < n_answers
+    AND (n_task_runs, id) > (:last_n_task_runs, :last_id)
+    ORDER BY n_task_runs, id ASC LIMIT :limit''')
+
+# Tasks without priority_0 are sorted as 0, like in the task pool
+_candidate_task_ids_sql = Statement('sched_candidate_task_ids', '''
+    SELECT id, COALESCE(priority_0, 0) AS priority_0 FROM task
+    WHERE app_id=:app_id AND state !='completed'
+    AND (COALESCE(priority_0, 0) < :last_priority_0
+         OR (COALESCE(priority_0, 0) = :last_priority_0 AND id > :last_id))
+    ORDER BY COALESCE(priority_0, 0) DESC, id ASC LIMIT :limit''')
+
+_remaining_answers_sql = Statement('sched_remaining_answers', '''
+    SELECT id, n_answers - n_task_runs AS remaining FROM task
+    WHERE id = ANY(:task_ids)''')
+
+
+def register_scheduler(name, get_task, get_tasks=None):
+    """Register a task scheduler.
+
+    get_task(app_id, user_id, user_ip, offset=0) returns a task or None, and
+    the optional get_tasks(app_id, user_id, user_ip, n=1) returns a list with
+    up to n tasks computed in a single pass.
+    """
+    schedulers[name] = dict(task=get_task, tasks=get_tasks)
+
+
+def load_schedulers(config):
+    """Register the schedulers added through the SCHEDULERS setting and the
+    pybossa.schedulers setuptools entry points.
+
+    SCHEDULERS maps each name to the import path of its get_task function,
+    or to a (get_task, get_tasks) pair of import paths.
+    """
+    for name, paths in config.get('SCHEDULERS', {}).iteritems():
+        if isinstance(paths, basestring):
+            paths = (paths, None)
+        get_task, get_tasks = paths
+        register_scheduler(name, import_string(get_task),
+                           import_string(get_tasks) if get_tasks else None)
+    for entry_point in pkg_resources.iter_entry_points('pybossa.schedulers'):
+        register_scheduler(entry_point.name, entry_point.load())
+
+
+def count_candidates(n):
+    """Add n to the candidate tasks considered by the current scheduler call.
+    Schedulers call it so their candidate counts show up in the stats."""
+    _calls.candidates = getattr(_calls, 'candidates', 0) + n
+
+
+def _get_scheduler(sched):
+    if sched not in schedulers:
+        sched = 'default'
+    return sched, schedulers[sched]
+
+
+def _instrumented(sched, app_id, function, *args, **kwargs):
+    """Call a scheduler function recording its stats. Returns the result of
+    the call, and the number of tasks in it."""
+    _calls.candidates = 0
+    start = time.time()
+    result = function(app_id, *args, **kwargs)
+    latency = (time.time() - start) * 1000
+    if isinstance(result, list):
+        n_tasks = len(result)
+    else:
+        n_tasks = 0 if result is None else 1
+    sched_stats.record(sched, app_id, latency, _calls.candidates, n_tasks)
+    return result
+
+
 def new_task(app_id, sched, user_id=None, user_ip=None, offset=0):
     '''Get a new task by calling the appropriate scheduler function.
     '''
-    sched_map = {
-        'default': get_depth_first_task,
-        'breadth_first': get_breadth_first_task,
-        'depth_first': get_depth_first_task,
-        'random': get_random_task,
-        'incremental': get_incremental_task}
-    scheduler = sched_map.get(sched, sched_map['default'])
-    return scheduler(app_id, user_id, user_ip, offset=offset)
+    sched, scheduler = _get_scheduler(sched)
+    return _instrumented(sched, app_id, scheduler['task'], user_id, user_ip,
+                         offset=offset)
+
+
+def new_tasks(app_id, sched, user_id=None, user_ip=None, n=1):
+    '''Get up to n new tasks in a single pass of the appropriate scheduler.
+
+    Schedulers without a batch version (like random and incremental) return
+    at most one task.
+    '''
+    sched, scheduler = _get_scheduler(sched)
+    if scheduler['tasks'] is None:
+        task = _instrumented(sched, app_id, scheduler['task'], user_id,
+                             user_ip)
+        return [task] if task is not None else []
+    return _instrumented(sched, app_id, scheduler['tasks'], user_id, user_ip,
+                         n=n)
 
 
 def get_breadth_first_task(app_id, user_id=None, user_ip=None, n_answers=30, offset=0):
     """Gets a new task which have the least number of task runs (excluding the
     current user).
 
-    Note that it **ignores** the number of answers limit for efficiency reasons
-    (this is not a big issue as all it means is that you may end up with some
-    tasks run more than is strictly needed!)
+    Tasks are leased like in the depth_first_lease scheduler, so the number
+    of answers limit is respected even with many volunteers at the same time.
     """
-    # Uncomment the next three lines to profile the sched function
-    #import timeit
-    #T = timeit.Timer(lambda: get_candidate_tasks(app_id, user_id,
-    #                  user_ip, n_answers))
-    #print "First algorithm: %s" % T.timeit(number=1)
-    if user_id and not user_ip:
-        sql = text('''
-                   SELECT task.id, COUNT(task_run.task_id) AS taskcount FROM task
-                   LEFT JOIN task_run ON (task.id = task_run.task_id) WHERE NOT EXISTS
-                   (SELECT 1 FROM task_run WHERE app_id=:app_id AND
-                   user_id=:user_id AND task_id=task.id)
-                   AND task.app_id=:app_id AND task.state !='completed'
-                   group by task.id ORDER BY taskcount, id ASC LIMIT 10;
-                   ''')
-        tasks = session.execute(sql, dict(app_id=app_id, user_id=user_id))
-    else:
-        if not user_ip: # pragma: no cover
-            user_ip = '127.0.0.1'
-        sql = text('''
-                   SELECT task.id, COUNT(task_run.task_id) AS taskcount FROM task
-                   LEFT JOIN task_run ON (task.id = task_run.task_id) WHERE NOT EXISTS
-                   (SELECT 1 FROM task_run WHERE app_id=:app_id AND
-                   user_ip=:user_ip AND task_id=task.id)
-                   AND task.app_id=:app_id AND task.state !='completed'
-                   group by task.id ORDER BY taskcount, id ASC LIMIT 10;
-                   ''')
-
-        # results will be list of (taskid, count)
-        tasks = session.execute(sql, dict(app_id=app_id, user_ip=user_ip))
-    # ignore n_answers for the present - we will just keep going once we've
-    # done as many as we need
-    tasks = [x[0] for x in tasks]
-    if tasks:
-        if (offset == 0):
-            return session.query(Task).get(tasks[0])
-        else:
-            if (offset < len(tasks)):
-                return session.query(Task).get(tasks[offset])
-            else:
-                return None
-    else: # pragma: no cover
-        return None
+    tasks = get_breadth_first_tasks(app_id, user_id, user_ip, n_answers,
+                                    offset=offset)
+    return tasks[0] if tasks else None
+
+
+def get_breadth_first_tasks(app_id, user_id=None, user_ip=None, n_answers=30,
+                            offset=0, n=1):
+    """Gets up to n tasks in breadth first order, getting a lease for each of
+    them.
+
+    Candidates are sorted by their answers plus the leases held by other
+    users, so tasks being answered right now are not handed out again until
+    the rest of tasks catch up, and tasks whose remaining answers are all
+    leased are skipped. Candidates are read a page at a time until enough
+    leases are granted or there are no candidates left.
+    """
+    task_ids = []
+    for rows in _unanswered_pages(_breadth_first_sql, _breadth_first_key,
+                                  app_id, user_id, user_ip,
+                                  offset + n + LEASE_CANDIDATES):
+        leases = task_leases.count_leases([row.id for row in rows],
+                                          user_id, user_ip)
+        rows.sort(key=lambda row: (row.n_task_runs + leases[row.id], row.id))
+        budgets = [(row.id, row.n_answers - row.n_task_runs) for row in rows]
+        leased, offset = task_leases.acquire_page(budgets, n - len(task_ids),
+                                                  offset, user_id, user_ip)
+        task_ids += leased
+        if len(task_ids) == n:
+            break
+    return _get_tasks(task_ids)
 
 
 def get_depth_first_task(app_id, user_id=None, user_ip=None, n_answers=30, offset=0):
     """Gets a new task for a given project"""
-    # Uncomment the next three lines to profile the sched function
-    #import timeit
-    #T = timeit.Timer(lambda: get_candidate_tasks(app_id, user_id,
-    #                  user_ip, n_answers))
-    #print "First algorithm: %s" % T.timeit(number=1)
-    candidate_tasks = get_candidate_tasks(app_id, user_id, user_ip, n_answers, offset=offset)
-    total_remaining = len(candidate_tasks)
-    #print "Available tasks %s " % total_remaining
-    if total_remaining == 0:
-        return None
-    if (offset == 0):
-        return candidate_tasks[0]
-    else:
-        if (offset < len(candidate_tasks)):
-            return candidate_tasks[offset]
-        else:
-            return None
+    task_ids = _candidate_task_ids(app_id, user_id, user_ip)
+    if offset < len(task_ids):
+        return session.query(Task).get(task_ids[offset])
+    return None
+
+
+def get_depth_first_tasks(app_id, user_id=None, user_ip=None, n_answers=30, n=1):
+    """Gets up to n tasks in depth first order with a single query"""
+    return _get_tasks(_candidate_task_ids(app_id, user_id, user_ip, limit=n))
+
+
+def get_depth_first_pool_task(app_id, user_id=None, user_ip=None, n_answers=30,
+                              offset=0):
+    """Gets a new task for a given project in depth first order, reading the
+    candidates from the Redis task pool instead of scanning the task table"""
+    tasks = get_depth_first_pool_tasks(app_id, user_id, user_ip, n_answers,
+                                       offset=offset)
+    return tasks[0] if tasks else None
+
+
+def get_depth_first_pool_tasks(app_id, user_id=None, user_ip=None, n_answers=30,
+                               offset=0, n=1):
+    """Gets up to n tasks from the Redis task pool, skipping the first offset
+    available ones. If Redis is not available, they are read from the task
+    table instead"""
+    try:
+        return _get_pool_tasks(app_id, user_id, user_ip, offset, n)
+    except ConnectionError:
+        task_ids = _candidate_task_ids(app_id, user_id, user_ip,
+                                       limit=offset + n)
+        return _get_tasks(task_ids[offset:])
+
+
+def _get_pool_tasks(app_id, user_id, user_ip, offset, n):
+    window = max(offset + n, PAGE_SIZE)
+    start = 0
+    tasks = []
+    while len(tasks) < n:
+        task_ids = task_pool.get_task_ids(app_id, start, start + window - 1)
+        if not task_ids:
+            break
+        count_candidates(len(task_ids))
+        unanswered = set(answered_tasks.filter_unanswered(
+            app_id, task_ids, user_id, user_ip))
+        candidates = []
+        consumed = 0
+        for task_id in task_ids:
+            if len(tasks) + len(candidates) == n:
+                break
+            consumed += 1
+            if task_id not in unanswered:
+                continue
+            if offset > 0:
+                offset -= 1
+                continue
+            candidates.append(task_id)
+        fetched = dict((task.id, task) for task in _get_tasks(candidates))
+        removed = 0
+        for task_id in candidates:
+            task = fetched.get(task_id)
+            if task is None or task.state == 'completed':
+                # The pool is out of date for this task
+                task_pool.remove_task(app_id, task_id)
+                removed += 1
+                continue
+            tasks.append(task)
+        start += consumed - removed
+    return tasks
+
+
+def get_depth_first_lease_task(app_id, user_id=None, user_ip=None,
+                               n_answers=30, offset=0):
+    """Gets a new task in depth first order holding a lease on it, so a task
+    is never handed out to more volunteers than answers it still needs"""
+    tasks = get_depth_first_lease_tasks(app_id, user_id, user_ip, n_answers,
+                                        offset=offset)
+    return tasks[0] if tasks else None
+
+
+def get_depth_first_lease_tasks(app_id, user_id=None, user_ip=None,
+                                n_answers=30, offset=0, n=1):
+    """Gets up to n tasks in depth first order, getting a lease for each of
+    them. Tasks whose remaining answers are all leased are skipped"""
+    task_ids = []
+    for rows in _unanswered_pages(_candidate_task_ids_sql, _candidate_key,
+                                  app_id, user_id, user_ip,
+                                  offset + n + LEASE_CANDIDATES):
+        remaining = _remaining_answers([row.id for row in rows])
+        budgets = [(row.id, remaining.get(row.id, 0)) for row in rows]
+        leased, offset = task_leases.acquire_page(budgets, n - len(task_ids),
+                                                  offset, user_id, user_ip)
+        task_ids += leased
+        if len(task_ids) == n:
+            break
+    return _get_tasks(task_ids)
 
 
 def get_random_task(app_id, user_id=None, user_ip=None, n_answers=30, offset=0):
-    """Returns a random task for the user"""
-    app = session.query(App).get(app_id)
-    from random import choice
-    if len(app.tasks) > 0:
-        return choice(app.tasks)
-    else:
+    """Returns a random open task the user has not answered yet.
+
+    A position of the Redis task pool is picked uniformly at random, and
+    rejected if the user has already answered that task. If the user has
+    answered most of the pool, the task is chosen among the remaining ones,
+    reading the pool a window at a time from a random window. If Redis is
+    not available, the task is chosen among the first candidates of the task
+    table.
+    """
+    try:
+        return _get_random_pool_task(app_id, user_id, user_ip)
+    except ConnectionError:
+        task_ids = _candidate_task_ids(app_id, user_id, user_ip,
+                                       limit=PAGE_SIZE)
+        if not task_ids:
+            return None
+        return session.query(Task).get(random.choice(task_ids))
+
+
+def _get_random_pool_task(app_id, user_id, user_ip):
+    for attempt in range(RANDOM_ATTEMPTS):
+        n_tasks = task_pool.count_tasks(app_id)
+        if n_tasks <= 0:
+            return None
+        position = random.randrange(n_tasks)
+        task_ids = task_pool.get_task_ids(app_id, position, position)
+        count_candidates(len(task_ids))
+        if not answered_tasks.filter_unanswered(app_id, task_ids, user_id,
+                                                user_ip):
+            continue
+        task = _get_open_pool_task(app_id, task_ids[0])
+        if task is not None:
+            return task
+    n_windows = (task_pool.count_tasks(app_id) + PAGE_SIZE - 1) // PAGE_SIZE
+    if n_windows <= 0:
         return None
+    window = random.randrange(n_windows)
+    for i in range(n_windows):
+        start = ((window + i) % n_windows) * PAGE_SIZE
+        task_ids = task_pool.get_task_ids(app_id, start, start + PAGE_SIZE - 1)
+        count_candidates(len(task_ids))
+        task_ids = answered_tasks.filter_unanswered(app_id, task_ids,
+                                                    user_id, user_ip)
+        random.shuffle(task_ids)
+        for task_id in task_ids:
+            task = _get_open_pool_task(app_id, task_id)
+            if task is not None:
+                return task
+    return None
+
+
+def _get_open_pool_task(app_id, task_id):
+    task = session.query(Task).get(task_id)
+    if task is None or task.state == 'completed':
+        # The pool is out of date for this task
+        task_pool.remove_task(app_id, task_id)
+        return None
+    return task
 
 
 def get_incremental_task(app_id, user_id=None, user_ip=None, n_answers=30, offset=0):
@@ -132,48 +352,119 @@ def get_incremental_task(app_id, user_id=None, user_ip=None, n_answers=30, offse
     It is an important strategy when dealing with large tasks, as
     transcriptions.
     """
-    candidate_tasks = get_candidate_tasks(app_id, user_id, user_ip,
-                                          n_answers, offset=0)
-    total_remaining = len(candidate_tasks)
-    if total_remaining == 0:
+    # Lock the task with a single lease (GitHub #53), as only one volunteer
+    # at a time can build on its last answer
+    for rows in _unanswered_pages(_candidate_task_ids_sql, _candidate_key,
+                                  app_id, user_id, user_ip,
+                                  LEASE_CANDIDATES):
+        random.shuffle(rows)
+        leased = task_leases.acquire_many([(row.id, 1) for row in rows], 1,
+                                          user_id=user_id, user_ip=user_ip)
+        if leased:
+            task_id = leased[0]
+            break
+    else:
         return None
-    rand = random.randrange(0, total_remaining)
-    task = candidate_tasks[rand]
-    #Find last answer for the task
-    q = session.query(TaskRun)\
-          .filter(TaskRun.task_id == task.id)\
-          .order_by(TaskRun.finish_time.desc())
-    last_task_run = q.first()
-    if last_task_run:
-        task.info['last_answer'] = last_task_run.info
-        #TODO: As discussed in GitHub #53
-        # it is necessary to create a lock in the task!
+    # Get the task and its last answer in a single query
+    result = session.query(Task, TaskRun.info)\
+          .outerjoin(TaskRun, TaskRun.id == Task.last_task_run_id)\
+          .filter(Task.id == task_id).first()
+    if result is None:  # pragma: no cover
+        return None
+    task, last_answer = result
+    if task.last_task_run_id is not None:
+        task.info['last_answer'] = last_answer
     return task
 
 
 def get_candidate_tasks(app_id, user_id=None, user_ip=None, n_answers=30, offset=0):
     """Gets all available tasks for a given project and user"""
-    rows = None
-    if user_id and not user_ip:
-        query = text('''
-                     SELECT id FROM task WHERE NOT EXISTS
-                     (SELECT task_id FROM task_run WHERE
-                     app_id=:app_id AND user_id=:user_id AND task_id=task.id)
-                     AND app_id=:app_id AND state !='completed'
-                     ORDER BY priority_0 DESC, id ASC LIMIT 10''')
-        rows = session.execute(query, dict(app_id=app_id, user_id=user_id))
-    else:
-        if not user_ip:
-            user_ip = '127.0.0.1'
-        query = text('''
-                     SELECT id FROM task WHERE NOT EXISTS
-                     (SELECT task_id FROM task_run WHERE
-                     app_id=:app_id AND user_ip=:user_ip AND task_id=task.id)
-                     AND app_id=:app_id AND state !='completed'
-                     ORDER BY priority_0 DESC, id ASC LIMIT 10''')
-        rows = session.execute(query, dict(app_id=app_id, user_ip=user_ip))
+    return _get_tasks(_candidate_task_ids(app_id, user_id, user_ip))
 
-    tasks = []
-    for t in rows:
-        tasks.append(session.query(Task).get(t.id))
-    return tasks
+
+def _breadth_first_key(row=None):
+    """Return the sort key parameters of _breadth_first_sql after a row, or
+    before the first one"""
+    if row is None:
+        return dict(last_n_task_runs=-1, last_id=0)
+    return dict(last_n_task_runs=row.n_task_runs, last_id=row.id)
+
+
+def _candidate_key(row=None):
+    """Return the sort key parameters of _candidate_task_ids_sql after a row,
+    or before the first one"""
+    if row is None:
+        return dict(last_priority_0=float('inf'), last_id=0)
+    return dict(last_priority_0=row.priority_0, last_id=row.id)
+
+
+def _unanswered_pages(statement, sort_key, app_id, user_id=None,
+                      user_ip=None, page_size=PAGE_SIZE):
+    """Yield the rows of a statement over the tasks of a project that the
+    user has not answered, a page at a time.
+
+    Every page is read after the sort key of the last row of the previous
+    one, so reading a page does not scan the ones before it. Only the ids of
+    every page are checked against the tasks answered by the user."""
+    page_size = max(page_size, PAGE_SIZE)
+    params = sort_key()
+    while True:
+        params.update(app_id=app_id, limit=page_size)
+        page = statement.execute(session, params).fetchall()
+        count_candidates(len(page))
+        unanswered = set(answered_tasks.filter_unanswered(
+            app_id, [row.id for row in page], user_id, user_ip))
+        yield [row for row in page if row.id in unanswered]
+        if len(page) < page_size:
+            break
+        params = sort_key(page[-1])
+
+
+def _unanswered_rows(statement, sort_key, app_id, user_id=None,
+                     user_ip=None, limit=10):
+    """Return the first limit rows of a statement over the tasks of a
+    project that the user has not answered."""
+    rows = []
+    for page in _unanswered_pages(statement, sort_key, app_id, user_id,
+                                  user_ip, limit):
+        rows += page
+        if len(rows) >= limit:
+            break
+    return rows[:limit]
+
+
+def _candidate_task_ids(app_id, user_id=None, user_ip=None, limit=10):
+    rows = _unanswered_rows(_candidate_task_ids_sql, _candidate_key, app_id,
+                            user_id, user_ip, limit)
+    return [row.id for row in rows]
+
+
+def _remaining_answers(task_ids):
+    """Return a dict with the number of answers each task still needs"""
+    if not task_ids:
+        return {}
+    rows = _remaining_answers_sql.execute(session,
+                                          dict(task_ids=list(task_ids)))
+    return dict((row.id, row.remaining) for row in rows)
+
+
+def _get_tasks(task_ids):
+    """Fetch the tasks with the given ids in one query, keeping their order"""
+    if not task_ids:
+        return []
+    tasks = session.query(Task).filter(Task.id.in_(task_ids)).all()
+    tasks_by_id = dict((task.id, task) for task in tasks)
+    return [tasks_by_id[task_id] for task_id in task_ids
+            if task_id in tasks_by_id]
+
+
+register_scheduler('default', get_depth_first_task, get_depth_first_tasks)
+register_scheduler('breadth_first', get_breadth_first_task,
+                   get_breadth_first_tasks)
+register_scheduler('depth_first', get_depth_first_task, get_depth_first_tasks)
+register_scheduler('depth_first_pool', get_depth_first_pool_task,
+                   get_depth_first_pool_tasks)
+register_scheduler('depth_first_lease', get_depth_first_lease_task,
+                   get_depth_first_lease_tasks)
+register_scheduler('random', get_random_task)
+register_scheduler('incremental', get_incremental_task)
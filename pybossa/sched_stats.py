@@ -0,0 +1,109 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2014 SF Isle of Man Limited
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Scheduler stats module for instrumenting the task schedulers.
+
+For every (scheduler, project) pair it keeps a Redis hash with the number of
+calls, the calls that returned no task, the candidate tasks considered and a
+latency histogram, so the slowest projects and schedulers can be found.
+
+This module exports:
+    * record: to store the stats of a scheduler call
+    * get_stats: to get the stats of every scheduler and project
+
+"""
+from redis.exceptions import ConnectionError
+from pybossa.core import sentinel
+
+
+STATS_TIMEOUT = 7 * 24 * 60 * 60
+# Upper bounds (in ms) of the latency histogram buckets
+LATENCY_BUCKETS = [1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500]
+KEYS_INDEX = 'pybossa:sched_stats:keys'
+
+
+def _stats_key(sched, app_id):
+    return 'pybossa:sched_stats:%s:app:%s' % (sched, app_id)
+
+
+def _bucket(latency):
+    for bound in LATENCY_BUCKETS:
+        if latency <= bound:
+            return str(bound)
+    return 'inf'
+
+
+def record(sched, app_id, latency, n_candidates, n_tasks, redis_conn=None):
+    """Store the latency (in ms), candidates considered and tasks returned by
+    a scheduler call. The call is not recorded if Redis is not available."""
+    redis_conn = redis_conn or sentinel.master
+    key = _stats_key(sched, app_id)
+    pipe = redis_conn.pipeline(transaction=False)
+    pipe.hincrby(key, 'calls', 1)
+    if n_tasks == 0:
+        pipe.hincrby(key, 'empty', 1)
+    pipe.hincrby(key, 'candidates', n_candidates)
+    pipe.hincrbyfloat(key, 'total_ms', latency)
+    pipe.hincrby(key, 'le_%s' % _bucket(latency), 1)
+    pipe.expire(key, STATS_TIMEOUT)
+    pipe.sadd(KEYS_INDEX, '%s:%s' % (sched, app_id))
+    try:
+        pipe.execute()
+    except ConnectionError:
+        # Not worth failing the scheduler call: the stats are only sampled
+        pass
+
+
+def _percentile(histogram, calls, pct):
+    """Return the upper bound of the bucket holding the pct percentile."""
+    seen = 0
+    for bound in [str(b) for b in LATENCY_BUCKETS] + ['inf']:
+        seen += histogram.get(bound, 0)
+        if seen >= calls * pct / 100.0:
+            return float(bound)
+    return float('inf')
+
+
+def get_stats(redis_conn=None):
+    """Return the stats of every (scheduler, project) pair, slowest first."""
+    redis_conn = redis_conn or sentinel.slave
+    pairs = sorted(redis_conn.smembers(KEYS_INDEX))
+    pipe = redis_conn.pipeline(transaction=False)
+    for pair in pairs:
+        sched, app_id = pair.rsplit(':', 1)
+        pipe.hgetall(_stats_key(sched, app_id))
+    stats = []
+    for pair, values in zip(pairs, pipe.execute()):
+        calls = int(values.get('calls', 0))
+        if calls == 0:
+            continue
+        sched, app_id = pair.rsplit(':', 1)
+        histogram = dict((field[3:], int(value))
+                         for field, value in values.iteritems()
+                         if field.startswith('le_'))
+        stats.append(dict(
+            sched=sched,
+            app_id=int(app_id),
+            calls=calls,
+            empty_rate=float(values.get('empty', 0)) / calls,
+            avg_candidates=float(values.get('candidates', 0)) / calls,
+            avg_ms=float(values.get('total_ms', 0)) / calls,
+            p50_ms=_percentile(histogram, calls, 50),
+            p95_ms=_percentile(histogram, calls, 95),
+            p99_ms=_percentile(histogram, calls, 99)))
+    return sorted(stats, key=lambda s: s['avg_ms'], reverse=True)
@@ -1,4 +1,5 @@
 from redis import sentinel, StrictRedis
+from pybossa.sentinel.breaker import BreakerRedis
 
 
 class Sentinel(object):
@@ -14,5 +15,11 @@ class Sentinel(object):
         self.connection = sentinel.Sentinel(app.config['REDIS_SENTINEL'],
                                                   socket_timeout=0.1)
         redis_db = app.config.get('REDIS_DB') or 0
-        self.master = self.connection.master_for('mymaster', db=redis_db)
-        self.slave = self.connection.slave_for('mymaster', db=redis_db)
+        self.master = self.connection.master_for('mymaster', db=redis_db,
+                                                 redis_class=BreakerRedis)
+        self.slave = self.connection.slave_for('mymaster', db=redis_db,
+                                               redis_class=BreakerRedis)
+        max_failures = app.config.get('REDIS_BREAKER_MAX_FAILURES', 5)
+        reset_timeout = app.config.get('REDIS_BREAKER_RESET_TIMEOUT', 10)
+        self.master.set_breaker('master', max_failures, reset_timeout)
+        self.slave.set_breaker('slave', max_failures, reset_timeout)
@@ -0,0 +1,141 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2014 SF Isle of Man Limited
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Circuit breaker module for the Redis connections.
+
+After max_failures connection errors in a row the circuit opens, and every
+command fails at once with CircuitOpenError (a redis ConnectionError) instead
+of waiting for the socket timeout. While open, a background thread pings
+Redis every reset_timeout seconds and closes the circuit as soon as it
+answers again.
+
+This module exports:
+    * CircuitBreaker: to track the failures of a connection
+    * CircuitOpenError: the error raised while the circuit is open
+    * BreakerRedis: a StrictRedis whose commands and pipelines go through a
+      circuit breaker
+
+"""
+import threading
+import time
+from redis import StrictRedis
+from redis.client import StrictPipeline
+from redis.exceptions import ConnectionError
+
+
+class CircuitOpenError(ConnectionError):
+
+    """Raised instead of running a command while the circuit is open."""
+
+    pass
+
+
+class CircuitBreaker(object):
+
+    """Fail fast after max_failures consecutive connection errors, probing
+    for recovery in the background every reset_timeout seconds."""
+
+    def __init__(self, name, probe=None, max_failures=5, reset_timeout=10):
+        self.name = name
+        self.probe = probe
+        self.max_failures = max_failures
+        self.reset_timeout = reset_timeout
+        self.failures = 0
+        self.opened_at = None
+        self._lock = threading.Lock()
+
+    @property
+    def is_open(self):
+        return self.opened_at is not None
+
+    def call(self, function, *args, **kwargs):
+        """Run function, unless the circuit is open, counting its connection
+        errors."""
+        if self.is_open:
+            raise CircuitOpenError('Redis %s circuit is open' % self.name)
+        try:
+            output = function(*args, **kwargs)
+        except ConnectionError:
+            self.failure()
+            raise
+        self.failures = 0
+        return output
+
+    def failure(self):
+        with self._lock:
+            self.failures += 1
+            if self.is_open or self.failures < self.max_failures:
+                return
+            self.opened_at = time.time()
+        thread = threading.Thread(target=self._probe)
+        thread.daemon = True
+        thread.start()
+
+    def close(self):
+        with self._lock:
+            self.failures = 0
+            self.opened_at = None
+
+    def _probe(self):
+        while self.is_open:
+            time.sleep(self.reset_timeout)
+            try:
+                if self.probe is not None:
+                    self.probe()
+                self.close()
+            except Exception:
+                pass
+
+
+class BreakerPipeline(StrictPipeline):
+
+    """A pipeline executed through the circuit breaker of its client."""
+
+    breaker = None
+
+    def execute(self, raise_on_error=True):
+        if self.breaker is None:
+            return super(BreakerPipeline, self).execute(raise_on_error)
+        return self.breaker.call(super(BreakerPipeline, self).execute,
+                                 raise_on_error)
+
+
+class BreakerRedis(StrictRedis):
+
+    """A StrictRedis client running its commands through a circuit breaker,
+    once set with set_breaker."""
+
+    breaker = None
+
+    def set_breaker(self, name, max_failures=5, reset_timeout=10):
+        ping = lambda: StrictRedis.execute_command(self, 'PING')
+        self.breaker = CircuitBreaker(name, probe=ping,
+                                      max_failures=max_failures,
+                                      reset_timeout=reset_timeout)
+
+    def execute_command(self, *args, **options):
+        execute = super(BreakerRedis, self).execute_command
+        if self.breaker is None:
+            return execute(*args, **options)
+        return self.breaker.call(execute, *args, **options)
+
+    def pipeline(self, transaction=True, shard_hint=None):
+        pipe = BreakerPipeline(self.connection_pool, self.response_callbacks,
+                               transaction, shard_hint)
+        pipe.breaker = self.breaker
+        return pipe
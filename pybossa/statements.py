@@ -0,0 +1,119 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2014 SF Isle of Man Limited
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Statements module for running the hot SQL queries as prepared statements.
+
+A Statement is written like a text() query, with :name bound parameters. The
+first time it runs on a database connection it is sent to PostgreSQL with
+PREPARE, and from then on only EXECUTE with the parameter values is sent, so
+the server does not parse and plan it again on every call. The calls and time
+spent by every statement are counted in the worker process.
+
+Prepared statements can be disabled with the SQL_PREPARED_STATEMENTS setting
+(e.g. when connecting through a pooler in transaction mode), and then the
+statements run as plain text() queries.
+
+This module exports:
+    * Statement: a SQL query prepared once per database connection
+    * get_stats: to get the calls and timings of every statement
+    * reset_stats: to reset the calls and timings of every statement
+
+"""
+import re
+import threading
+import time
+from sqlalchemy.sql import text
+
+
+# Whether statements are prepared, set from the SQL_PREPARED_STATEMENTS setting
+enabled = True
+
+_statements = {}
+_stats = {}
+_stats_lock = threading.Lock()
+# Bound parameters, but not PostgreSQL casts (::integer)
+_PARAM = re.compile(r'(?<![:\w]):(\w+)')
+
+
+class Statement(object):
+
+    """A SQL query sent once with PREPARE to every connection it runs on."""
+
+    def __init__(self, name, sql):
+        if name in _statements:
+            raise ValueError('Statement %s already exists' % name)
+        self.name = name
+        self.params = []
+        for param in _PARAM.findall(sql):
+            if param not in self.params:
+                self.params.append(param)
+        positional = _PARAM.sub(
+            lambda match: '$%s' % (self.params.index(match.group(1)) + 1),
+            sql)
+        self._text = text(sql)
+        self._prepare = text('PREPARE %s AS %s' % (name, positional))
+        if self.params:
+            self._execute = text('EXECUTE %s(%s)' % (
+                name, ', '.join(':%s' % param for param in self.params)))
+        else:
+            self._execute = text('EXECUTE %s' % name)
+        _statements[name] = self
+
+    def execute(self, session, params=None):
+        """Run the statement on the connection of the given session."""
+        params = params or {}
+        start = time.time()
+        prepared = False
+        if enabled:
+            connection = session.connection()
+            names = connection.info.setdefault('pybossa_statements', set())
+            if self.name not in names:
+                connection.execute(self._prepare)
+                names.add(self.name)
+                prepared = True
+            result = session.execute(self._execute, params)
+        else:
+            result = session.execute(self._text, params)
+        _record(self.name, (time.time() - start) * 1000, prepared)
+        return result
+
+
+def _record(name, latency, prepared):
+    with _stats_lock:
+        stats = _stats.setdefault(name, dict(calls=0, prepares=0,
+                                             total_ms=0.0, max_ms=0.0))
+        stats['calls'] += 1
+        stats['prepares'] += int(prepared)
+        stats['total_ms'] += latency
+        stats['max_ms'] = max(stats['max_ms'], latency)
+
+
+def get_stats():
+    """Return the calls, prepares and timings (in ms) of every statement run
+    by this process, the ones with more total time first."""
+    with _stats_lock:
+        stats = [dict(name=name, avg_ms=values['total_ms'] / values['calls'],
+                      **values)
+                 for name, values in _stats.iteritems()]
+    return sorted(stats, key=lambda s: s['total_ms'], reverse=True)
+
+
+def reset_stats():
+    """Reset the calls and timings of every statement."""
+    with _stats_lock:
+        _stats.clear()
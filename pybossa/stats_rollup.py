@@ -0,0 +1,186 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2015 SF Isle of Man Limited
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Stats rollup module for the contributions of the projects over time.
+
+The project_stats_day (project x day x anonymous) and project_stats_hour
+(project x hour of the day x anonymous) tables count the task runs of every
+project, so the project stats read a few hundred rows instead of scanning
+all its task runs.
+
+They are updated incrementally by a background job, from the task runs with
+an id over a high-water mark. Every update only rolls up to the max id seen
+by the previous one, some minutes before, so the task runs of transactions
+still running then (with lower ids) are not skipped. The task runs not
+rolled up yet are added when reading, so the stats are always exact. Deleted
+task runs that were already rolled up are discounted by the TaskRun model
+events.
+
+This module exports:
+    * update: to add the new task runs to the rollups
+    * remove: to discount a deleted task run from the rollups
+    * rebuild: to compute the rollups again from scratch
+    * days: to get the number of task runs of a project per day
+    * hours: to get the number of task runs of a project per hour of the day
+
+"""
+from sqlalchemy.sql import text
+from pybossa.core import db
+from pybossa.model.stats_rollup import ProjectStatsDay, ProjectStatsHour, \
+    StatsRollupMark
+
+
+MARK = 'task_run'
+BATCH_SIZE = 100000
+
+_DAY = 'CAST(%s AS DATE)'
+_HOUR = 'CAST(EXTRACT(HOUR FROM %s) AS INTEGER)'
+
+# Adds the task runs with from_id < id <= to_id to a rollup table
+_ROLLUP_SQL = '''
+    WITH runs AS (
+        SELECT app_id, %(bucket)s AS %(column)s, user_id IS NULL AS anonymous,
+        COUNT(id) AS n_task_runs FROM task_run
+        WHERE id > :from_id AND id <= :to_id
+        GROUP BY app_id, %(column)s, anonymous),
+    updated AS (
+        UPDATE %(table)s SET n_task_runs=%(table)s.n_task_runs + runs.n_task_runs
+        FROM runs WHERE %(table)s.app_id=runs.app_id
+        AND %(table)s.%(column)s=runs.%(column)s
+        AND %(table)s.anonymous=runs.anonymous
+        RETURNING %(table)s.app_id, %(table)s.%(column)s, %(table)s.anonymous)
+    INSERT INTO %(table)s (app_id, %(column)s, anonymous, n_task_runs)
+    SELECT runs.app_id, runs.%(column)s, runs.anonymous, runs.n_task_runs
+    FROM runs LEFT JOIN updated ON runs.app_id=updated.app_id
+    AND runs.%(column)s=updated.%(column)s
+    AND runs.anonymous=updated.anonymous
+    WHERE updated.app_id IS NULL'''
+
+_ROLLUPS = [
+    text(_ROLLUP_SQL % dict(table='project_stats_day', column='day',
+                            bucket=_DAY % 'finish_time')),
+    text(_ROLLUP_SQL % dict(table='project_stats_hour', column='hour',
+                            bucket=_HOUR % 'finish_time'))]
+
+# Discounts a deleted task run, if it was rolled up. The mark is locked so an
+# update running meanwhile rolls up after the task run is deleted
+_REMOVE_SQL = '''
+    UPDATE %(table)s SET n_task_runs=n_task_runs - 1
+    WHERE app_id=:app_id AND %(column)s=%(bucket)s AND anonymous=:anonymous
+    AND :id <= (SELECT last_id FROM stats_rollup_mark WHERE name=:mark
+                FOR SHARE)'''
+
+_FINISH_TIME = 'CAST(:finish_time AS TIMESTAMP)'
+
+_REMOVALS = [
+    text(_REMOVE_SQL % dict(table='project_stats_day', column='day',
+                            bucket=_DAY % _FINISH_TIME)),
+    text(_REMOVE_SQL % dict(table='project_stats_hour', column='hour',
+                            bucket=_HOUR % _FINISH_TIME))]
+
+# Reads a rollup table plus the task runs of the project not rolled up yet
+_READ_SQL = '''
+    SELECT %(select)s AS bucket, anonymous, SUM(n_task_runs) AS n_task_runs
+    FROM (
+        SELECT %(column)s, anonymous, n_task_runs FROM %(table)s
+        WHERE app_id=:app_id
+        UNION ALL
+        SELECT %(bucket)s, user_id IS NULL, COUNT(id) FROM task_run
+        WHERE app_id=:app_id AND id > (
+            SELECT COALESCE(MAX(last_id), 0) FROM stats_rollup_mark
+            WHERE name=:mark)
+        GROUP BY 1, 2) AS rollup
+    GROUP BY bucket, anonymous'''
+
+_days_sql = text(_READ_SQL % dict(
+    table='project_stats_day', column='day', bucket=_DAY % 'finish_time',
+    select="to_char(day, 'YYYY-MM-DD')"))
+
+_hours_sql = text(_READ_SQL % dict(
+    table='project_stats_hour', column='hour', bucket=_HOUR % 'finish_time',
+    select='hour'))
+
+
+def _lock_mark(session):
+    """Return the mark, locked until the end of the transaction."""
+    mark = session.query(StatsRollupMark).filter_by(name=MARK)\
+        .with_for_update().first()
+    if mark is None:
+        mark = StatsRollupMark(name=MARK, last_id=0, pending_id=0)
+        session.add(mark)
+        session.flush()
+    return mark
+
+
+def update(batch_size=BATCH_SIZE):
+    """Add the task runs inserted since the last update to the rollups,
+    returning the id up to which they are rolled up."""
+    session = db.session
+    while True:
+        mark = _lock_mark(session)
+        if mark.last_id >= mark.pending_id:
+            max_id = session.execute(
+                text('SELECT COALESCE(MAX(id), 0) FROM task_run')).scalar()
+            mark.pending_id = max(max_id, mark.last_id)
+            last_id = mark.last_id
+            session.commit()
+            return last_id
+        to_id = min(mark.pending_id, mark.last_id + batch_size)
+        for rollup in _ROLLUPS:
+            session.execute(rollup, dict(from_id=mark.last_id, to_id=to_id))
+        mark.last_id = to_id
+        session.commit()
+
+
+def remove(conn, task_run):
+    """Discount a task run being deleted on conn from the rollups, if it has
+    been rolled up."""
+    params = dict(app_id=task_run.app_id, id=task_run.id,
+                  finish_time=task_run.finish_time,
+                  anonymous=task_run.user_id is None, mark=MARK)
+    for removal in _REMOVALS:
+        conn.execute(removal, params)
+
+
+def rebuild():
+    """Empty the rollups, so the next updates compute them from scratch."""
+    session = db.session
+    mark = _lock_mark(session)
+    session.query(ProjectStatsDay).delete()
+    session.query(ProjectStatsHour).delete()
+    mark.last_id = 0
+    mark.pending_id = 0
+    session.commit()
+
+
+def days(app_id):
+    """Return the number of task runs of a project per (day, anonymous),
+    with the days as YYYY-MM-DD strings."""
+    results = db.slave_session.execute(_days_sql,
+                                       dict(app_id=app_id, mark=MARK))
+    return dict(((row.bucket, row.anonymous), int(row.n_task_runs))
+                for row in results)
+
+
+def hours(app_id):
+    """Return the number of task runs of a project per (hour of the day,
+    anonymous)."""
+    results = db.slave_session.execute(_hours_sql,
+                                       dict(app_id=app_id, mark=MARK))
+    return dict(((row.bucket, row.anonymous), int(row.n_task_runs))
+                for row in results)
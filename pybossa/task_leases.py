@@ -0,0 +1,193 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2014 SF Isle of Man Limited
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Task leases module for handing out a task to a bounded number of volunteers.
+
+A lease is a time-limited reservation of one of the answers a task still
+needs. The leases of a task are stored in a Redis sorted set scored by their
+expiration time, so expired leases are reclaimed the next time somebody asks
+for a lease on the task.
+
+If Redis is not available, leases are granted without holding them, so tasks
+are handed out like without leases instead of failing.
+
+This module exports:
+    * acquire: to get (or renew) the lease of a task for a user
+    * acquire_many: to get the leases of the first available tasks of a list
+    * acquire_page: the same for a page of a longer list of tasks
+    * release: to release the lease of a user, once the answer is submitted
+    * n_leases: to count the active leases of a task
+    * count_leases: to count the leases other users hold on a list of tasks
+
+"""
+import time
+from redis.exceptions import ConnectionError
+from pybossa.core import sentinel
+
+
+LEASE_TIMEOUT = 30 * 60
+
+# Atomically reclaims the expired leases of the task, and then grants the
+# lease if the user already holds one or there is budget left for a new one.
+_ACQUIRE_SCRIPT = """
+local now = tonumber(ARGV[2])
+redis.call('ZREMRANGEBYSCORE', KEYS[1], '-inf', now)
+if redis.call('ZSCORE', KEYS[1], ARGV[1])
+   or redis.call('ZCARD', KEYS[1]) < tonumber(ARGV[4]) then
+    redis.call('ZADD', KEYS[1], ARGV[3], ARGV[1])
+    redis.call('EXPIRE', KEYS[1], ARGV[5])
+    return 1
+end
+return 0
+"""
+
+# The same for every task in KEYS, in order, until n leases are granted. The
+# first offset tasks that could be leased are skipped without leasing them.
+# Returns the offset left to skip, followed by the indexes of the leased keys.
+_ACQUIRE_MANY_SCRIPT = """
+local now = tonumber(ARGV[2])
+local offset = tonumber(ARGV[5])
+local n = tonumber(ARGV[6])
+local leased = {0}
+for i, key in ipairs(KEYS) do
+    redis.call('ZREMRANGEBYSCORE', key, '-inf', now)
+    if redis.call('ZSCORE', key, ARGV[1])
+       or redis.call('ZCARD', key) < tonumber(ARGV[6 + i]) then
+        if offset > 0 then
+            offset = offset - 1
+        else
+            redis.call('ZADD', key, ARGV[3], ARGV[1])
+            redis.call('EXPIRE', key, ARGV[4])
+            leased[#leased + 1] = i
+            if #leased - 1 == n then
+                break
+            end
+        end
+    end
+end
+leased[1] = offset
+return leased
+"""
+
+
+def _lease_key(task_id):
+    return 'pybossa:lease:task:%s' % task_id
+
+
+def _holder(user_id=None, user_ip=None):
+    if user_id and not user_ip:
+        return 'user:%s' % user_id
+    return 'ip:%s' % (user_ip or '127.0.0.1')
+
+
+def acquire(task_id, budget, user_id=None, user_ip=None, redis_conn=None,
+            timeout=LEASE_TIMEOUT):
+    """Try to get a lease of a task for a user.
+
+    Returns True if the user already held a lease of the task (which gets
+    renewed) or if less than budget users hold one."""
+    redis_conn = redis_conn or sentinel.master
+    now = time.time()
+    try:
+        acquired = redis_conn.eval(_ACQUIRE_SCRIPT, 1, _lease_key(task_id),
+                                   _holder(user_id, user_ip), now,
+                                   now + timeout, budget, int(timeout) + 1)
+    except ConnectionError:
+        return budget > 0
+    return bool(acquired)
+
+
+def acquire_many(budgets, n=1, offset=0, user_id=None, user_ip=None,
+                 redis_conn=None, timeout=LEASE_TIMEOUT):
+    """Try to get the leases of up to n tasks for a user in a single call.
+
+    budgets is a list of (task_id, budget) in order of preference. The first
+    offset tasks that could be leased are skipped, without leasing them.
+    Returns the ids of the leased tasks."""
+    return acquire_page(budgets, n, offset, user_id, user_ip, redis_conn,
+                        timeout)[0]
+
+
+def acquire_page(budgets, n=1, offset=0, user_id=None, user_ip=None,
+                 redis_conn=None, timeout=LEASE_TIMEOUT):
+    """Like acquire_many, for a page of the candidate tasks.
+
+    Returns the ids of the leased tasks and the offset still to be skipped
+    in the next page."""
+    if not budgets or n < 1:
+        return [], offset
+    redis_conn = redis_conn or sentinel.master
+    now = time.time()
+    keys = [_lease_key(task_id) for task_id, budget in budgets]
+    args = [_holder(user_id, user_ip), now, now + timeout, int(timeout) + 1,
+            offset, n] + [budget for task_id, budget in budgets]
+    try:
+        result = redis_conn.eval(_ACQUIRE_MANY_SCRIPT, len(keys),
+                                 *(keys + args))
+    except ConnectionError:
+        return _skip_page(budgets, n, offset)
+    leased = [budgets[int(i) - 1][0] for i in result[1:]]
+    return leased, int(result[0])
+
+
+def _skip_page(budgets, n, offset):
+    """Like acquire_page, without holding the leases: the first n tasks
+    with a budget after the offset ones"""
+    available = [task_id for task_id, budget in budgets if budget > 0]
+    if offset >= len(available):
+        return [], offset - len(available)
+    return available[offset:offset + n], 0
+
+
+def release(task_id, user_id=None, user_ip=None, redis_conn=None):
+    """Release the lease of a task held by a user."""
+    redis_conn = redis_conn or sentinel.master
+    try:
+        redis_conn.zrem(_lease_key(task_id), _holder(user_id, user_ip))
+    except ConnectionError:
+        # The lease expires by itself
+        pass
+
+
+def n_leases(task_id, redis_conn=None):
+    """Return the number of active leases of a task."""
+    redis_conn = redis_conn or sentinel.slave
+    return redis_conn.zcount(_lease_key(task_id), time.time(), '+inf')
+
+
+def count_leases(task_ids, user_id=None, user_ip=None, redis_conn=None):
+    """Return a dict with the number of active leases of each task, not
+    counting the one held by the given user."""
+    redis_conn = redis_conn or sentinel.slave
+    now = time.time()
+    holder = _holder(user_id, user_ip)
+    pipe = redis_conn.pipeline()
+    for task_id in task_ids:
+        pipe.zcount(_lease_key(task_id), now, '+inf')
+        pipe.zscore(_lease_key(task_id), holder)
+    try:
+        results = pipe.execute()
+    except ConnectionError:
+        return dict((task_id, 0) for task_id in task_ids)
+    leases = {}
+    for i, task_id in enumerate(task_ids):
+        n, own_expiration = results[2 * i], results[2 * i + 1]
+        if own_expiration is not None and own_expiration >= now:
+            n -= 1
+        leases[task_id] = n
+    return leases
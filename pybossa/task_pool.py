@@ -0,0 +1,133 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2014 SF Isle of Man Limited
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Task pool module for serving tasks from Redis.
+
+For every project that uses it, the pool is a Redis sorted set with the ids of
+the open (not completed) tasks of the project, ordered by priority_0 DESC and
+id ASC, so the scheduler does not have to scan the task table on every request.
+
+The pool is built lazily the first time it is read and then kept up to date
+by the Task and TaskRun model events, which also extend its expiration, so
+it is only built again after a day without changes to the project tasks.
+
+This module exports:
+    * get_task_ids: to read a window of task ids from the pool
+    * count_tasks: to get the number of tasks in the pool
+    * get_key: to get the Redis key of a pool, building it if needed
+    * add_task: to add (or reprioritise) a task in an existing pool
+    * remove_task: to remove a task from an existing pool
+    * delete_pool: to drop the pool of a project (it will be rebuilt lazily)
+
+"""
+from sqlalchemy.sql import text
+from pybossa.core import db, sentinel
+
+
+POOL_TIMEOUT = 24 * 60 * 60
+BATCH_SIZE = 1000
+# Member stored with an infinite score so an empty pool still exists in Redis
+BUILT_MARKER = 'built'
+
+
+def _pool_key(app_id):
+    return 'pybossa:task_pool:app:%s' % app_id
+
+
+def _member(task_id):
+    # Zero padded, so tasks with the same priority are sorted by id ASC
+    return '%012d' % task_id
+
+
+def _score(priority_0):
+    # Redis sorts by score ASC, and we want the highest priority first
+    return -float(priority_0 or 0)
+
+
+def build_pool(app_id, redis_conn=None):
+    """Build the pool of a project from the DB, replacing the old one."""
+    redis_conn = redis_conn or sentinel.master
+    sql = text('''SELECT id, priority_0 FROM task WHERE app_id=:app_id
+               AND state !='completed';''')
+    results = db.slave_session.execute(sql, dict(app_id=app_id))
+    key = _pool_key(app_id)
+    tmp_key = '%s:building' % key
+    pipe = redis_conn.pipeline()
+    pipe.delete(tmp_key)
+    batch = []
+    for row in results:
+        batch.extend([_score(row.priority_0), _member(row.id)])
+        if len(batch) >= 2 * BATCH_SIZE:
+            pipe.zadd(tmp_key, *batch)
+            batch = []
+    batch.extend([float('inf'), BUILT_MARKER])
+    pipe.zadd(tmp_key, *batch)
+    pipe.expire(tmp_key, POOL_TIMEOUT)
+    pipe.rename(tmp_key, key)
+    pipe.execute()
+
+
+def get_key(app_id, redis_conn=None):
+    """Return the Redis key of the pool of a project, building it first if
+    it does not exist."""
+    redis_conn = redis_conn or sentinel.master
+    key = _pool_key(app_id)
+    if not redis_conn.exists(key):
+        build_pool(app_id, redis_conn)
+    return key
+
+
+def get_task_ids(app_id, start=0, stop=9, redis_conn=None):
+    """Return the task ids in the [start, stop] window of the pool."""
+    redis_conn = redis_conn or sentinel.master
+    members = redis_conn.zrange(get_key(app_id, redis_conn),
+                                start, stop)
+    return [int(m) for m in members if m != BUILT_MARKER]
+
+
+def count_tasks(app_id, redis_conn=None):
+    """Return the number of tasks in the pool."""
+    redis_conn = redis_conn or sentinel.master
+    return redis_conn.zcard(get_key(app_id, redis_conn)) - 1
+
+
+def add_task(app_id, task_id, priority_0, redis_conn=None):
+    """Add a task to the pool of its project, if the pool has been built."""
+    redis_conn = redis_conn or sentinel.master
+    key = _pool_key(app_id)
+    if redis_conn.exists(key):
+        pipe = redis_conn.pipeline()
+        pipe.zadd(key, _score(priority_0), _member(task_id))
+        pipe.expire(key, POOL_TIMEOUT)
+        pipe.execute()
+
+
+def remove_task(app_id, task_id, redis_conn=None):
+    """Remove a task from the pool of its project."""
+    redis_conn = redis_conn or sentinel.master
+    key = _pool_key(app_id)
+    pipe = redis_conn.pipeline()
+    pipe.zrem(key, _member(task_id))
+    pipe.expire(key, POOL_TIMEOUT)
+    pipe.execute()
+
+
+def delete_pool(app_id, redis_conn=None):
+    """Delete the pool of a project, so it is rebuilt on next read."""
+    redis_conn = redis_conn or sentinel.master
+    redis_conn.delete(_pool_key(app_id))
@@ -0,0 +1,98 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2014 SF Isle of Man Limited
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Task router module for sending volunteers to the projects that need them.
+
+Two Redis sorted sets keep the published projects (not hidden, not password
+protected, with a task presenter and open tasks) scored by the number of
+answers their open tasks still need: one with all of them, and one with the
+projects that allow anonymous contributors. They are rebuilt periodically by a
+background job, and on demand if missing.
+
+This module exports:
+    * build_availability: to recompute the availability of every project
+    * pick_projects: to get a few projects to send a volunteer to
+
+"""
+import json
+import random
+from sqlalchemy.sql import text
+from pybossa.core import db, sentinel
+
+
+ROUTER_TIMEOUT = 60 * 60
+# Number of projects with more needed answers that get the volunteers
+ROUTER_TOP = 20
+
+
+def _router_key(anonymous=False):
+    if anonymous:
+        return 'pybossa:router:apps:anonymous'
+    return 'pybossa:router:apps'
+
+
+def build_availability(redis_conn=None):
+    """Recompute the answers needed by every published project.
+
+    Returns the number of available projects."""
+    redis_conn = redis_conn or sentinel.master
+    sql = text('''SELECT app.id, app.info, app.allow_anonymous_contributors,
+               SUM(task.n_answers - task.n_task_runs) AS needed
+               FROM app JOIN task ON (task.app_id=app.id)
+               WHERE app.hidden=0 AND app.info LIKE('%task_presenter%')
+               AND task.state !='completed'
+               GROUP BY app.id;''')
+    results = db.slave_session.execute(sql)
+    pipe = redis_conn.pipeline()
+    for anonymous in (False, True):
+        pipe.delete('%s:building' % _router_key(anonymous))
+    n_apps = 0
+    for row in results:
+        info = json.loads(row.info) if row.info else {}
+        if info.get('passwd_hash') or row.needed <= 0:
+            continue
+        n_apps += 1
+        pipe.zadd('%s:building' % _router_key(), row.needed, row.id)
+        if row.allow_anonymous_contributors:
+            pipe.zadd('%s:building' % _router_key(True), row.needed, row.id)
+    for anonymous in (False, True):
+        key = _router_key(anonymous)
+        # Keep an empty set too, so it is not rebuilt on every request
+        pipe.zadd('%s:building' % key, 0, 'built')
+        pipe.expire('%s:building' % key, ROUTER_TIMEOUT)
+        pipe.rename('%s:building' % key, key)
+    pipe.execute()
+    return n_apps
+
+
+def pick_projects(anonymous=False, n=5, redis_conn=None):
+    """Return the ids of n projects among the ones needing more answers.
+
+    Projects are sampled with a probability proportional to the answers they
+    need, so surge traffic is spread over them."""
+    redis_conn = redis_conn or sentinel.master
+    key = _router_key(anonymous)
+    if not redis_conn.exists(key):
+        build_availability(redis_conn)
+    apps = [(int(app_id), needed) for app_id, needed
+            in redis_conn.zrevrange(key, 0, ROUTER_TOP - 1,
+                                    withscores=True)
+            if app_id != 'built']
+    # Weighted random sampling without replacement
+    apps.sort(key=lambda app: random.random() ** (1.0 / app[1]), reverse=True)
+    return [app_id for app_id, needed in apps[:n]]
@@ -0,0 +1,151 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2015 SF Isle of Man Limited
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Trending module for the most active projects and users of the last 24 hours.
+
+Every contribution increments the score of its project (and of its user, if
+authenticated) in a Redis sorted set for the current hour. The rankings of
+the last 24 hours are the union of the last 24 hourly sets, which costs a
+ZUNIONSTORE instead of scanning the task runs, and is reused for
+UNION_TIMEOUT seconds. The hourly sets expire on their own once out of the
+window.
+
+The window is made of the last 24 calendar hours (the current one, so far,
+and the 23 previous whole hours), not a rolling 24 hours: it spans between 23
+and 24 hours depending on the time of the day.
+
+The sets are built from the DB the first time they are read, and then kept
+up to date by the TaskRun model events.
+
+This module exports:
+    * add_contribution: to count a new TaskRun in the current hour
+    * top_apps: to get the most active projects of the last 24 hours
+    * top_users: to get the most active users of the last 24 hours
+    * rebuild: to build the hourly sets of the last 24 hours from the DB
+
+"""
+import time
+from datetime import datetime
+from sqlalchemy.sql import text
+from pybossa.core import db, sentinel
+
+
+APPS = 'apps'
+USERS = 'users'
+WINDOW_HOURS = 24
+# The hourly sets outlive the window by an hour, so it is always complete
+BUCKET_TIMEOUT = (WINDOW_HOURS + 1) * 60 * 60
+# Seconds the union of the hourly sets is reused for
+UNION_TIMEOUT = 60
+BUILT_KEY = 'pybossa:trending:built'
+
+_contributions_sql = text('''
+    SELECT app_id, user_id,
+    CAST(EXTRACT(EPOCH FROM date_trunc('hour', finish_time)) / 3600
+         AS INTEGER) AS hour,
+    COUNT(id) AS n_answers FROM task_run
+    WHERE finish_time >= date_trunc('hour', NOW() AT TIME ZONE 'UTC')
+                         - :window * INTERVAL '1 hour'
+    AND finish_time < :until
+    GROUP BY app_id, user_id, hour''')
+
+
+def _current_hour():
+    return int(time.time() // 3600)
+
+
+def _bucket_key(kind, hour):
+    return 'pybossa:trending:%s:%s' % (kind, hour)
+
+
+def _union_key(kind):
+    return 'pybossa:trending:%s:24h' % kind
+
+
+def add_contribution(app_id, user_id=None, redis_conn=None):
+    """Count a new TaskRun in the rankings of the current hour."""
+    redis_conn = redis_conn or sentinel.master
+    hour = _current_hour()
+    pipe = redis_conn.pipeline(transaction=False)
+    members = [(APPS, app_id)] + ([(USERS, user_id)] if user_id else [])
+    for kind, member in members:
+        key = _bucket_key(kind, hour)
+        pipe.zincrby(key, member, 1)
+        pipe.expire(key, BUCKET_TIMEOUT)
+    pipe.execute()
+
+
+def rebuild(redis_conn=None):
+    """Write the hourly sets of the last 24 hours anew from the DB.
+
+    The set of the current hour is emptied before reading the DB, which then
+    only adds the task runs finished before, so the contributions added
+    meanwhile by add_contribution are neither lost nor counted twice."""
+    redis_conn = redis_conn or sentinel.master
+    hour = _current_hour()
+    until = datetime.utcfromtimestamp(time.time())
+    redis_conn.delete(*[_bucket_key(kind, hour) for kind in (APPS, USERS)])
+    results = db.slave_session.execute(
+        _contributions_sql, dict(window=WINDOW_HOURS - 1, until=until))
+    scores = {}
+    for row in results:
+        for kind, member in ((APPS, row.app_id), (USERS, row.user_id)):
+            if member is not None:
+                bucket = scores.setdefault(_bucket_key(kind, row.hour), {})
+                bucket[member] = bucket.get(member, 0) + row.n_answers
+    pipe = redis_conn.pipeline()
+    for kind in (APPS, USERS):
+        pipe.delete(_union_key(kind),
+                    *[_bucket_key(kind, hour - i)
+                      for i in range(1, WINDOW_HOURS)])
+    for key, bucket in scores.iteritems():
+        for member, score in bucket.iteritems():
+            pipe.zincrby(key, member, score)
+        pipe.expire(key, BUCKET_TIMEOUT)
+    pipe.set(BUILT_KEY, 1)
+    pipe.execute()
+
+
+def _top(kind, n, redis_conn=None):
+    """Return the n (id, n_answers) with the highest scores of the last 24
+    calendar hours, computing their union only if it expired."""
+    redis_conn = redis_conn or sentinel.master
+    if not redis_conn.exists(BUILT_KEY):
+        rebuild(redis_conn)
+    key = _union_key(kind)
+    if not redis_conn.exists(key):
+        hour = _current_hour()
+        pipe = redis_conn.pipeline()
+        pipe.zunionstore(key, [_bucket_key(kind, hour - i)
+                               for i in range(WINDOW_HOURS)])
+        pipe.expire(key, UNION_TIMEOUT)
+        pipe.execute()
+    ranking = redis_conn.zrevrange(key, 0, n - 1, withscores=True)
+    return [(int(member), int(score)) for member, score in ranking]
+
+
+def top_apps(n=5, redis_conn=None):
+    """Return the n (app_id, n_answers) of the most active projects of the
+    last 24 hours."""
+    return _top(APPS, n, redis_conn)
+
+
+def top_users(n=5, redis_conn=None):
+    """Return the n (user_id, n_answers) of the most active users of the
+    last 24 hours."""
+    return _top(USERS, n, redis_conn)
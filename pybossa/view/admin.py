@@ -33,8 +33,10 @@ import pybossa.model as model
 from pybossa.util import admin_required, UnicodeWriter
 from pybossa.cache import apps as cached_apps
 from pybossa.cache import categories as cached_cat
+from pybossa.cache.metrics import get_metrics
 from pybossa.auth import require
 from pybossa.core import project_repo, user_repo
+from pybossa import sched_stats
 import json
 from StringIO import StringIO
 
@@ -351,3 +353,23 @@ def update_category(id):
     except Exception as e: # pragma: no cover
         current_app.logger.error(e)
         return abort(500)
+
+
+@blueprint.route('/schedulers')
+@login_required
+@admin_required
+def schedulers():
+    """Return the stats of the task schedulers as JSON, slowest projects
+    first"""
+    stats = sched_stats.get_stats()
+    return Response(json.dumps(stats), mimetype='application/json')
+
+
+@blueprint.route('/cache')
+@login_required
+@admin_required
+def cache_metrics():
+    """Return the hit ratios and compute times of the cached functions as
+    JSON, the most expensive recomputations first"""
+    metrics = get_metrics()
+    return Response(json.dumps(metrics), mimetype='application/json')
@@ -42,7 +42,8 @@ from pybossa.auth import require
 from pybossa.cache import apps as cached_apps
 from pybossa.cache import categories as cached_cat
 from pybossa.cache import project_stats as stats
-from pybossa.cache.helpers import add_custom_contrib_button_to
+from pybossa.cache.helpers import (add_custom_contrib_button_to,
+                                   n_available_tasks)
 from pybossa.ckan import Ckan
 from pybossa.extensions import misaka
 from pybossa.cookies import CookieHandler
@@ -724,8 +725,8 @@ def presenter(short_name):
     def invite_new_volunteers(app):
         user_id = None if current_user.is_anonymous() else current_user.id
         user_ip = request.remote_addr if current_user.is_anonymous() else None
-        task = sched.new_task(app.id, app.info.get('sched'), user_id, user_ip, 0)
-        return task is None and overall_progress < 100.0
+        n_available = n_available_tasks(app.id, user_id, user_ip)
+        return n_available == 0 and overall_progress < 100.0
 
     def respond(tmpl):
         if (current_user.is_anonymous()):
@@ -1231,6 +1232,10 @@ def task_scheduler(short_name):
      overall_progress, last_activity) = app_by_shortname(short_name)
     title = app_title(app, gettext('Task Scheduler'))
     form = TaskSchedulerForm()
+    # Add the schedulers registered by the deployment
+    known = dict(form.sched.choices)
+    form.sched.choices = form.sched.choices + \
+        [(name, name) for name in sorted(sched.schedulers) if name not in known]
 
     def respond():
         return render_template('/applications/task_scheduler.html',
@@ -0,0 +1,234 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2015 SF Isle of Man Limited
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Volunteers module for counting the distinct volunteers of the projects.
+
+For every project, and for the whole site, it keeps two Redis HyperLogLog
+sketches with the registered (user ids) and anonymous (IPs) volunteers who
+have submitted a TaskRun, so counting them is a PFCOUNT instead of a
+COUNT(DISTINCT) over the task_run table. The counts are approximate (with a
+standard error of 0.81%).
+
+Sketches are built lazily from the DB the first time they are read, and then
+kept up to date by the TaskRun model events. Only one worker at a time builds
+a sketch. The site sketches, which need to read the whole task_run table, are
+built by a background job instead of in the request. Until a sketch is
+built, its volunteers are counted in the DB, so the (cached) counts are
+never those of a partial sketch.
+
+A sketch can not forget a volunteer, so the sketches of a project are built
+again when one of its task runs is deleted. The site sketches are not: they
+keep counting the volunteers of the deleted task runs until they are
+recounted with rebuild (e.g. from the rebuild_volunteers command).
+
+If Redis is not available, the volunteers are counted in the DB instead.
+
+This module exports:
+    * count: to get the number of volunteers of a project or the site
+    * count_many: to get the number of volunteers of many projects at once
+    * add_volunteer: to add the volunteer of a new TaskRun to the sketches
+    * reset: to build the sketches of a project again when next read
+    * build: to add the volunteers in the DB to the sketches
+    * rebuild: to recount the volunteers of a project or the site exactly
+
+"""
+from sqlalchemy.sql import text
+from redis.exceptions import ConnectionError
+from pybossa.core import db, sentinel
+
+
+AUTH = 'auth'
+ANON = 'anon'
+BATCH_SIZE = 1000
+# Seconds a worker may spend building a sketch while the rest wait for it
+BUILD_LOCK_TIMEOUT = 10 * 60
+
+_project_volunteers_sql = text('''
+    SELECT DISTINCT user_id, user_ip FROM task_run WHERE app_id=:app_id''')
+
+_site_volunteers_sql = text('''
+    SELECT DISTINCT user_id, user_ip FROM task_run''')
+
+_project_counts_sql = text('''
+    SELECT COUNT(DISTINCT CASE WHEN user_ip IS NULL THEN user_id END) AS n_auth,
+           COUNT(DISTINCT CASE WHEN user_id IS NULL THEN user_ip END) AS n_anon
+    FROM task_run WHERE app_id=:app_id''')
+
+_site_counts_sql = text('''
+    SELECT COUNT(DISTINCT CASE WHEN user_ip IS NULL THEN user_id END) AS n_auth,
+           COUNT(DISTINCT CASE WHEN user_id IS NULL THEN user_ip END) AS n_anon
+    FROM task_run''')
+
+
+def _scope(app_id):
+    return 'site' if app_id is None else 'app:%s' % app_id
+
+
+def _sketch_key(app_id, kind):
+    return 'pybossa:volunteers:%s:%s' % (_scope(app_id), kind)
+
+
+def _built_key(app_id):
+    return 'pybossa:volunteers:%s:built' % _scope(app_id)
+
+
+def _lock_key(app_id):
+    return 'pybossa:volunteers:%s:lock' % _scope(app_id)
+
+
+def _enqueue_build(app_id):
+    from rq import Queue
+    queue = Queue('low', connection=sentinel.master)
+    queue.enqueue('pybossa.jobs.build_volunteers', app_id,
+                  timeout=BUILD_LOCK_TIMEOUT)
+
+
+def _volunteer(user_id=None, user_ip=None):
+    """Return the (kind, member) of the volunteer of a TaskRun."""
+    if user_id and not user_ip:
+        return AUTH, user_id
+    if user_ip and not user_id:
+        return ANON, user_ip
+    return None, None
+
+
+def build(app_id=None, redis_conn=None, replace=False):
+    """Add the volunteers in the DB of a project (or the site, if app_id is
+    None) to its sketches, returning the exact (registered, anonymous)
+    counts.
+
+    Volunteers added meanwhile by add_volunteer are kept, unless replace is
+    True: then the sketches are written anew, forgetting the volunteers of
+    the deleted task runs."""
+    redis_conn = redis_conn or sentinel.master
+    if app_id is None:
+        sql, params = _site_volunteers_sql, {}
+    else:
+        sql, params = _project_volunteers_sql, dict(app_id=app_id)
+    keys = {}
+    pipe = redis_conn.pipeline(transaction=False)
+    for kind in (AUTH, ANON):
+        key = _sketch_key(app_id, kind)
+        keys[kind] = '%s:building' % key if replace else key
+        if replace:
+            pipe.delete(keys[kind])
+        # With no members, PFADD still creates an empty sketch
+        pipe.execute_command('PFADD', keys[kind])
+    pipe.execute()
+    counts = {AUTH: 0, ANON: 0}
+    members = {AUTH: [], ANON: []}
+    results = db.slave_session.execute(sql.execution_options(stream=True),
+                                       params)
+    for row in results:
+        kind, member = _volunteer(row.user_id, row.user_ip)
+        if kind is None:
+            continue
+        counts[kind] += 1
+        members[kind].append(member)
+        if len(members[kind]) >= BATCH_SIZE:
+            redis_conn.execute_command('PFADD', keys[kind], *members[kind])
+            members[kind] = []
+    for kind in (AUTH, ANON):
+        if members[kind]:
+            pipe.execute_command('PFADD', keys[kind], *members[kind])
+        if replace:
+            pipe.rename(keys[kind], _sketch_key(app_id, kind))
+    pipe.set(_built_key(app_id), 1)
+    pipe.delete(_lock_key(app_id))
+    pipe.execute()
+    return counts[AUTH], counts[ANON]
+
+
+def count_many(app_ids, redis_conn=None):
+    """Return the (registered, anonymous) number of volunteers of every
+    project in app_ids (None for the whole site).
+
+    Missing sketches are built (in a background job for the site), and the
+    volunteers are counted in the DB while they are being built."""
+    redis_conn = redis_conn or sentinel.master
+    try:
+        return _count_many(app_ids, redis_conn)
+    except ConnectionError:
+        return [_count_db(app_id) for app_id in app_ids]
+
+
+def _count_many(app_ids, redis_conn):
+    pipe = redis_conn.pipeline(transaction=False)
+    for app_id in app_ids:
+        pipe.exists(_built_key(app_id))
+        pipe.execute_command('PFCOUNT', _sketch_key(app_id, AUTH))
+        pipe.execute_command('PFCOUNT', _sketch_key(app_id, ANON))
+    values = pipe.execute()
+    counts = []
+    for i, app_id in enumerate(app_ids):
+        built, n_auth, n_anon = values[3 * i:3 * i + 3]
+        if not built:
+            locked = redis_conn.set(_lock_key(app_id), 1, nx=True,
+                                    ex=BUILD_LOCK_TIMEOUT)
+            if locked and app_id is not None:
+                n_auth, n_anon = build(app_id, redis_conn)
+            else:
+                if locked:
+                    _enqueue_build(app_id)
+                n_auth, n_anon = _count_db(app_id)
+        counts.append((n_auth, n_anon))
+    return counts
+
+
+def _count_db(app_id):
+    """Return the exact (registered, anonymous) counts from the DB."""
+    if app_id is None:
+        sql, params = _site_counts_sql, {}
+    else:
+        sql, params = _project_counts_sql, dict(app_id=app_id)
+    row = db.slave_session.execute(sql, params).first()
+    return row.n_auth, row.n_anon
+
+
+def count(app_id=None, redis_conn=None):
+    """Return the (registered, anonymous) number of volunteers of a project,
+    or of the whole site if app_id is None."""
+    return count_many([app_id], redis_conn)[0]
+
+
+def add_volunteer(app_id, user_id=None, user_ip=None, redis_conn=None):
+    """Add the volunteer of a new TaskRun to the sketches of its project and
+    the site."""
+    kind, member = _volunteer(user_id, user_ip)
+    if kind is None:
+        return
+    redis_conn = redis_conn or sentinel.master
+    pipe = redis_conn.pipeline(transaction=False)
+    pipe.execute_command('PFADD', _sketch_key(app_id, kind), member)
+    pipe.execute_command('PFADD', _sketch_key(None, kind), member)
+    pipe.execute()
+
+
+def reset(app_id, redis_conn=None):
+    """Forget the sketches of a project, so they are built again from the DB
+    the next time they are read."""
+    redis_conn = redis_conn or sentinel.master
+    redis_conn.delete(_built_key(app_id), _sketch_key(app_id, AUTH),
+                      _sketch_key(app_id, ANON))
+
+
+def rebuild(app_id=None, redis_conn=None):
+    """Recount exactly the volunteers of a project (or the site, if app_id is
+    None), writing its sketches anew. Returns the (registered, anonymous)
+    counts."""
+    return build(app_id, redis_conn, replace=True)
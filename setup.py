@@ -1,7 +1,7 @@
 from setuptools import setup, find_packages
 
 requirements = [
-    "alembic>=0.6.4, <1.0",
+    "alembic>=0.6.5, <1.0",
     "beautifulsoup4>=4.3.2, <5.0",
     "blinker>=1.3, <2.0",
     "Flask-Babel>=0.9, <1.0",
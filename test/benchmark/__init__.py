@@ -0,0 +1,208 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2014 SF Isle of Man Limited
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Helpers for the benchmarks of the test suite.
+
+Benchmarks are slow, so they are skipped unless the PYBOSSA_BENCHMARK
+environment variable is set:
+
+    PYBOSSA_BENCHMARK=1 nosetests test/benchmark
+
+Results written with write_results go to the directory set in the
+PYBOSSA_BENCHMARK_OUTPUT environment variable (benchmark_results by default),
+one JSON file per benchmark and commit.
+
+"""
+import datetime
+import json
+import os
+import subprocess
+import time
+from nose.plugins.skip import SkipTest
+from sqlalchemy import event
+from sqlalchemy.sql import text
+
+from default import Test, db
+from factories import AppFactory
+
+
+class Benchmark(Test):
+
+    """Base class for the benchmarks."""
+
+    def setUp(self):
+        if not os.environ.get('PYBOSSA_BENCHMARK'):
+            raise SkipTest('Set PYBOSSA_BENCHMARK=1 to run the benchmarks')
+        super(Benchmark, self).setUp()
+
+
+def create_project(n_tasks, n_answers=30):
+    """Create a project with n_tasks tasks using bulk inserts."""
+    app = AppFactory.create()
+    sql = text('''INSERT INTO task (app_id, state, info, n_answers,
+               n_task_runs, priority_0, quorum, calibration)
+               SELECT :app_id, 'ongoing', '{}', :n_answers, 0, 0, 0, 0
+               FROM generate_series(1, :n_tasks);''')
+    db.session.execute(sql, dict(app_id=app.id, n_answers=n_answers,
+                                 n_tasks=n_tasks))
+    db.session.commit()
+    return app.id
+
+
+def add_task_runs(app_id, n_task_runs, n_volunteers=1000):
+    """Add n_task_runs anonymous task runs to a project using bulk inserts.
+
+    Task runs are spread round robin over the tasks of the project, and
+    n_volunteers different IPs."""
+    sql = text('''INSERT INTO task_run (app_id, task_id, user_ip, info,
+               created, finish_time)
+               SELECT :app_id, t.id,
+               '10.' || (g % :n_volunteers) / 65536 || '.'
+               || (g % :n_volunteers) / 256 % 256 || '.'
+               || (g % :n_volunteers) % 256,
+               '{}', NOW() AT TIME ZONE 'UTC',
+               NOW() AT TIME ZONE 'UTC'
+               FROM generate_series(0, :n_task_runs - 1) AS g
+               JOIN (SELECT id, row_number() OVER (ORDER BY id) - 1 AS rn,
+                     COUNT(*) OVER () AS total
+                     FROM task WHERE app_id=:app_id) AS t
+               ON t.rn = g % t.total;''')
+    db.session.execute(sql, dict(app_id=app_id, n_task_runs=n_task_runs,
+                                 n_volunteers=n_volunteers))
+    # Bulk inserts skip the TaskRun events, so update the counters here
+    sql = text('''UPDATE task SET n_task_runs=counts.n_task_runs
+               FROM (SELECT task_id, COUNT(id) AS n_task_runs FROM task_run
+                     WHERE app_id=:app_id GROUP BY task_id) AS counts
+               WHERE task.id=counts.task_id;''')
+    db.session.execute(sql, dict(app_id=app_id))
+    db.session.commit()
+
+
+def latencies(function, n_calls, *args, **kwargs):
+    """Return the sorted list of latencies (in ms) of n_calls calls."""
+    results = []
+    for i in range(n_calls):
+        start = time.time()
+        function(*args, **kwargs)
+        results.append((time.time() - start) * 1000)
+    return sorted(results)
+
+
+def percentile(sorted_values, pct):
+    """Return the pct percentile of a sorted list of values."""
+    if not sorted_values:
+        return None
+    index = int(round((len(sorted_values) - 1) * pct / 100.0))
+    return sorted_values[index]
+
+
+def add_users(n_users):
+    """Add n_users users using bulk inserts, and return their ids."""
+    sql = text('''INSERT INTO "user" (created, email_addr, name, fullname,
+               locale, api_key, privacy_mode, info)
+               SELECT NOW() AT TIME ZONE 'UTC',
+               'bench' || g || '@example.com',
+               'bench' || g, 'Bench ' || g, 'en', md5('bench' || g), true, '{}'
+               FROM generate_series(1, :n_users) AS g
+               RETURNING id;''')
+    ids = [row.id for row in db.session.execute(sql, dict(n_users=n_users))]
+    db.session.commit()
+    return ids
+
+
+def add_realistic_task_runs(app_id, n_task_runs, n_volunteers=1000,
+                            first_user_id=None):
+    """Add n_task_runs task runs over random tasks of a project.
+
+    Like in real projects, a few volunteers send most of the answers: the
+    volunteer of every task run follows a power law. Task runs are sent by the
+    n_volunteers users with consecutive ids from first_user_id or, if it is
+    not given, by n_volunteers anonymous IPs."""
+    if first_user_id:
+        volunteer = ':first_user_id + g.v, NULL'
+    else:
+        volunteer = "NULL, '10.0.' || g.v / 256 || '.' || g.v % 256"
+    sql = text('''INSERT INTO task_run (app_id, task_id, user_id, user_ip,
+               info, created, finish_time)
+               SELECT :app_id, bounds.min_id + floor(random() * bounds.total)::int,
+               %s, '{}', NOW() AT TIME ZONE 'UTC',
+               NOW() AT TIME ZONE 'UTC'
+               FROM (SELECT MIN(id) AS min_id, COUNT(id) AS total FROM task
+                     WHERE app_id=:app_id) AS bounds,
+               (SELECT floor(power(random(), 3) * :n_volunteers)::int AS v
+                FROM generate_series(1, :n_task_runs)) AS g;''' % volunteer)
+    db.session.execute(sql, dict(app_id=app_id, n_task_runs=n_task_runs,
+                                 n_volunteers=n_volunteers,
+                                 first_user_id=first_user_id))
+    # Bulk inserts skip the TaskRun events, so update the counters here
+    sql = text('''UPDATE task SET n_task_runs=counts.n_task_runs,
+               last_task_run_id=counts.last_task_run_id
+               FROM (SELECT task_id, COUNT(id) AS n_task_runs,
+                     MAX(id) AS last_task_run_id FROM task_run
+                     WHERE app_id=:app_id GROUP BY task_id) AS counts
+               WHERE task.id=counts.task_id;''')
+    db.session.execute(sql, dict(app_id=app_id))
+    db.session.commit()
+
+
+class QueryCounter(object):
+
+    """Context manager counting the SQL statements sent to the DB."""
+
+    def __init__(self):
+        self.count = 0
+        self.engines = set([db.engine, db.slave_session.get_bind()])
+
+    def _count(self, *args, **kwargs):
+        self.count += 1
+
+    def __enter__(self):
+        for engine in self.engines:
+            event.listen(engine, 'before_cursor_execute', self._count)
+        return self
+
+    def __exit__(self, *args):
+        for engine in self.engines:
+            event.remove(engine, 'before_cursor_execute', self._count)
+
+
+def measure(function, n_calls, *args, **kwargs):
+    """Return the p50, p95 and p99 latencies (in ms), and the SQL queries per
+    call, of n_calls calls."""
+    with QueryCounter() as counter:
+        results = latencies(function, n_calls, *args, **kwargs)
+    return dict(p50=percentile(results, 50), p95=percentile(results, 95),
+                p99=percentile(results, 99),
+                queries_per_call=float(counter.count) / n_calls)
+
+
+def write_results(name, results):
+    """Write the results of a benchmark as JSON, tagged with the commit."""
+    directory = os.environ.get('PYBOSSA_BENCHMARK_OUTPUT', 'benchmark_results')
+    try:
+        commit = subprocess.check_output(['git', 'rev-parse', 'HEAD']).strip()
+    except (OSError, subprocess.CalledProcessError):  # pragma: no cover
+        commit = 'unknown'
+    if not os.path.isdir(directory):
+        os.makedirs(directory)
+    path = os.path.join(directory, '%s-%s.json' % (name, commit[:12]))
+    with open(path, 'w') as f:
+        json.dump(dict(benchmark=name, commit=commit,
+                       date=datetime.datetime.utcnow().isoformat(),
+                       results=results), f, indent=2, sort_keys=True)
+    return path
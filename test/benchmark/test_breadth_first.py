@@ -0,0 +1,95 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2014 SF Isle of Man Limited
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+
+from sqlalchemy.sql import text
+from default import db, with_context
+from benchmark import Benchmark, create_project, add_task_runs, latencies, \
+    percentile
+from pybossa import task_leases
+from pybossa.model.task import Task
+from pybossa.model.task_run import TaskRun
+import pybossa.sched as sched
+
+
+def legacy_breadth_first_task(app_id, user_id=None, user_ip=None):
+    """The breadth first query before the n_task_runs counter and leases."""
+    sql = text('''
+               SELECT task.id, COUNT(task_run.task_id) AS taskcount FROM task
+               LEFT JOIN task_run ON (task.id = task_run.task_id)
+               WHERE NOT EXISTS
+               (SELECT 1 FROM task_run WHERE app_id=:app_id AND
+               user_ip=:user_ip AND task_id=task.id)
+               AND task.app_id=:app_id AND task.state !='completed'
+               group by task.id ORDER BY taskcount, id ASC LIMIT 10;
+               ''')
+    rows = db.slave_session.execute(sql, dict(app_id=app_id, user_ip=user_ip))
+    task_ids = [row.id for row in rows]
+    if task_ids:
+        return db.slave_session.query(Task).get(task_ids[0])
+    return None
+
+
+class TestBreadthFirst(Benchmark):
+
+    n_tasks = 100
+    n_answers = 3
+    n_volunteers = 50
+
+    def _over_collection(self, scheduler):
+        """Simulate rounds where every volunteer gets a task before anyone
+        answers, and return the answers collected over n_answers."""
+        app_id = create_project(self.n_tasks, n_answers=self.n_answers)
+        volunteers = ['10.1.0.%s' % i for i in range(self.n_volunteers)]
+        while True:
+            assigned = [(ip, scheduler(app_id, user_ip=ip))
+                        for ip in volunteers]
+            assigned = [(ip, task) for ip, task in assigned if task]
+            if not assigned:
+                break
+            for ip, task in assigned:
+                db.session.add(TaskRun(app_id=app_id, task_id=task.id,
+                                       user_ip=ip, info={}))
+                db.session.commit()
+                task_leases.release(task.id, user_ip=ip)
+        n_task_runs = db.session.query(TaskRun).filter_by(app_id=app_id).count()
+        return n_task_runs - self.n_tasks * self.n_answers
+
+    @with_context
+    def test_breadth_first_over_collection(self):
+        """Benchmark answers collected over n_answers with concurrent
+        volunteers"""
+        legacy = self._over_collection(legacy_breadth_first_task)
+        current = self._over_collection(sched.get_breadth_first_task)
+        print "breadth_first extra answers: legacy %s, current %s" % (
+            legacy, current)
+        assert current == 0, current
+        assert legacy > current, (legacy, current)
+
+    @with_context
+    def test_breadth_first_latency(self):
+        """Benchmark breadth_first latency against the legacy query"""
+        app_id = create_project(1000, n_answers=1000)
+        add_task_runs(app_id, 100000)
+        results = {}
+        for name, scheduler in [('legacy', legacy_breadth_first_task),
+                                ('current', sched.get_breadth_first_task)]:
+            scheduler(app_id, user_ip='192.168.0.1')
+            results[name] = percentile(
+                latencies(scheduler, 50, app_id, user_ip='192.168.0.1'), 50)
+        print "breadth_first median latencies (ms): %s" % results
+        assert results['current'] < results['legacy'], results
@@ -0,0 +1,82 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2014 SF Isle of Man Limited
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Benchmark of the cache serializers.
+
+For the output of some cached functions on a synthetic project, it compares
+the payload size and decode time of every serializer, with and without
+compression, against the protocol 0 pickles used before.
+
+"""
+import time
+from default import with_context
+from benchmark import Benchmark, create_project, add_task_runs, write_results
+from pybossa.cache.serializers import Serializer, msgpack
+import pybossa.cache.apps as cached_apps
+import pybossa.cache.project_stats as stats
+import pybossa.cache.site_stats as site_stats
+
+try:
+    import cPickle as pickle
+except ImportError:  # pragma: no cover
+    import pickle
+
+
+class TestCacheSerializers(Benchmark):
+
+    n_loads = 1000
+
+    def _outputs(self, app_id):
+        # The cache is disabled in the tests, so these compute their output
+        return dict(n_tasks=cached_apps.n_tasks(app_id),
+                    browse_tasks=cached_apps.browse_tasks(app_id),
+                    get_top=cached_apps.get_top(),
+                    get_stats=stats.get_stats(app_id),
+                    get_locs=site_stats.get_locs())
+
+    def _decode_ms(self, loads, payload):
+        start = time.time()
+        for i in range(self.n_loads):
+            loads(payload)
+        return (time.time() - start) * 1000 / self.n_loads
+
+    @with_context
+    def test_serializers(self):
+        """Benchmark the payload size and decode time of the serializers"""
+        app_id = create_project(5000, n_answers=3)
+        add_task_runs(app_id, 10000)
+        names = ['pickle', 'json'] + (['msgpack'] if msgpack else [])
+        results = []
+        for function, output in sorted(self._outputs(app_id).items()):
+            payload = pickle.dumps(output)
+            results.append(dict(function=function, serializer='pickle-0',
+                                bytes=len(payload),
+                                decode_ms=self._decode_ms(pickle.loads,
+                                                          payload)))
+            for name in names:
+                for compress_min_bytes in (0, 4096):
+                    serializer = Serializer(name, compress_min_bytes)
+                    payload = serializer.dumps(output)
+                    results.append(dict(
+                        function=function, serializer=name,
+                        compressed=payload[0] == 'Z', bytes=len(payload),
+                        decode_ms=self._decode_ms(serializer.loads, payload)))
+        for result in results:
+            print result
+        print "Results written to %s" % write_results('cache_serializers',
+                                                      results)
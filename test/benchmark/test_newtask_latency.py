@@ -0,0 +1,57 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2014 SF Isle of Man Limited
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+
+from default import with_context
+from benchmark import Benchmark, create_project, add_task_runs, latencies, \
+    percentile
+import pybossa.sched as sched
+
+
+class TestNewtaskLatency(Benchmark):
+
+    task_run_steps = [1000, 10000, 100000]
+    n_tasks = 1000
+    n_calls = 50
+
+    def _median_latencies(self, sched_name):
+        app_id = create_project(self.n_tasks, n_answers=1000)
+        added = 0
+        medians = []
+        for n_task_runs in self.task_run_steps:
+            add_task_runs(app_id, n_task_runs - added)
+            added = n_task_runs
+            # First call builds the answered set of the user
+            sched.new_task(app_id, sched_name, user_ip='192.168.0.1')
+            results = latencies(sched.new_task, self.n_calls, app_id,
+                                sched_name, user_ip='192.168.0.1')
+            medians.append(percentile(results, 50))
+        print "%s median latencies (ms) for %s task runs: %s" % (
+            sched_name, self.task_run_steps, medians)
+        return medians
+
+    @with_context
+    def test_depth_first_latency_is_flat(self):
+        """Benchmark depth_first newtask latency as task_run grows"""
+        medians = self._median_latencies('depth_first')
+        assert medians[-1] < 3 * medians[0] + 1, medians
+
+    @with_context
+    def test_depth_first_pool_latency_is_flat(self):
+        """Benchmark depth_first_pool newtask latency as task_run grows"""
+        medians = self._median_latencies('depth_first_pool')
+        assert medians[-1] < 3 * medians[0] + 1, medians
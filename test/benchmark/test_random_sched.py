@@ -0,0 +1,43 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2014 SF Isle of Man Limited
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+
+from default import with_context
+from benchmark import Benchmark, create_project, latencies, percentile
+import pybossa.sched as sched
+
+
+class TestRandomSchedLatency(Benchmark):
+
+    n_calls = 100
+
+    def _median_latency(self, n_tasks):
+        app_id = create_project(n_tasks)
+        # First call builds the task pool and the answered set of the user
+        sched.get_random_task(app_id, user_ip='192.168.0.1')
+        results = latencies(sched.get_random_task, self.n_calls, app_id,
+                            user_ip='192.168.0.1')
+        median = percentile(results, 50)
+        print "random median latency (ms) for %s tasks: %s" % (n_tasks, median)
+        return median
+
+    @with_context
+    def test_random_latency_does_not_grow_with_project_size(self):
+        """Benchmark random newtask latency for 1k and 1M tasks projects"""
+        small = self._median_latency(1000)
+        large = self._median_latency(1000000)
+        assert large < 3 * small + 1, (small, large)
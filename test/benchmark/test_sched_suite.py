@@ -0,0 +1,77 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2014 SF Isle of Man Limited
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Benchmark suite for the task schedulers.
+
+For every project size (number of task runs) it measures the latency
+percentiles and SQL queries per call of every registered scheduler, for an
+authenticated and an anonymous volunteer. Sizes can be set with the
+PYBOSSA_BENCHMARK_SIZES environment variable (comma separated), e.g.:
+
+    PYBOSSA_BENCHMARK=1 PYBOSSA_BENCHMARK_SIZES=10000,1000000,10000000 \\
+        nosetests test/benchmark/test_sched_suite.py
+
+"""
+import os
+from default import with_context
+from benchmark import Benchmark, create_project, add_users, \
+    add_realistic_task_runs, measure, write_results
+import pybossa.sched as sched
+
+
+class TestSchedSuite(Benchmark):
+
+    n_calls = 100
+    # Number of task runs per task, and per volunteer, of the projects
+    task_runs_per_task = 10
+    task_runs_per_volunteer = 100
+
+    def _sizes(self):
+        sizes = os.environ.get('PYBOSSA_BENCHMARK_SIZES', '10000,1000000')
+        return [int(size) for size in sizes.split(',')]
+
+    def _project(self, n_task_runs, authenticated):
+        n_tasks = max(n_task_runs / self.task_runs_per_task, 1)
+        n_volunteers = max(n_task_runs / self.task_runs_per_volunteer, 10)
+        app_id = create_project(n_tasks, n_answers=n_task_runs)
+        if authenticated:
+            user_ids = add_users(n_volunteers)
+            add_realistic_task_runs(app_id, n_task_runs, n_volunteers,
+                                    first_user_id=user_ids[0])
+            # The second most active volunteer of the project
+            return app_id, dict(user_id=user_ids[1])
+        add_realistic_task_runs(app_id, n_task_runs, n_volunteers)
+        return app_id, dict(user_ip='10.0.0.1')
+
+    @with_context
+    def test_schedulers(self):
+        """Benchmark every scheduler on synthetic projects"""
+        results = []
+        for n_task_runs in self._sizes():
+            for authenticated in (True, False):
+                app_id, volunteer = self._project(n_task_runs, authenticated)
+                for name in sorted(sched.schedulers):
+                    # Warm up the Redis structures of the scheduler
+                    sched.new_task(app_id, name, **volunteer)
+                    result = measure(sched.new_task, self.n_calls, app_id,
+                                     name, **volunteer)
+                    result.update(sched=name, n_task_runs=n_task_runs,
+                                  authenticated=authenticated)
+                    print result
+                    results.append(result)
+        print "Results written to %s" % write_results('sched', results)
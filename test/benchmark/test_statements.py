@@ -0,0 +1,76 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2014 SF Isle of Man Limited
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+"""
+Benchmark of the prepared statements against plain text() queries.
+
+It runs the hot queries of a newtask request (the scheduler candidates and
+the project counters) as many times as a busy server does, with the prepared
+statements enabled and disabled, and reports the time saved per call and per
+second at the given newtask rate.
+
+"""
+from default import with_context
+from benchmark import Benchmark, create_project, add_task_runs, latencies, \
+    percentile, write_results
+from pybossa import statements
+import pybossa.sched as sched
+import pybossa.cache.apps as cached_apps
+
+
+class TestStatements(Benchmark):
+
+    n_calls = 5000
+    # Newtask requests per second of a busy server
+    qps = 500
+
+    def tearDown(self):
+        statements.enabled = True
+        super(TestStatements, self).tearDown()
+
+    def _newtask_queries(self, app_id):
+        sched._candidate_task_ids(app_id, user_ip='10.0.0.1')
+        # The cache is disabled in the tests, so the counters hit the DB
+        cached_apps.n_tasks(app_id)
+        cached_apps.n_completed_tasks(app_id)
+        cached_apps.n_task_runs(app_id)
+
+    @with_context
+    def test_prepared_statements(self):
+        """Benchmark the hot queries with and without prepared statements"""
+        app_id = create_project(10000, n_answers=3)
+        add_task_runs(app_id, 10000)
+        results = []
+        for enabled in (False, True):
+            statements.enabled = enabled
+            statements.reset_stats()
+            # Prepare the statements in the connection
+            self._newtask_queries(app_id)
+            values = latencies(self._newtask_queries, self.n_calls, app_id)
+            result = dict(prepared=enabled,
+                          p50=percentile(values, 50),
+                          p95=percentile(values, 95),
+                          avg=sum(values) / len(values),
+                          statements=statements.get_stats())
+            print result
+            results.append(result)
+        saved_ms = results[0]['avg'] - results[1]['avg']
+        summary = dict(saved_ms_per_call=saved_ms,
+                       saved_ms_per_second=saved_ms * self.qps, qps=self.qps)
+        print summary
+        results.append(summary)
+        print "Results written to %s" % write_results('statements', results)
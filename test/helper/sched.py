@@ -49,6 +49,7 @@ class Helper(web.Helper):
         db.session.commit()
         # Update task.state
         db.session.query(model.task.Task).filter_by(app_id=app_id)\
-                  .update({"state": "ongoing"})
+                  .update({"state": "ongoing", "n_task_runs": 0,
+                           "last_task_run_id": None})
         db.session.commit()
         db.session.remove()
@@ -127,6 +127,8 @@ class Helper(Test):
     def delete_task_runs(self, app_id=1):
         """Deletes all TaskRuns for a given app_id"""
         db.session.query(TaskRun).filter_by(app_id=1).delete()
+        db.session.query(Task).filter_by(app_id=1)\
+                  .update({"n_task_runs": 0, "last_task_run_id": None})
         db.session.commit()
 
     def task_settings_scheduler(self, method="POST", short_name='sampleapp',
@@ -26,6 +26,8 @@ from pybossa.model.user import User
 from pybossa.model.app import App
 from pybossa.model.task import Task
 from pybossa.model.category import Category
+from pybossa import sched_stats
+from pybossa.cache.metrics import CacheMetrics
 
 
 FakeRequest = namedtuple('FakeRequest', ['text', 'status_code', 'headers'])
@@ -695,3 +697,47 @@ class TestAdmin(web.Helper):
         assert category['name'] in res.data, err_msg
         output = db.session.query(Category).get(obj.id)
         assert output.id == category['id'], err_msg
+
+
+    @with_context
+    def test_17_admin_schedulers_stats(self):
+        """Test ADMIN schedulers stats are available for admins only"""
+        sched_stats.record('default', 1, 5, 10, 1)
+        self.register()
+
+        res = self.app.get('/admin/schedulers?format=json')
+        stats = json.loads(res.data)
+        assert stats[0]['app_id'] == 1, stats
+        assert stats[0]['calls'] == 1, stats
+        res = self.app.get('/admin/schedulers')
+        assert res.status_code == 200, res.status_code
+        assert json.loads(res.data) == stats, res.data
+
+        self.signout()
+        self.register(fullname="Juan Jose", name="juan",
+                      password="juan")
+        res = self.app.get('/admin/schedulers?format=json')
+        assert res.status_code == 403, res.status_code
+
+
+    @with_context
+    def test_18_admin_cache_metrics(self):
+        """Test ADMIN cache metrics are available for admins only"""
+        metrics = CacheMetrics()
+        metrics.hit('pybossa.cache.apps.n_tasks')
+        metrics.flush()
+        self.register()
+
+        res = self.app.get('/admin/cache?format=json')
+        data = json.loads(res.data)
+        assert data[0]['function'] == 'pybossa.cache.apps.n_tasks', data
+        assert data[0]['hits'] == 1, data
+        res = self.app.get('/admin/cache')
+        assert res.status_code == 200, res.status_code
+        assert json.loads(res.data) == data, res.data
+
+        self.signout()
+        self.register(fullname="Juan Jose", name="juan",
+                      password="juan")
+        res = self.app.get('/admin/cache?format=json')
+        assert res.status_code == 403, res.status_code
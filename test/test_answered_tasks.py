@@ -0,0 +1,165 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2014 SF Isle of Man Limited
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+
+import time
+from default import Test, sentinel
+from pybossa import answered_tasks
+from pybossa.cache.helpers import n_available_tasks
+from factories import AppFactory, TaskFactory, TaskRunFactory, \
+    AnonymousTaskRunFactory, UserFactory, task_repo
+
+
+class TestAnsweredTasks(Test):
+
+    def test_get_answered_builds_set_from_db(self):
+        """Test ANSWERED_TASKS builds the set of a user from the DB"""
+        app = AppFactory.create()
+        user = UserFactory.create()
+        task, other_task = TaskFactory.create_batch(2, app=app)
+        TaskRunFactory.create(task=task, user=user)
+        AnonymousTaskRunFactory.create(task=other_task)
+
+        assert answered_tasks.get_answered(app.id, user_id=user.id) == set([task.id])
+        assert answered_tasks.get_answered(app.id, user_ip='127.0.0.1') == set([other_task.id])
+
+    def test_get_answered_empty_set_is_stored(self):
+        """Test ANSWERED_TASKS stores the set even if the user has no answers"""
+        app = AppFactory.create()
+
+        answered = answered_tasks.get_answered(app.id, user_ip='10.0.0.1')
+
+        assert answered == set(), answered
+        key = answered_tasks._answered_key(app.id, user_ip='10.0.0.1')
+        assert sentinel.master.exists(key)
+
+    def test_new_task_run_is_added_to_built_set(self):
+        """Test ANSWERED_TASKS adds new task runs to an existing set"""
+        app = AppFactory.create()
+        user = UserFactory.create()
+        task = TaskFactory.create(app=app)
+        answered_tasks.get_answered(app.id, user_id=user.id)
+
+        TaskRunFactory.create(task=task, user=user)
+
+        assert answered_tasks.get_answered(app.id, user_id=user.id) == set([task.id])
+
+    def test_answers_added_while_building_are_kept(self):
+        """Test ANSWERED_TASKS merges the answers added while a set is built
+        with the ones read from the DB"""
+        app = AppFactory.create()
+        user = UserFactory.create()
+        task = TaskFactory.create(app=app)
+        answered_tasks.add_answer(app.id, task.id, user_id=user.id)
+
+        answered_tasks.build_answered(app.id, user_id=user.id)
+
+        assert answered_tasks.get_answered(app.id, user_id=user.id) == set([task.id])
+
+    def test_deleted_task_run_is_removed_from_set(self):
+        """Test ANSWERED_TASKS removes deleted task runs from the set"""
+        app = AppFactory.create()
+        task = TaskFactory.create(app=app)
+        task_run = AnonymousTaskRunFactory.create(task=task)
+        answered_tasks.get_answered(app.id, user_ip='127.0.0.1')
+
+        task_repo.delete(task_run)
+
+        assert answered_tasks.get_answered(app.id, user_ip='127.0.0.1') == set()
+
+    def test_rebuild_project(self):
+        """Test ANSWERED_TASKS rebuild_project writes a set per user"""
+        app = AppFactory.create()
+        user = UserFactory.create()
+        task = TaskFactory.create(app=app)
+        TaskRunFactory.create(task=task, user=user)
+        AnonymousTaskRunFactory.create(task=task)
+        self.redis_flushall()
+
+        n_sets = answered_tasks.rebuild_project(app.id)
+
+        assert n_sets == 2, n_sets
+        key = answered_tasks._answered_key(app.id, user_id=user.id)
+        assert sentinel.master.sismember(key, answered_tasks._member(task.id))
+
+    def test_filter_unanswered(self):
+        """Test ANSWERED_TASKS filter_unanswered keeps the tasks not answered"""
+        app = AppFactory.create()
+        task, other_task = TaskFactory.create_batch(2, app=app)
+        AnonymousTaskRunFactory.create(task=task)
+
+        task_ids = [other_task.id, task.id]
+        unanswered = answered_tasks.filter_unanswered(app.id, task_ids,
+                                                      user_ip='127.0.0.1')
+        assert unanswered == [other_task.id], unanswered
+        # Now read from the set built by the first call
+        unanswered = answered_tasks.filter_unanswered(app.id, task_ids,
+                                                      user_ip='127.0.0.1')
+        assert unanswered == [other_task.id], unanswered
+
+    def test_n_available_tasks_uses_answered_set(self):
+        """Test ANSWERED_TASKS n_available_tasks discounts the answered tasks"""
+        app = AppFactory.create()
+        task = TaskFactory.create(app=app)
+        TaskFactory.create(app=app)
+        TaskFactory.create(app=app, state='completed')
+        AnonymousTaskRunFactory.create(task=task)
+
+        assert n_available_tasks(app.id, user_ip='127.0.0.1') == 1
+        assert n_available_tasks(app.id, user_ip='10.0.0.1') == 2
+
+    def test_n_available_tasks_is_up_to_date(self):
+        """Test ANSWERED_TASKS n_available_tasks counts the new answers at
+        once"""
+        app = AppFactory.create()
+        task = TaskFactory.create(app=app)
+        assert n_available_tasks(app.id, user_ip='127.0.0.1') == 1
+
+        AnonymousTaskRunFactory.create(task=task)
+
+        assert n_available_tasks(app.id, user_ip='127.0.0.1') == 0
+
+    def test_filter_unanswered_without_redis(self):
+        """Test ANSWERED_TASKS filter_unanswered checks the task_run table when
+        Redis is not available"""
+        app = AppFactory.create()
+        task, other_task = TaskFactory.create_batch(2, app=app)
+        AnonymousTaskRunFactory.create(task=task)
+        sentinel.master.breaker.opened_at = time.time()
+        try:
+            unanswered = answered_tasks.filter_unanswered(
+                app.id, [other_task.id, task.id], user_ip='127.0.0.1')
+        finally:
+            sentinel.master.breaker.close()
+
+        assert unanswered == [other_task.id], unanswered
+
+    def test_n_available_tasks_without_redis(self):
+        """Test ANSWERED_TASKS n_available_tasks counts in the DB when Redis is
+        not available"""
+        app = AppFactory.create()
+        task = TaskFactory.create(app=app)
+        TaskFactory.create(app=app)
+        TaskFactory.create(app=app, state='completed')
+        AnonymousTaskRunFactory.create(task=task)
+        sentinel.master.breaker.opened_at = time.time()
+        try:
+            n_tasks = n_available_tasks(app.id, user_ip='127.0.0.1')
+        finally:
+            sentinel.master.breaker.close()
+
+        assert n_tasks == 1, n_tasks
@@ -17,7 +17,7 @@
 # along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
 import json
 from mock import patch
-from default import db, with_context
+from default import db, sentinel, with_context
 from nose.tools import assert_equal, assert_raises
 from test_api import TestAPI
 
@@ -645,3 +645,67 @@ class TestAppAPI(TestAPI):
         url = '/api/app/%s/newtask?offset=1000' % app.id
         res = self.app.get(url)
         assert res.data == '{}', res.data
+
+
+    @with_context
+    def test_newtasks(self):
+        """Test API project new_tasks method returns n tasks in order"""
+        app = AppFactory.create()
+        tasks = TaskFactory.create_batch(3, app=app)
+
+        res = self.app.get('/api/app/%s/newtasks?n=2' % app.id)
+        data = json.loads(res.data)
+
+        assert res.mimetype == 'application/json', res
+        assert [t['id'] for t in data] == [tasks[0].id, tasks[1].id], data
+
+        # Get NotFound for an non-existing app
+        res = self.app.get('/api/app/5000/newtasks?n=2')
+        err = json.loads(res.data)
+        assert err['status_code'] == 404, err
+        assert err['exception_cls'] == 'NotFound', err
+
+    @with_context
+    def test_newtasks_marks_all_tasks_as_requested(self):
+        """Test API project new_tasks marks every task as requested"""
+        app = AppFactory.create()
+        tasks = TaskFactory.create_batch(2, app=app)
+
+        self.app.get('/api/app/%s/newtasks?n=2' % app.id)
+
+        for task in tasks:
+            key = 'pybossa:task_requested:user:127.0.0.1:task:%s' % task.id
+            assert sentinel.master.get(key), key
+
+    @with_context
+    def test_newtasks_is_capped(self):
+        """Test API project new_tasks does not return more than MAX_NEW_TASKS"""
+        from pybossa.api import MAX_NEW_TASKS
+        app = AppFactory.create()
+        TaskFactory.create_batch(MAX_NEW_TASKS + 1, app=app)
+
+        res = self.app.get('/api/app/%s/newtasks?n=1000' % app.id)
+
+        assert len(json.loads(res.data)) == MAX_NEW_TASKS, res.data
+
+    @with_context
+    def test_newtask_anywhere(self):
+        """Test API new_task_anywhere returns a task of a project needing
+        answers, or an empty object"""
+        app = AppFactory.create()
+        task = TaskFactory.create(app=app)
+        AppFactory.create(allow_anonymous_contributors=False)
+
+        res = self.app.get('/api/newtask')
+        data = json.loads(res.data)
+
+        assert res.mimetype == 'application/json', res
+        assert data['id'] == task.id, data
+        key = 'pybossa:task_requested:user:127.0.0.1:task:%s' % task.id
+        assert sentinel.master.get(key), key
+
+        task.state = 'completed'
+        task_repo.update(task)
+        sentinel.master.delete('pybossa:router:apps:anonymous')
+        res = self.app.get('/api/newtask')
+        assert res.data == '{}', res.data
@@ -217,6 +217,32 @@ class TestTaskAPI(TestAPI):
         assert err['exception_cls'] == 'TypeError', err
 
 
+    @with_context
+    def test_task_reserved_keys_are_ignored(self):
+        """Test API task POST and PUT ignore the attributes kept by PyBossa"""
+        user = UserFactory.create()
+        app = AppFactory.create(owner=user)
+        reserved = dict(n_task_runs=5, last_task_run_id=10,
+                        completed_at='2015-01-01T00:00:00')
+        data = dict(app_id=app.id, info='my task data', **reserved)
+
+        url = '/api/task?api_key=%s' % user.api_key
+        res = self.app.post(url, data=json.dumps(data))
+        out = json.loads(res.data)
+        assert_equal(res.status, '200 OK', res.data)
+        assert out['n_task_runs'] == 0, out
+        assert out['last_task_run_id'] is None, out
+        assert out['completed_at'] is None, out
+
+        url = '/api/task/%s?api_key=%s' % (out['id'], user.api_key)
+        res = self.app.put(url, data=json.dumps(reserved))
+        out = json.loads(res.data)
+        assert_equal(res.status, '200 OK', res.data)
+        assert out['n_task_runs'] == 0, out
+        assert out['last_task_run_id'] is None, out
+        assert out['completed_at'] is None, out
+
+
     @with_context
     def test_task_delete(self):
         """Test API task delete"""
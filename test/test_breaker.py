@@ -0,0 +1,149 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2014 SF Isle of Man Limited
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import time
+from mock import patch, Mock
+from nose.tools import assert_raises
+from redis.exceptions import ConnectionError, ResponseError
+from pybossa.sentinel.breaker import CircuitBreaker, CircuitOpenError, \
+    BreakerRedis
+from pybossa.ratelimit import RateLimit
+from default import Test, with_context, sentinel
+from factories import AppFactory, TaskFactory, AnonymousTaskRunFactory
+
+
+def fail():
+    raise ConnectionError('down')
+
+
+class TestCircuitBreaker(object):
+
+    @patch('pybossa.sentinel.breaker.threading.Thread')
+    def test_opens_after_max_failures(self, thread):
+        """Test BREAKER fails fast after max_failures connection errors in a
+        row, and starts probing for recovery"""
+        breaker = CircuitBreaker('master', max_failures=2)
+        function = Mock(side_effect=fail)
+
+        for i in range(2):
+            assert_raises(ConnectionError, breaker.call, function)
+        assert_raises(CircuitOpenError, breaker.call, function)
+
+        assert function.call_count == 2, function.call_count
+        assert thread.return_value.start.call_count == 1
+
+    def test_other_errors_and_successes_do_not_open_it(self):
+        """Test BREAKER only counts consecutive connection errors"""
+        breaker = CircuitBreaker('master', max_failures=2)
+
+        assert_raises(ConnectionError, breaker.call, fail)
+        assert breaker.call(lambda: 'ok') == 'ok'
+        assert_raises(ConnectionError, breaker.call, fail)
+        assert_raises(ResponseError, breaker.call,
+                      Mock(side_effect=ResponseError))
+
+        assert not breaker.is_open
+
+    @patch('pybossa.sentinel.breaker.time.sleep')
+    def test_probe_closes_the_circuit(self, sleep):
+        """Test BREAKER closes the circuit once the probe succeeds"""
+        probe = Mock(side_effect=[ConnectionError, 'PONG'])
+        breaker = CircuitBreaker('master', probe=probe, max_failures=1)
+        breaker.opened_at = 1
+
+        breaker._probe()
+
+        assert probe.call_count == 2, probe.call_count
+        assert not breaker.is_open
+        assert breaker.call(lambda: 'ok') == 'ok'
+
+    @patch('pybossa.sentinel.breaker.threading.Thread')
+    def test_breaker_redis_fails_fast(self, thread):
+        """Test BREAKER commands and pipelines of a BreakerRedis fail at once
+        when its circuit is open"""
+        redis_conn = BreakerRedis(port=1)
+        redis_conn.set_breaker('master', max_failures=1)
+
+        assert_raises(ConnectionError, redis_conn.get, 'key')
+        assert_raises(CircuitOpenError, redis_conn.get, 'key')
+        pipe = redis_conn.pipeline()
+        pipe.incr('key')
+        assert_raises(CircuitOpenError, pipe.execute)
+
+
+class TestRateLimitFallback(object):
+
+    @patch('pybossa.ratelimit.sentinel')
+    def test_requests_are_counted_locally_without_redis(self, sentinel):
+        """Test RATE LIMIT counts the requests in the worker when Redis is not
+        available"""
+        sentinel.master.pipeline.return_value.execute.side_effect = fail
+
+        limits = [RateLimit('rate-limit/test/', 2, 300, True)
+                  for i in range(3)]
+
+        assert [limit.current for limit in limits] == [1, 2, 2]
+        assert limits[-1].over_limit
+
+
+class TestContributingWithoutRedis(Test):
+
+    def open_circuits(self):
+        for redis_conn in (sentinel.master, sentinel.slave):
+            redis_conn.breaker.opened_at = time.time()
+
+    def close_circuits(self):
+        for redis_conn in (sentinel.master, sentinel.slave):
+            redis_conn.breaker.close()
+
+    @with_context
+    def test_newtask_without_redis(self):
+        """Test BREAKER every scheduler hands out tasks while the circuits
+        are open"""
+        for sched in ('default', 'breadth_first', 'depth_first_pool',
+                      'depth_first_lease', 'random', 'incremental'):
+            info = {'task_presenter': '<div></div>', 'sched': sched}
+            app = AppFactory.create(info=info)
+            answered, task = TaskFactory.create_batch(2, app=app)
+            AnonymousTaskRunFactory.create(task=answered)
+            self.open_circuits()
+            try:
+                res = self.app.get('/api/app/%s/newtask' % app.id)
+            finally:
+                self.close_circuits()
+
+            assert res.status_code == 200, (sched, res.status_code)
+            assert json.loads(res.data)['id'] == task.id, (sched, res.data)
+
+    @with_context
+    def test_project_pages_without_redis(self):
+        """Test BREAKER the project and presenter pages are served while the
+        circuits are open"""
+        app = AppFactory.create()
+        task = TaskFactory.create(app=app)
+        AnonymousTaskRunFactory.create(task=task, user_ip='10.0.0.1')
+        self.open_circuits()
+        try:
+            details = self.app.get('/app/%s/' % app.short_name)
+            presenter = self.app.get('/app/%s/newtask' % app.short_name)
+        finally:
+            self.close_circuits()
+
+        assert details.status_code == 200, details.status_code
+        assert presenter.status_code == 200, presenter.status_code
@@ -19,7 +19,8 @@
 import hashlib
 from mock import patch
 from pybossa.cache import (get_key_to_hash, get_hash_key, cache, memoize,
-                           delete_cached, delete_memoized)
+                           delete_cached, delete_memoized, delete_tag,
+                           get_many)
 from pybossa.sentinel import Sentinel
 from settings_test import REDIS_SENTINEL, REDIS_KEYPREFIX
 
@@ -288,16 +289,127 @@ class TestCacheMemoizeFunctions(object):
         only function is specified and no arguments of the calls are provided"""
 
         @memoize()
-        def my_func(*args, **kwargs):
-            return [args, kwargs]
+        def my_func(arg, calls=[]):
+            calls.append(arg)
+            return len(calls)
         @memoize()
-        def my_other_func(*args, **kwargs):
-            return [args, kwargs]
-        my_func('arg', kwarg='kwarg')
-        my_func('other', kwarg='other')
-        my_other_func('arg', kwarg='kwarg')
-        assert len(test_sentinel.master.keys()) == 3
+        def my_other_func(arg, calls=[]):
+            calls.append(arg)
+            return len(calls)
+        my_func('arg')
+        my_func('other')
+        my_other_func('arg')
 
         delete_succedeed = delete_memoized(my_func)
         assert delete_succedeed is True, delete_succedeed
-        assert len(test_sentinel.master.keys()) == 1
+        assert my_func('arg') == 3
+        assert my_func('other') == 4
+        assert my_other_func('arg') == 1
+
+
+    def test_delete_memoized_does_not_scan_keys(self):
+        """Test CACHE delete_memoized does not scan the keyspace to delete all
+        the function calls"""
+
+        @memoize()
+        def my_func(*args, **kwargs):
+            return [args, kwargs]
+        my_func('arg')
+
+        with patch.object(test_sentinel.slave, 'keys') as keys:
+            delete_memoized(my_func)
+            assert not keys.called
+
+
+    def test_delete_tag_deletes_the_values_of_the_family(self):
+        """Test CACHE delete_tag deletes the values of the functions tagged
+        with it, and only those"""
+
+        @memoize(tags=lambda arg: ['family:%s' % arg])
+        def my_func(arg, calls=[]):
+            calls.append(arg)
+            return len(calls)
+        my_func(1)
+        my_func(2)
+
+        assert delete_tag('family:1') is True
+        assert my_func(1) == 3
+        assert my_func(2) == 2
+
+
+    def test_tags_are_a_list_or_a_function_in_both_decorators(self):
+        """Test CACHE cache and memoize take the tags as a list or as a
+        function of the arguments"""
+
+        @cache(key_prefix='my_cached_func', tags=lambda: ['family'])
+        def my_cached_func(calls=[]):
+            calls.append(1)
+            return len(calls)
+
+        @memoize(tags=['family'])
+        def my_memoized_func(arg, calls=[]):
+            calls.append(arg)
+            return len(calls)
+        my_cached_func()
+        my_memoized_func(1)
+
+        assert delete_tag('family') is True
+        assert my_cached_func() == 2
+        assert my_memoized_func(1) == 2
+
+
+    def test_get_many_computes_the_misses_with_the_batch_function(self):
+        """Test CACHE get_many computes the missing values at once with the
+        batch function, and returns the cached ones"""
+        batches = []
+
+        def my_batch(calls):
+            batches.append(calls)
+            return [args[0] * 10 for args in calls]
+
+        @memoize(batch=my_batch)
+        def my_func(arg):
+            return arg * 10
+        my_func(1)
+
+        values = get_many([(my_func, (1,)), (my_func, (2,)), (my_func, (3,))])
+
+        assert values == [10, 20, 30], values
+        assert batches == [[(2,), (3,)]], batches
+        assert get_many([(my_func, (2,)), (my_func, (3,))]) == [20, 30]
+        assert len(batches) == 1, batches
+
+
+    def test_get_many_reads_the_cache_with_one_round_trip(self):
+        """Test CACHE get_many reads all the values, of any function, with a
+        single MGET"""
+
+        @memoize()
+        def my_func(arg):
+            return arg
+
+        @memoize(tags=lambda arg: ['family:%s' % arg])
+        def my_other_func(arg):
+            return -arg
+        calls = [(my_func, (1,)), (my_other_func, (1,)), (my_func, (2,))]
+        get_many(calls)
+
+        with patch.object(test_sentinel.slave, 'mget',
+                          wraps=test_sentinel.slave.mget) as mget:
+            assert get_many(calls) == [1, -1, 2]
+            assert mget.call_count == 1, mget.call_count
+
+
+    def test_get_many_respects_the_invalidations(self):
+        """Test CACHE get_many does not return the values of invalidated
+        families"""
+
+        @memoize(tags=lambda arg: ['family:%s' % arg])
+        def my_func(arg, calls=[]):
+            calls.append(arg)
+            return len(calls)
+        get_many([(my_func, (1,)), (my_func, (2,))])
+
+        delete_tag('family:1')
+
+        assert get_many([(my_func, (1,)), (my_func, (2,))]) == [3, 2]
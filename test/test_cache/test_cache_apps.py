@@ -352,6 +352,28 @@ class TestAppsCache(Test):
         assert total_volunteers == 5, err_msg
 
 
+    def test_batched_stats_match_the_project_stats(self):
+        """Test CACHE PROJECTS the stats of the listings, computed for all
+        the projects of a page at once, match the stats of each project"""
+
+        apps = [self.create_app_with_contributors(anonymous=2, registered=1,
+                                                  name='app%s' % i)
+                for i in range(2)]
+        apps.append(self.create_app_with_tasks(completed_tasks=1,
+                                               ongoing_tasks=3))
+        rows = [dict(id=app.id) for app in apps]
+
+        cached_apps._add_stats(rows)
+
+        for app, row in zip(apps, rows):
+            assert row['n_tasks'] == cached_apps.n_tasks(app.id), row
+            assert row['n_volunteers'] == cached_apps.n_volunteers(app.id), row
+            assert row['overall_progress'] == \
+                cached_apps.overall_progress(app.id), row
+            assert row['last_activity_raw'] == \
+                cached_apps.last_activity(app.id), row
+
+
     def test_n_draft_no_drafts(self):
         """Test CACHE PROJECTS _n_draft returns 0 if there are no draft projects"""
         # Here, we are suposing that a project is draft iff has no presenter AND has no tasks
@@ -0,0 +1,197 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2014 SF Isle of Man Limited
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+from mock import patch, Mock
+from redis.exceptions import ConnectionError
+from pybossa.cache import memoize, delete_memoized, delete_tag
+from pybossa.cache.local import LocalCache
+from test_cache import test_sentinel
+
+
+class TestLocalCache(object):
+
+    def test_get_returns_stored_value(self):
+        """Test LOCAL_CACHE get returns the stored value, or None"""
+        cache = LocalCache(max_bytes=100)
+        cache.set('key', 'value')
+
+        assert cache.get('key') == 'value'
+        assert cache.get('other') is None
+
+    def test_expired_values_are_not_returned(self):
+        """Test LOCAL_CACHE get does not return expired values"""
+        cache = LocalCache(max_bytes=100)
+        cache.set('key', 'value', timeout=-1)
+
+        assert cache.get('key') is None
+        assert cache.n_bytes == 0, cache.n_bytes
+
+    def test_least_recently_used_values_are_evicted(self):
+        """Test LOCAL_CACHE evicts the least recently used values when the
+        memory bound is reached"""
+        cache = LocalCache(max_bytes=10)
+        cache.set('a', '1234')
+        cache.set('b', '1234')
+        cache.get('a')
+
+        cache.set('c', '1234')
+
+        assert cache.get('b') is None
+        assert cache.get('a') == '1234'
+        assert cache.n_bytes == 8, cache.n_bytes
+
+    def test_invalidate(self):
+        """Test LOCAL_CACHE invalidate evicts a key, or all the keys with a
+        prefix"""
+        cache = LocalCache(max_bytes=100)
+        for key in ('func:1', 'func:2', 'other:1'):
+            cache.set(key, 'value')
+
+        cache.invalidate('func:1')
+        assert cache.get('func:1') is None
+        assert cache.get('func:2') == 'value'
+
+        cache.invalidate('func:*')
+        assert cache.get('func:2') is None
+        assert cache.get('other:1') == 'value'
+
+    def test_invalidate_family(self):
+        """Test LOCAL_CACHE invalidate evicts only the keys of a family"""
+        cache = LocalCache(max_bytes=100)
+        cache.set('func:1', 'value', families=['app:1'])
+        cache.set('func:2', 'value', families=['app:1', 'app:2'])
+        cache.set('func:3', 'value', families=['app:2'])
+
+        cache.invalidate('family:app:1')
+
+        assert cache.get('func:1') is None
+        assert cache.get('func:2') is None
+        assert cache.get('func:3') == 'value'
+        assert cache.n_bytes == 5, cache.n_bytes
+
+    def test_bad_message_does_not_clear_the_cache(self):
+        """Test LOCAL_CACHE a message that can not be applied does not evict
+        the rest of the cache"""
+        cache = LocalCache(max_bytes=100)
+        cache.set('func:1', 'value')
+        cache.set('func:2', 'value')
+
+        cache._on_message(dict(type='message', data=None))
+        cache._on_message(dict(type='message', data='func:1'))
+
+        assert cache.get('func:1') is None
+        assert cache.get('func:2') == 'value'
+
+
+@patch('pybossa.cache.sentinel', new=test_sentinel)
+@patch.object(LocalCache, 'listen')
+class TestMemoizeWithLocalCache(object):
+
+    def setUp(self):
+        self.cache = os.environ.pop('PYBOSSA_REDIS_CACHE_DISABLED', None)
+        test_sentinel.master.flushall()
+
+    def tearDown(self):
+        if self.cache:
+            os.environ['PYBOSSA_REDIS_CACHE_DISABLED'] = self.cache
+
+    def test_memoize_serves_values_from_local_cache(self, listen):
+        """Test CACHE memoize serves the values from the local cache without
+        going to Redis"""
+        local = LocalCache(max_bytes=1000)
+
+        @memoize()
+        def my_func(arg):
+            return arg
+
+        with patch('pybossa.cache.local_cache', new=local):
+            my_func(1)
+            test_sentinel.master.flushall()
+
+            assert my_func(1) == 1
+            assert test_sentinel.master.keys() == []
+
+    def test_delete_memoized_invalidates_local_cache(self, listen):
+        """Test CACHE delete_memoized evicts the values from the local cache
+        and publishes the invalidation"""
+        local = LocalCache(max_bytes=1000)
+
+        @memoize()
+        def my_func(arg, calls=[]):
+            calls.append(arg)
+            return len(calls)
+
+        with patch('pybossa.cache.local_cache', new=local):
+            with patch.object(test_sentinel.master, 'publish') as publish:
+                my_func(1)
+                delete_memoized(my_func)
+
+                assert my_func(1) == 2
+                assert publish.called
+
+    def test_delete_tag_only_evicts_its_family(self, listen):
+        """Test CACHE delete_tag evicts from the local cache the values of the
+        family, and only those"""
+        local = LocalCache(max_bytes=1000)
+
+        @memoize(tags=lambda arg: ['app:%s' % arg])
+        def my_func(arg):
+            return arg
+
+        with patch('pybossa.cache.local_cache', new=local):
+            my_func(1)
+            my_func(2)
+
+            delete_tag('app:1')
+
+            assert local.get(my_func.get_key(1)) is None
+            assert local.get(my_func.get_key(2)) is not None
+
+
+class TestCacheFallback(object):
+
+    def setUp(self):
+        self.cache = os.environ.pop('PYBOSSA_REDIS_CACHE_DISABLED', None)
+
+    def tearDown(self):
+        if self.cache:
+            os.environ['PYBOSSA_REDIS_CACHE_DISABLED'] = self.cache
+
+    def test_memoize_uses_the_fallback_cache_without_redis(self):
+        """Test CACHE memoize serves the values from the in process fallback
+        cache while Redis is not available"""
+        sentinel = Mock()
+        sentinel.slave.mget.side_effect = ConnectionError
+        sentinel.master.incr.side_effect = ConnectionError
+        calls = []
+
+        @memoize()
+        def my_func(arg):
+            calls.append(arg)
+            return arg
+
+        with patch('pybossa.cache.sentinel', new=sentinel):
+            with patch('pybossa.cache.fallback_cache',
+                       new=LocalCache(max_bytes=1000)):
+                assert my_func(1) == 1
+                assert my_func(1) == 1
+                assert delete_memoized(my_func) is False
+                assert my_func(1) == 1
+
+        assert calls == [1, 1], calls
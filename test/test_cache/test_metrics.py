@@ -0,0 +1,116 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2014 SF Isle of Man Limited
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+from mock import patch, MagicMock
+from redis.exceptions import ConnectionError
+from pybossa.cache import memoize
+from pybossa.cache.metrics import CacheMetrics, get_metrics
+from test_cache import test_sentinel
+
+
+class TestCacheMetrics(object):
+
+    def setUp(self):
+        test_sentinel.master.flushall()
+
+    def test_record_and_get_metrics(self):
+        """Test CACHE_METRICS aggregates the hits, misses and computations
+        of every function, the most expensive first"""
+        metrics = CacheMetrics()
+        metrics.hit('cheap')
+        metrics.hit('cheap', local=True)
+        metrics.miss('cheap')
+        metrics.computed('cheap', 0.001, 100)
+        metrics.miss('expensive')
+        metrics.computed('expensive', 2, 1000)
+        metrics.flush(test_sentinel.master)
+
+        data = get_metrics(test_sentinel.master)
+
+        assert [m['function'] for m in data] == ['expensive', 'cheap'], data
+        assert data[1]['hits'] == 2, data
+        assert data[1]['local_hits'] == 1, data
+        assert round(data[1]['hit_ratio'], 2) == 0.67, data
+        assert data[0]['p95_compute_ms'] == 2500, data
+        assert data[0]['avg_bytes'] == 1000, data
+
+    def test_counts_are_flushed_every_interval(self):
+        """Test CACHE_METRICS only writes to Redis once the flush interval
+        has passed"""
+        metrics = CacheMetrics(flush_interval=3600)
+
+        with patch.object(metrics, 'flush') as flush:
+            metrics.hit('my_func')
+            assert not flush.called
+            metrics.flush_interval = 0
+            metrics.hit('my_func')
+            assert flush.called
+
+    def test_counts_are_kept_if_redis_is_not_available(self):
+        """Test CACHE_METRICS keeps the counts for the next flush when Redis
+        is not available"""
+        metrics = CacheMetrics()
+        unavailable = MagicMock()
+        unavailable.pipeline.return_value.execute.side_effect = ConnectionError
+        metrics.hit('my_func')
+
+        metrics.flush(unavailable)
+        metrics.hit('my_func')
+        metrics.flush(test_sentinel.master)
+
+        assert get_metrics(test_sentinel.master)[0]['hits'] == 2
+
+    def test_disabled_metrics_are_not_counted(self):
+        """Test CACHE_METRICS does not count anything when disabled"""
+        metrics = CacheMetrics(enabled=False)
+        metrics.hit('my_func')
+        metrics.flush(test_sentinel.master)
+
+        assert get_metrics(test_sentinel.master) == []
+
+
+@patch('pybossa.cache.sentinel', new=test_sentinel)
+class TestMemoizeMetrics(object):
+
+    def setUp(self):
+        self.cache = os.environ.pop('PYBOSSA_REDIS_CACHE_DISABLED', None)
+        test_sentinel.master.flushall()
+
+    def tearDown(self):
+        if self.cache:
+            os.environ['PYBOSSA_REDIS_CACHE_DISABLED'] = self.cache
+
+    def test_memoize_records_hits_and_misses(self):
+        """Test CACHE memoize counts the hits, misses and computations of
+        the function"""
+        metrics = CacheMetrics()
+
+        @memoize()
+        def my_func(arg):
+            return arg
+
+        with patch('pybossa.cache.metrics', new=metrics):
+            my_func(1)
+            my_func(1)
+            metrics.flush(test_sentinel.master)
+
+        data = get_metrics(test_sentinel.master)
+        assert data[0]['function'].endswith('.my_func'), data
+        assert (data[0]['hits'], data[0]['misses'],
+                data[0]['computations']) == (1, 1, 1), data
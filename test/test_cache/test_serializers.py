@@ -0,0 +1,123 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2014 SF Isle of Man Limited
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+
+import datetime
+import os
+from mock import patch
+from nose.tools import assert_raises
+from pybossa.cache import memoize, cache
+from pybossa.cache.serializers import Serializer, is_plain, msgpack
+from test_cache import test_sentinel
+
+
+class TestSerializers(object):
+
+    def serializers(self):
+        names = ['pickle', 'json']
+        if msgpack is not None:
+            names.append('msgpack')
+        return [Serializer(name) for name in names]
+
+    def test_round_trip(self):
+        """Test SERIALIZERS decode the values they encode"""
+        values = [None, 0, [], {}, u'ñ', 'str', 1.5, [{'a': [1, None]}],
+                  (1, 2), {1: 'a'}, datetime.datetime(2014, 1, 1)]
+        for serializer in self.serializers():
+            for value in values:
+                decoded = serializer.loads(serializer.dumps(value))
+                assert decoded == value, (serializer.name, value, decoded)
+                assert type(decoded) == type(value) or \
+                    isinstance(value, basestring), (serializer.name, value)
+
+    def test_is_plain(self):
+        """Test SERIALIZERS is_plain only accepts the values that JSON keeps
+        as they are"""
+        assert is_plain([1, u'a', 'b', None, {'c': 1.5, u'd': [True]}])
+        assert not is_plain((1, 2))
+        assert not is_plain({1: 'a'})
+        assert not is_plain(['\xff'])
+        assert not is_plain(datetime.datetime.now())
+
+    def test_non_plain_values_are_pickled(self):
+        """Test SERIALIZERS fall back to pickle for non plain values"""
+        serializer = Serializer('json')
+
+        assert serializer.dumps([1])[0] == 'J'
+        assert serializer.dumps((1,))[0] == 'P'
+
+    def test_big_values_are_compressed(self):
+        """Test SERIALIZERS compress the payloads over the threshold"""
+        serializer = Serializer('json', compress_min_bytes=100)
+        value = ['value'] * 100
+
+        payload = serializer.dumps(value)
+
+        assert payload[0] == 'Z', payload[0]
+        assert len(payload) < 100, len(payload)
+        assert serializer.loads(payload) == value
+
+    def test_payloads_of_other_serializers_are_read(self):
+        """Test SERIALIZERS decode the payloads of the rest of serializers"""
+        payload = Serializer('json').dumps([1, 2])
+
+        assert Serializer('pickle').loads(payload) == [1, 2]
+
+    def test_unknown_payloads(self):
+        """Test SERIALIZERS raise ValueError for unknown payloads"""
+        assert_raises(ValueError, Serializer('pickle').loads, '(lp0\n.')
+        assert_raises(ValueError, Serializer, 'yaml')
+
+
+@patch('pybossa.cache.sentinel', new=test_sentinel)
+class TestNegativeCaching(object):
+
+    def setUp(self):
+        self.cache = os.environ.pop('PYBOSSA_REDIS_CACHE_DISABLED', None)
+        test_sentinel.master.flushall()
+
+    def tearDown(self):
+        if self.cache:
+            os.environ['PYBOSSA_REDIS_CACHE_DISABLED'] = self.cache
+
+    def test_memoize_caches_empty_values(self):
+        """Test CACHE memoize caches None, 0 and empty values too"""
+        calls = []
+
+        @memoize()
+        def my_func(arg):
+            calls.append(arg)
+            return arg
+
+        for value in (None, 0, [], ''):
+            my_func(value)
+            assert my_func(value) == value
+
+        assert len(calls) == 4, calls
+
+    def test_cache_caches_empty_values(self):
+        """Test CACHE cache caches empty values too"""
+        calls = []
+
+        @cache(key_prefix='my_empty_func')
+        def my_func():
+            calls.append(1)
+            return []
+
+        assert my_func() == []
+        assert my_func() == []
+        assert len(calls) == 1, calls
@@ -0,0 +1,115 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2014 SF Isle of Man Limited
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import tempfile
+from default import Test, sentinel
+from pybossa.cache import key_patterns, _function_generation_key
+from pybossa.cache.metrics import CacheMetrics
+from pybossa.cache import snapshot
+import pybossa.cache.apps as cached_apps
+
+
+class TestCacheSnapshot(Test):
+
+    def setUp(self):
+        super(TestCacheSnapshot, self).setUp()
+        self.redis_flushall()
+        self.path = tempfile.mktemp(suffix='.gz')
+        self.key = key_patterns['pybossa.cache.apps.n_tasks'][:-1] + 'hash'
+        self.generation_key = _function_generation_key(cached_apps.n_tasks)
+        metrics = CacheMetrics()
+        metrics.hit('pybossa.cache.apps.n_tasks')
+        metrics.computed('pybossa.cache.apps.n_tasks', 0.5, 10)
+        metrics.flush(sentinel.master)
+
+    def tearDown(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+        super(TestCacheSnapshot, self).tearDown()
+
+    def test_take_and_restore(self):
+        """Test CACHE_SNAPSHOT restores the entries of the hot functions and
+        the generations of their families after Redis loses them"""
+        sentinel.master.setex(self.key, 300, 'payload')
+        sentinel.master.setex(self.key + ':lock', 30, 'token')
+        sentinel.master.set(self.generation_key, 3)
+
+        assert snapshot.take(self.path) == 1
+        self.redis_flushall()
+        assert snapshot.is_cold()
+        assert snapshot.restore(self.path) == 1
+
+        assert sentinel.master.get(self.key) == 'payload'
+        assert 0 < sentinel.master.ttl(self.key) <= 300
+        assert not sentinel.master.exists(self.key + ':lock')
+        assert sentinel.master.get(self.generation_key) == '3'
+        assert not snapshot.is_cold()
+
+    def test_restore_does_not_overwrite_newer_values(self):
+        """Test CACHE_SNAPSHOT restore keeps the values already in Redis"""
+        sentinel.master.setex(self.key, 300, 'old')
+        sentinel.master.set(self.generation_key, 3)
+        snapshot.take(self.path)
+        sentinel.master.setex(self.key, 300, 'new')
+        sentinel.master.incr(self.generation_key)
+
+        snapshot.restore(self.path, force=True)
+
+        assert sentinel.master.get(self.key) == 'new'
+        assert sentinel.master.get(self.generation_key) == '5'
+
+    def test_restore_skips_a_warm_cache(self):
+        """Test CACHE_SNAPSHOT restore leaves the cache and its generations
+        alone if Redis did not lose them, unless forced"""
+        sentinel.master.setex(self.key, 300, 'payload')
+        sentinel.master.set(self.generation_key, 3)
+        snapshot.take(self.path)
+        sentinel.master.delete(self.key)
+
+        assert not snapshot.is_cold()
+        assert snapshot.restore(self.path) == 0
+
+        assert not sentinel.master.exists(self.key)
+        assert sentinel.master.get(self.generation_key) == '3'
+
+    def test_restore_bumps_generations_reset_since_the_snapshot(self):
+        """Test CACHE_SNAPSHOT restore invalidates the families whose
+        generation was reset and increased again since the snapshot"""
+        sentinel.master.setex(self.key, 300, 'payload')
+        sentinel.master.set(self.generation_key, 3)
+        snapshot.take(self.path)
+        self.redis_flushall()
+        for i in range(3):
+            sentinel.master.incr(self.generation_key)
+
+        snapshot.restore(self.path)
+
+        assert sentinel.master.get(self.generation_key) == '4'
+
+    def test_take_respects_max_entries(self):
+        """Test CACHE_SNAPSHOT take writes max_entries at most"""
+        for i in range(3):
+            sentinel.master.setex(self.key + str(i), 300, 'payload')
+
+        assert snapshot.take(self.path, max_entries=2) == 2
+
+    def test_restore_without_snapshot(self):
+        """Test CACHE_SNAPSHOT restore does nothing without a snapshot"""
+        assert snapshot.restore(self.path) == 0
+        assert not snapshot.is_cold()
@@ -0,0 +1,119 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2014 SF Isle of Man Limited
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+
+import os
+import time
+from mock import patch
+from pybossa.cache import memoize, get_key_to_hash, get_hash_key, \
+    ENTRY_VERSION, serializer
+from test_cache import test_sentinel
+from settings_test import REDIS_KEYPREFIX
+
+
+def _key(function, *args):
+    prefix = "%s:%s_args:" % (REDIS_KEYPREFIX, function.__name__)
+    return get_hash_key(prefix, get_key_to_hash(*args))
+
+
+def _store(key, output, expiration, ttl=300):
+    # Memoized values without tags belong to the family of the function
+    entry = [ENTRY_VERSION, output, 0.1, expiration, [0]]
+    test_sentinel.master.setex(key, ttl, serializer.dumps(entry))
+
+
+@patch('pybossa.cache.sentinel', new=test_sentinel)
+class TestMemoizeStampede(object):
+
+    def setUp(self):
+        self.cache = os.environ.pop('PYBOSSA_REDIS_CACHE_DISABLED', None)
+        test_sentinel.master.flushall()
+
+    def tearDown(self):
+        if self.cache:
+            os.environ['PYBOSSA_REDIS_CACHE_DISABLED'] = self.cache
+
+    def test_memoize_waits_for_worker_computing_the_value(self):
+        """Test CACHE memoize waits for the value computed by the worker
+        holding the lock instead of computing it again"""
+        calls = []
+
+        @memoize()
+        def my_func(arg):
+            calls.append(arg)
+            return 'computed'
+        key = _key(my_func, 1)
+        test_sentinel.master.set(key + ':lock', 'other worker')
+
+        def other_worker_stores_value(seconds):
+            _store(key, 'from other worker', time.time() + 300)
+
+        with patch('pybossa.cache.time.sleep') as sleep:
+            sleep.side_effect = other_worker_stores_value
+            assert my_func(1) == 'from other worker'
+        assert calls == []
+
+    def test_memoize_releases_the_lock(self):
+        """Test CACHE memoize releases the lock once the value is stored"""
+
+        @memoize()
+        def my_func(arg):
+            return arg
+        my_func(1)
+
+        assert not test_sentinel.master.exists(_key(my_func, 1) + ':lock')
+
+    def test_memoize_refreshes_values_early(self):
+        """Test CACHE memoize recomputes a value before it expires when it
+        has been picked for an early refresh"""
+
+        @memoize()
+        def my_func(arg):
+            return 'new'
+        _store(_key(my_func, 1), 'old', time.time() + 300)
+
+        with patch('pybossa.cache._refresh_early', return_value=True):
+            assert my_func(1) == 'new'
+
+    def test_memoize_serves_stale_values_while_revalidating(self):
+        """Test CACHE memoize with stale serves the expired value and enqueues
+        a job to recompute it, only once"""
+
+        @memoize(stale=60)
+        def my_func(arg):
+            return 'new'
+        _store(_key(my_func, 1), 'old', time.time() - 1)
+
+        with patch('pybossa.cache._enqueue_refresh') as enqueue:
+            assert my_func(1) == 'old'
+            assert my_func(1) == 'old'
+            assert enqueue.call_count == 1, enqueue.call_count
+
+    def test_refresh_stores_the_value_and_releases_the_lock(self):
+        """Test CACHE refresh of a memoized function recomputes and stores
+        the value, releasing the lock"""
+
+        @memoize(stale=60)
+        def my_func(arg):
+            return 'new'
+        key = _key(my_func, 1)
+        _store(key, 'old', time.time() - 1)
+        test_sentinel.master.set(key + ':lock', 'stale revalidation')
+
+        assert my_func.refresh(1) == 'new'
+        assert my_func(1) == 'new'
+        assert not test_sentinel.master.exists(key + ':lock')
@@ -16,6 +16,7 @@
 # You should have received a copy of the GNU Affero General Public License
 # along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
 
+import datetime
 from default import Test, db, with_context
 from nose.tools import raises
 from pybossa.model.user import User
@@ -23,6 +24,7 @@ from pybossa.model.app import App
 from pybossa.model.task import Task
 from pybossa.model.category import Category
 from pybossa.model.task_run import TaskRun
+from pybossa.model import isoformat
 
 
 """Tests for inter-model relations and base classes and helper functions
@@ -97,4 +99,9 @@ class TestModelBase(Test):
         assert outrun.info['answer'] == task_run_info['answer'], outrun
         assert outrun.user.name == username, outrun
 
+    def test_isoformat_keeps_microseconds(self):
+        """Test MODEL isoformat writes the microseconds even if they are 0"""
+        timestamp = datetime.datetime(2014, 11, 4, 10, 30, 0, 0)
 
+        assert isoformat(timestamp) == '2014-11-04T10:30:00.000000'
+        assert isoformat('2014-11-04T10:30:00.5') == '2014-11-04T10:30:00.5'
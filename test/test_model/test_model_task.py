@@ -23,6 +23,7 @@ from pybossa.model.user import User
 from pybossa.model.app import App
 from pybossa.model.task import Task
 from pybossa.model.category import Category
+from factories import TaskFactory, TaskRunFactory
 
 
 class TestModelTask(Test):
@@ -49,3 +50,52 @@ class TestModelTask(Test):
         db.session.add(task)
         assert_raises(IntegrityError, db.session.commit)
         db.session.rollback()
+
+
+    @with_context
+    def test_n_task_runs_counts_the_task_answers(self):
+        """Test TASK model n_task_runs is updated when answers are added or
+        deleted"""
+        task = TaskFactory.create(n_answers=4)
+        task_run = TaskRunFactory.create(task=task)
+        TaskRunFactory.create(task=task)
+
+        assert task.n_task_runs == 2, task.n_task_runs
+        assert task.pct_status() == 0.5, task.pct_status()
+
+        db.session.delete(task_run)
+        db.session.commit()
+
+        assert task.n_task_runs == 1, task.n_task_runs
+
+
+    @with_context
+    def test_last_task_run_id_points_to_the_last_answer(self):
+        """Test TASK model last_task_run_id points to the last answer, also
+        after deleting it"""
+        task = TaskFactory.create()
+        first = TaskRunFactory.create(task=task)
+        last = TaskRunFactory.create(task=task)
+
+        assert task.last_task_run_id == last.id, task.last_task_run_id
+
+        db.session.delete(last)
+        db.session.commit()
+
+        assert task.last_task_run_id == first.id, task.last_task_run_id
+
+
+    @with_context
+    def test_completed_at_is_the_finish_time_of_the_completing_answer(self):
+        """Test TASK model completed_at is set to the finish_time of the
+        answer completing the task, and only then"""
+        task = TaskFactory.create(n_answers=2)
+        TaskRunFactory.create(task=task)
+
+        assert task.completed_at is None, task.completed_at
+
+        last = TaskRunFactory.create(task=task)
+        db.session.refresh(task)
+
+        assert task.state == 'completed', task.state
+        assert task.completed_at == last.finish_time, task.completed_at
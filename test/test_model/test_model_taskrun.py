@@ -24,6 +24,7 @@ from pybossa.model.app import App
 from pybossa.model.task import Task
 from pybossa.model.task_run import TaskRun
 from pybossa.model.category import Category
+from factories import TaskRunFactory
 
 
 class TestModelTaskRun(Test):
@@ -59,3 +60,22 @@ class TestModelTaskRun(Test):
         db.session.add(task_run)
         assert_raises(IntegrityError, db.session.commit)
         db.session.rollback()
+
+    @with_context
+    def test_task_run_timestamps(self):
+        """Test TASK_RUN timestamps are compared as timestamps and read back
+        as ISO strings"""
+        task_run = TaskRunFactory.create(
+            finish_time='2014-07-07T17:23:45.714210')
+        TaskRunFactory.create(task=task_run.task,
+                              finish_time='2014-07-06T09:00:00.000000')
+        db.session.expire_all()
+
+        task_run = db.session.query(TaskRun).get(task_run.id)
+        assert task_run.finish_time == '2014-07-07T17:23:45.714210', \
+            task_run.finish_time
+        assert isinstance(task_run.created, basestring), task_run.created
+        assert task_run.dictize()['finish_time'] == task_run.finish_time
+        later = db.session.query(TaskRun)\
+            .filter(TaskRun.finish_time > '2014-07-07').all()
+        assert [tr.id for tr in later] == [task_run.id], later
@@ -549,3 +549,20 @@ class TestTaskRepositorySaveDeleteUpdate(Test):
 
         for task in tasks:
             assert task.state == 'completed', task.state
+
+
+    def test_update_tasks_redundancy_sets_completed_at(self):
+        """Test update_tasks_redundancy sets completed_at to the finish_time
+        of the n_answers-th answer of the completed tasks"""
+
+        project = AppFactory.create()
+        task = TaskFactory.create(app=project, n_answers=3)
+        first, second = TaskRunFactory.create_batch(2, task=task)
+
+        self.task_repo.update_tasks_redundancy(project, 1)
+        task = self.task_repo.get_task(task.id)
+        assert task.completed_at == first.finish_time, task.completed_at
+
+        self.task_repo.update_tasks_redundancy(project, 3)
+        task = self.task_repo.get_task(task.id)
+        assert task.completed_at is None, task.completed_at
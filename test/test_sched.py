@@ -415,6 +415,8 @@ class TestGetBreadthFirst(Test):
     def del_task_runs(self, app_id=1):
         """Deletes all TaskRuns for a given app_id"""
         db.session.query(TaskRun).filter_by(app_id=1).delete()
+        db.session.query(Task).filter_by(app_id=1)\
+                  .update({"n_task_runs": 0, "last_task_run_id": None})
         db.session.commit()
         db.session.remove()
 
@@ -442,6 +444,35 @@ class TestGetBreadthFirst(Test):
         task = pybossa.sched.get_random_task(app_id=1)
         assert task is None, task
 
+    @with_context
+    def test_get_random_task_skips_answered_and_completed_tasks(self):
+        """Test SCHED random only returns open tasks the user has not done"""
+        app = AppFactory.create()
+        answered, available = TaskFactory.create_batch(2, app=app)
+        TaskFactory.create(app=app, state='completed')
+        AnonymousTaskRunFactory.create(task=answered, user_ip='10.0.0.1')
+
+        for i in range(20):
+            task = pybossa.sched.get_random_task(app.id, user_ip='10.0.0.1')
+            assert task.id == available.id, task
+
+        AnonymousTaskRunFactory.create(task=available, user_ip='10.0.0.1')
+        assert pybossa.sched.get_random_task(app.id, user_ip='10.0.0.1') is None
+
+    @with_context
+    @patch('pybossa.sched.RANDOM_ATTEMPTS', 0)
+    @patch('pybossa.sched.PAGE_SIZE', 1)
+    def test_get_random_task_reads_the_pool_by_windows(self):
+        """Test SCHED random looks for the remaining task window by window"""
+        app = AppFactory.create()
+        tasks = TaskFactory.create_batch(3, app=app)
+        for task in tasks[:2]:
+            AnonymousTaskRunFactory.create(task=task, user_ip='10.0.0.1')
+
+        for i in range(10):
+            task = pybossa.sched.get_random_task(app.id, user_ip='10.0.0.1')
+            assert task.id == tasks[2].id, task
+
 
     def _test_get_breadth_first_task(self, user=None):
         self.del_task_runs()
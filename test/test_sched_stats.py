@@ -0,0 +1,84 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2014 SF Isle of Man Limited
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+
+from default import Test, with_context
+from pybossa import sched, sched_stats
+from factories import AppFactory, TaskFactory
+
+
+def get_no_task(app_id, user_id=None, user_ip=None, offset=0):
+    return None
+
+
+class TestSchedStats(Test):
+
+    def test_record_and_get_stats(self):
+        """Test SCHED_STATS aggregates the calls of a scheduler"""
+        sched_stats.record('default', 1, 3, 10, 1)
+        sched_stats.record('default', 1, 300, 20, 0)
+        sched_stats.record('random', 2, 1, 1, 1)
+
+        stats = sched_stats.get_stats()
+
+        assert [(s['sched'], s['app_id']) for s in stats] == \
+            [('default', 1), ('random', 2)], stats
+        assert stats[0]['calls'] == 2, stats
+        assert stats[0]['empty_rate'] == 0.5, stats
+        assert stats[0]['avg_candidates'] == 15, stats
+        assert stats[0]['p50_ms'] == 5, stats
+        assert stats[0]['p99_ms'] == 500, stats
+
+    @with_context
+    def test_new_task_records_stats(self):
+        """Test SCHED new_task records the stats of the scheduler call"""
+        app = AppFactory.create()
+        TaskFactory.create_batch(2, app=app)
+
+        sched.new_task(app.id, 'depth_first', user_ip='10.0.0.1')
+
+        stats = sched_stats.get_stats()
+        assert stats[0]['sched'] == 'depth_first', stats
+        assert stats[0]['avg_candidates'] == 2, stats
+        assert stats[0]['empty_rate'] == 0, stats
+
+
+class TestSchedRegistry(Test):
+
+    def tearDown(self):
+        sched.schedulers.pop('no_task', None)
+        super(TestSchedRegistry, self).tearDown()
+
+    @with_context
+    def test_unknown_scheduler_uses_default(self):
+        """Test SCHED new_task uses the default scheduler for unknown names"""
+        app = AppFactory.create()
+        task = TaskFactory.create(app=app)
+
+        assert sched.new_task(app.id, 'unknown').id == task.id
+
+    @with_context
+    def test_load_schedulers_from_config(self):
+        """Test SCHED load_schedulers registers the SCHEDULERS setting"""
+        app = AppFactory.create()
+        TaskFactory.create(app=app)
+
+        sched.load_schedulers(
+            dict(SCHEDULERS={'no_task': 'test_sched_stats.get_no_task'}))
+
+        assert sched.new_task(app.id, 'no_task') is None
+        assert sched.new_tasks(app.id, 'no_task', n=5) == []
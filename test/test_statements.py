@@ -0,0 +1,91 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2014 SF Isle of Man Limited
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+
+from mock import patch
+from default import Test, db, with_context
+from nose.tools import assert_raises
+from pybossa import statements
+from pybossa.statements import Statement
+from factories import AppFactory, TaskFactory
+
+
+_open_tasks_sql = Statement('test_open_tasks', '''
+    SELECT id FROM task WHERE app_id=:app_id AND state !='completed'
+    AND id = ANY(:task_ids) ORDER BY id LIMIT :limit''')
+
+# Only run by test_execute_prepares_once_per_connection, so it is not
+# prepared yet on any connection
+_n_tasks_sql = Statement('test_n_tasks', '''
+    SELECT COUNT(id) FROM task WHERE app_id=:app_id''')
+
+
+class TestStatements(Test):
+
+    def setUp(self):
+        super(TestStatements, self).setUp()
+        statements.reset_stats()
+
+    def tearDown(self):
+        statements.enabled = True
+        super(TestStatements, self).tearDown()
+
+    @with_context
+    def test_execute(self):
+        """Test STATEMENTS execute binds the parameters by name"""
+        app = AppFactory.create()
+        tasks = TaskFactory.create_batch(3, app=app)
+        task_ids = [task.id for task in tasks]
+
+        rows = _open_tasks_sql.execute(db.slave_session, dict(
+            limit=2, task_ids=task_ids, app_id=app.id))
+
+        assert [row.id for row in rows] == task_ids[:2]
+
+    @with_context
+    def test_execute_prepares_once_per_connection(self):
+        """Test STATEMENTS execute only prepares the statement the first time
+        it runs on a connection"""
+        app = AppFactory.create()
+        session = db.slave_session
+
+        with patch.object(session, 'execute', wraps=session.execute) as execute:
+            for i in range(3):
+                _n_tasks_sql.execute(session, dict(app_id=app.id)).fetchall()
+
+        stats = statements.get_stats()[0]
+        assert stats['name'] == 'test_n_tasks', stats
+        assert stats['calls'] == 3, stats
+        assert stats['prepares'] == 1, stats
+        queries = [str(args[0]) for args, kwargs in execute.call_args_list]
+        assert queries == ['EXECUTE test_n_tasks(:app_id)'] * 3, queries
+
+    @with_context
+    def test_execute_when_disabled(self):
+        """Test STATEMENTS execute runs plain queries when disabled"""
+        statements.enabled = False
+        task = TaskFactory.create()
+
+        rows = _open_tasks_sql.execute(db.slave_session, dict(
+            app_id=task.app_id, task_ids=[task.id], limit=1))
+
+        assert [row.id for row in rows] == [task.id]
+        assert statements.get_stats()[0]['prepares'] == 0
+
+    def test_names_are_unique(self):
+        """Test STATEMENTS does not allow two statements with the same name"""
+        assert_raises(ValueError, Statement, 'test_open_tasks', 'SELECT 1')
@@ -0,0 +1,103 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2015 SF Isle of Man Limited
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+
+import datetime
+from default import Test, db, with_context
+from factories import AppFactory, TaskFactory, TaskRunFactory, \
+    AnonymousTaskRunFactory, task_repo
+from pybossa import stats_rollup
+from pybossa.model.task_run import TaskRun
+from pybossa.model.stats_rollup import ProjectStatsDay, ProjectStatsHour
+
+
+class TestStatsRollup(Test):
+
+    def setUp(self):
+        super(TestStatsRollup, self).setUp()
+        self.project = AppFactory.create()
+        self.task = TaskFactory.create(app=self.project, n_answers=10)
+        TaskRunFactory.create_batch(2, task=self.task)
+        AnonymousTaskRunFactory.create(task=self.task)
+        self.day = datetime.datetime.utcnow().strftime('%Y-%m-%d')
+        self.hour = int(datetime.datetime.utcnow().strftime('%H'))
+
+    @with_context
+    def test_update_rolls_up_the_runs_seen_by_the_previous_update(self):
+        """Test STATS_ROLLUP update only rolls up the task runs inserted
+        before the previous update"""
+        assert stats_rollup.update() == 0
+        AnonymousTaskRunFactory.create(task=self.task, user_ip='10.0.0.2')
+
+        assert stats_rollup.update() == 3
+
+        rows = db.session.query(ProjectStatsHour).all()
+        counts = dict((row.anonymous, row.n_task_runs) for row in rows)
+        assert counts == {False: 2, True: 1}, counts
+        assert db.session.query(ProjectStatsDay).count() == 2
+
+    @with_context
+    def test_batches_add_up(self):
+        """Test STATS_ROLLUP update adds the counts of every batch"""
+        stats_rollup.update()
+        stats_rollup.update(batch_size=1)
+
+        rows = db.session.query(ProjectStatsDay).all()
+        counts = dict((row.anonymous, row.n_task_runs) for row in rows)
+        assert counts == {False: 2, True: 1}, counts
+
+    @with_context
+    def test_reads_add_the_runs_not_rolled_up_yet(self):
+        """Test STATS_ROLLUP days and hours count the task runs both in the
+        rollups and not rolled up yet"""
+        stats_rollup.update()
+        stats_rollup.update()
+        TaskRunFactory.create(task=self.task)
+
+        days = stats_rollup.days(self.project.id)
+        hours = stats_rollup.hours(self.project.id)
+
+        assert days == {(self.day, False): 3, (self.day, True): 1}, days
+        assert hours == {(self.hour, False): 3, (self.hour, True): 1}, hours
+
+    @with_context
+    def test_deleted_runs_are_discounted(self):
+        """Test STATS_ROLLUP discounts the deleted task runs, both rolled up
+        and not rolled up yet"""
+        stats_rollup.update()
+        stats_rollup.update()
+        TaskRunFactory.create(task=self.task)
+
+        task_runs = db.session.query(TaskRun).filter_by(task_id=self.task.id)
+        task_repo.delete_all(task_runs.order_by(TaskRun.id).limit(2).all())
+
+        days = stats_rollup.days(self.project.id)
+        hours = stats_rollup.hours(self.project.id)
+        assert sum(days.values()) == 2, days
+        assert sum(hours.values()) == 2, hours
+
+    @with_context
+    def test_rebuild(self):
+        """Test STATS_ROLLUP rebuild empties the rollups"""
+        stats_rollup.update()
+        stats_rollup.update()
+
+        stats_rollup.rebuild()
+
+        assert db.session.query(ProjectStatsDay).count() == 0
+        assert stats_rollup.days(self.project.id) == \
+            {(self.day, False): 2, (self.day, True): 1}
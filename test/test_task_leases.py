@@ -0,0 +1,197 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2014 SF Isle of Man Limited
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+
+import json
+import time
+from mock import patch
+from default import Test, with_context, sentinel
+from pybossa import task_leases
+from pybossa.sched import (get_depth_first_lease_task, get_breadth_first_task,
+                           get_incremental_task)
+from factories import AppFactory, TaskFactory, AnonymousTaskRunFactory
+
+
+class TestTaskLeases(Test):
+
+    def test_acquire_respects_budget(self):
+        """Test TASK_LEASES acquire grants at most budget leases"""
+        assert task_leases.acquire(1, 2, user_id=1)
+        assert task_leases.acquire(1, 2, user_ip='10.0.0.1')
+        assert not task_leases.acquire(1, 2, user_id=2)
+        assert task_leases.n_leases(1) == 2
+
+    def test_acquire_renews_lease_of_holder(self):
+        """Test TASK_LEASES acquire renews the lease a user already holds"""
+        assert task_leases.acquire(1, 1, user_id=1)
+
+        assert task_leases.acquire(1, 1, user_id=1)
+        assert task_leases.n_leases(1) == 1
+
+    def test_expired_leases_are_reclaimed(self):
+        """Test TASK_LEASES acquire reclaims expired leases"""
+        task_leases.acquire(1, 1, user_id=1, timeout=-1)
+
+        assert task_leases.acquire(1, 1, user_id=2)
+
+    def test_acquire_many_skips_offset_without_leasing(self):
+        """Test TASK_LEASES acquire_many leases n tasks after skipping the
+        offset available ones, which are not leased"""
+        task_leases.acquire(1, 1, user_id=2)
+
+        leased = task_leases.acquire_many([(1, 1), (2, 1), (3, 1), (4, 1)],
+                                          n=2, offset=1, user_id=1)
+
+        assert leased == [3, 4], leased
+        assert task_leases.n_leases(2) == 0
+        assert task_leases.n_leases(3) == task_leases.n_leases(4) == 1
+
+    def test_acquire_many_without_redis(self):
+        """Test TASK_LEASES acquire_many hands out the tasks without leasing
+        them when Redis is not available"""
+        sentinel.master.breaker.opened_at = time.time()
+        try:
+            leased = task_leases.acquire_many([(1, 1), (2, 0), (3, 1), (4, 1)],
+                                              n=2, offset=1, user_id=1)
+        finally:
+            sentinel.master.breaker.close()
+
+        assert leased == [3, 4], leased
+
+    def test_release(self):
+        """Test TASK_LEASES release frees the lease of a user"""
+        task_leases.acquire(1, 1, user_id=1)
+
+        task_leases.release(1, user_id=1)
+
+        assert task_leases.acquire(1, 1, user_id=2)
+
+
+class TestDepthFirstLeaseSched(Test):
+
+    @with_context
+    def test_volunteers_are_spread_over_tasks(self):
+        """Test SCHED depth_first_lease does not lease a task beyond the
+        answers it still needs"""
+        app = AppFactory.create()
+        first = TaskFactory.create(app=app, n_answers=2)
+        second = TaskFactory.create(app=app, n_answers=2)
+        AnonymousTaskRunFactory.create(task=first, user_ip='10.0.0.9')
+
+        tasks = [get_depth_first_lease_task(app.id, user_ip='10.0.0.%s' % i)
+                 for i in range(4)]
+
+        assert [t.id if t else None for t in tasks] == \
+            [first.id, second.id, second.id, None], tasks
+
+    @with_context
+    def test_offset_tasks_are_not_leased(self):
+        """Test SCHED depth_first_lease does not lease the tasks it skips"""
+        app = AppFactory.create()
+        first, second = TaskFactory.create_batch(2, app=app, n_answers=1)
+
+        task = get_depth_first_lease_task(app.id, user_ip='10.0.0.1', offset=1)
+
+        assert task.id == second.id, task
+        assert task_leases.n_leases(first.id) == 0
+
+    @with_context
+    def test_submitting_a_task_run_releases_the_lease(self):
+        """Test API TaskRun post releases the lease of the task"""
+        app = AppFactory.create(info={'sched': 'depth_first_lease'})
+        task = TaskFactory.create(app=app, n_answers=2)
+
+        self.app.get('/api/app/%s/newtask' % app.id)
+        assert task_leases.n_leases(task.id) == 1
+        data = dict(app_id=app.id, task_id=task.id, info='my task result')
+        self.app.post('/api/taskrun', data=json.dumps(data))
+
+        assert task_leases.n_leases(task.id) == 0
+
+
+class TestIncrementalLeases(Test):
+
+    @with_context
+    def test_skips_tasks_locked_by_many_volunteers(self):
+        """Test SCHED incremental finds a free task when more volunteers than
+        the old limit of candidates hold a lease"""
+        app = AppFactory.create()
+        tasks = TaskFactory.create_batch(12, app=app)
+        for i, task in enumerate(tasks[:11]):
+            task_leases.acquire(task.id, 1, user_ip='10.0.0.%s' % i)
+
+        task = get_incremental_task(app.id, user_ip='10.0.0.99')
+
+        assert task.id == tasks[11].id, task
+        assert get_incremental_task(app.id, user_ip='10.0.0.98') is None
+
+
+class TestBreadthFirstBudget(Test):
+
+    @with_context
+    def test_does_not_hand_out_more_than_n_answers(self):
+        """Test SCHED breadth_first spreads concurrent volunteers and respects
+        n_answers"""
+        app = AppFactory.create()
+        first = TaskFactory.create(app=app, n_answers=1)
+        second = TaskFactory.create(app=app, n_answers=2)
+
+        tasks = [get_breadth_first_task(app.id, user_ip='10.0.0.%s' % i)
+                 for i in range(4)]
+
+        assert [t.id if t else None for t in tasks] == \
+            [first.id, second.id, second.id, None], tasks
+
+    @with_context
+    def test_same_volunteer_keeps_its_task(self):
+        """Test SCHED breadth_first does not count the lease of the user
+        asking for a task"""
+        app = AppFactory.create()
+        first, second = TaskFactory.create_batch(2, app=app)
+
+        task = get_breadth_first_task(app.id, user_ip='10.0.0.1')
+        again = get_breadth_first_task(app.id, user_ip='10.0.0.1')
+        other = get_breadth_first_task(app.id, user_ip='10.0.0.2')
+
+        assert task.id == again.id == first.id, (task, again)
+        assert other.id == second.id, other
+
+    @with_context
+    def test_offset_tasks_are_not_leased(self):
+        """Test SCHED breadth_first does not lease the tasks it skips"""
+        app = AppFactory.create()
+        first, second = TaskFactory.create_batch(2, app=app, n_answers=1)
+
+        task = get_breadth_first_task(app.id, user_ip='10.0.0.1', offset=1)
+
+        assert task.id == second.id, task
+        assert task_leases.n_leases(first.id) == 0
+
+    @with_context
+    @patch('pybossa.sched.LEASE_CANDIDATES', 1)
+    @patch('pybossa.sched.PAGE_SIZE', 2)
+    def test_reads_more_candidates_when_all_are_leased(self):
+        """Test SCHED breadth_first keeps reading candidates until it gets a
+        lease"""
+        app = AppFactory.create()
+        tasks = TaskFactory.create_batch(5, app=app, n_answers=1)
+        for i, task in enumerate(tasks[:4]):
+            task_leases.acquire(task.id, 1, user_ip='10.0.0.%s' % i)
+
+        task = get_breadth_first_task(app.id, user_ip='10.0.0.9')
+
+        assert task.id == tasks[4].id, task
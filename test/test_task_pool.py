@@ -0,0 +1,176 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2014 SF Isle of Man Limited
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+
+from default import Test, db, with_context, sentinel
+from pybossa import task_pool
+from pybossa.model.task_run import TaskRun
+from pybossa.sched import get_depth_first_pool_task, get_depth_first_pool_tasks
+from factories import AppFactory, TaskFactory, TaskRunFactory, \
+    AnonymousTaskRunFactory, UserFactory, task_repo
+
+
+class TestTaskPool(Test):
+
+    def test_pool_is_built_with_open_tasks_by_priority(self):
+        """Test TASK_POOL is built with the open tasks sorted by priority and id"""
+        app = AppFactory.create()
+        low = TaskFactory.create(app=app, priority_0=0.1)
+        high = TaskFactory.create(app=app, priority_0=0.9)
+        other_low = TaskFactory.create(app=app, priority_0=0.1)
+        TaskFactory.create(app=app, state='completed')
+
+        task_ids = task_pool.get_task_ids(app.id)
+
+        assert task_ids == [high.id, low.id, other_low.id], task_ids
+
+    def test_new_task_is_added_to_built_pool(self):
+        """Test TASK_POOL adds new tasks to an existing pool"""
+        app = AppFactory.create()
+        first = TaskFactory.create(app=app)
+        task_pool.get_task_ids(app.id)
+
+        second = TaskFactory.create(app=app, priority_0=1)
+
+        task_ids = task_pool.get_task_ids(app.id)
+        assert task_ids == [second.id, first.id], task_ids
+
+    def test_reprioritised_task_is_moved_in_the_pool(self):
+        """Test TASK_POOL moves a task when its priority is updated"""
+        app = AppFactory.create()
+        first, second = TaskFactory.create_batch(2, app=app)
+        task_pool.get_task_ids(app.id)
+
+        second.priority_0 = 0.5
+        task_repo.update(second)
+
+        task_ids = task_pool.get_task_ids(app.id)
+        assert task_ids == [second.id, first.id], task_ids
+
+    def test_completed_task_is_removed_from_the_pool(self):
+        """Test TASK_POOL removes a task once it gets all its answers"""
+        app = AppFactory.create()
+        task = TaskFactory.create(app=app, n_answers=1)
+        task_pool.get_task_ids(app.id)
+
+        AnonymousTaskRunFactory.create(task=task)
+
+        assert task_pool.get_task_ids(app.id) == []
+
+    def test_changes_extend_the_pool_expiration(self):
+        """Test TASK_POOL adding or removing a task extends the expiration of
+        the pool"""
+        app = AppFactory.create()
+        task = TaskFactory.create(app=app)
+        task_pool.get_task_ids(app.id)
+        key = task_pool._pool_key(app.id)
+        sentinel.master.expire(key, 10)
+
+        task_pool.add_task(app.id, task.id + 1, 0)
+        assert sentinel.master.ttl(key) > 10
+        sentinel.master.expire(key, 10)
+        task_pool.remove_task(app.id, task.id + 1)
+        assert sentinel.master.ttl(key) > 10
+
+    def test_pool_is_updated_once_committed(self):
+        """Test TASK_POOL removes a completed task only once the answer is
+        committed"""
+        app = AppFactory.create()
+        task = TaskFactory.create(app=app, n_answers=1)
+        task_pool.get_task_ids(app.id)
+
+        db.session.add(TaskRun(app_id=app.id, task_id=task.id,
+                               user_ip='10.0.0.1'))
+        db.session.flush()
+        assert task_pool.get_task_ids(app.id) == [task.id]
+        db.session.rollback()
+        assert task_pool.get_task_ids(app.id) == [task.id]
+
+        db.session.add(TaskRun(app_id=app.id, task_id=task.id,
+                               user_ip='10.0.0.1'))
+        db.session.commit()
+        assert task_pool.get_task_ids(app.id) == []
+
+    def test_deleted_pool_is_rebuilt(self):
+        """Test TASK_POOL is rebuilt from the DB after being deleted"""
+        app = AppFactory.create()
+        task = TaskFactory.create(app=app)
+        task_pool.get_task_ids(app.id)
+
+        task_pool.delete_pool(app.id)
+
+        assert task_pool.get_task_ids(app.id) == [task.id]
+
+
+class TestDepthFirstPoolSched(Test):
+
+    @with_context
+    def test_returns_top_priority_task(self):
+        """Test SCHED depth_first_pool returns the task with top priority"""
+        app = AppFactory.create()
+        TaskFactory.create(app=app)
+        high = TaskFactory.create(app=app, priority_0=1)
+
+        task = get_depth_first_pool_task(app.id, user_ip='127.0.0.1')
+
+        assert task.id == high.id, task
+
+    @with_context
+    def test_skips_tasks_answered_by_the_user(self):
+        """Test SCHED depth_first_pool skips the tasks the user has answered"""
+        app = AppFactory.create()
+        user = UserFactory.create()
+        first, second = TaskFactory.create_batch(2, app=app)
+        TaskRunFactory.create(task=first, user=user)
+
+        task = get_depth_first_pool_task(app.id, user_id=user.id)
+
+        assert task.id == second.id, task
+
+    @with_context
+    def test_respects_offset(self):
+        """Test SCHED depth_first_pool returns the offset-th available task"""
+        app = AppFactory.create()
+        tasks = TaskFactory.create_batch(3, app=app)
+
+        task = get_depth_first_pool_task(app.id, user_ip='127.0.0.1', offset=2)
+
+        assert task.id == tasks[2].id, task
+
+    @with_context
+    def test_returns_none_when_no_tasks_available(self):
+        """Test SCHED depth_first_pool returns None if no task is available"""
+        app = AppFactory.create()
+        task = TaskFactory.create(app=app)
+        AnonymousTaskRunFactory.create(task=task, user_ip='127.0.0.1')
+
+        assert get_depth_first_pool_task(app.id, user_ip='127.0.0.1') is None
+
+    @with_context
+    def test_returns_n_tasks_skipping_stale_ones(self):
+        """Test SCHED depth_first_pool returns n tasks, dropping stale ones"""
+        app = AppFactory.create()
+        tasks = TaskFactory.create_batch(4, app=app)
+        task_pool.get_task_ids(app.id)
+        db.session.execute('UPDATE task SET state=\'completed\' WHERE id=%s'
+                           % tasks[1].id)
+        db.session.commit()
+
+        result = get_depth_first_pool_tasks(app.id, user_ip='127.0.0.1', n=2)
+
+        assert [t.id for t in result] == [tasks[0].id, tasks[2].id], result
+        assert tasks[1].id not in task_pool.get_task_ids(app.id)
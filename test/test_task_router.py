@@ -0,0 +1,81 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2014 SF Isle of Man Limited
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+
+from default import Test, with_context, sentinel
+from pybossa import task_router
+from factories import AppFactory, TaskFactory, TaskRunFactory
+
+
+class TestTaskRouter(Test):
+
+    @with_context
+    def test_build_availability_counts_needed_answers(self):
+        """Test TASK_ROUTER build_availability scores projects by the answers
+        they still need"""
+        app = AppFactory.create()
+        task = TaskFactory.create(app=app, n_answers=3)
+        TaskFactory.create(app=app, n_answers=2)
+        TaskRunFactory.create(task=task)
+
+        n_apps = task_router.build_availability()
+
+        assert n_apps == 1, n_apps
+        score = sentinel.master.zscore('pybossa:router:apps', app.id)
+        assert score == 4, score
+
+    @with_context
+    def test_build_availability_skips_unavailable_projects(self):
+        """Test TASK_ROUTER build_availability skips hidden, password
+        protected, completed and presenter-less projects"""
+        hidden = AppFactory.create(hidden=1)
+        protected = AppFactory.create(info={'task_presenter': 'presenter',
+                                            'passwd_hash': 'hash'})
+        no_presenter = AppFactory.create(info={})
+        completed = AppFactory.create()
+        for app in (hidden, protected, no_presenter):
+            TaskFactory.create(app=app)
+        TaskFactory.create(app=completed, state='completed')
+
+        assert task_router.build_availability() == 0
+        assert task_router.pick_projects() == []
+
+    @with_context
+    def test_pick_projects_for_anonymous_users(self):
+        """Test TASK_ROUTER pick_projects only returns projects allowing
+        anonymous contributors to anonymous users"""
+        anonymous = AppFactory.create()
+        authenticated = AppFactory.create(allow_anonymous_contributors=False)
+        TaskFactory.create(app=anonymous)
+        TaskFactory.create(app=authenticated)
+
+        assert task_router.pick_projects(anonymous=True) == [anonymous.id]
+        assert sorted(task_router.pick_projects()) == sorted(
+            [anonymous.id, authenticated.id])
+
+    @with_context
+    def test_pick_projects_favours_projects_needing_more_answers(self):
+        """Test TASK_ROUTER pick_projects picks more often the projects that
+        need more answers"""
+        busy = AppFactory.create()
+        needy = AppFactory.create()
+        TaskFactory.create(app=busy, n_answers=1)
+        TaskFactory.create_batch(10, app=needy, n_answers=10)
+
+        firsts = [task_router.pick_projects(n=1)[0] for i in range(100)]
+
+        assert firsts.count(needy.id) > firsts.count(busy.id), firsts
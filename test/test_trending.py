@@ -0,0 +1,88 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2014 SF Isle of Man Limited
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+
+import datetime
+from default import Test, sentinel
+from pybossa import trending
+from pybossa.cache import site_stats
+from factories import AppFactory, TaskFactory, TaskRunFactory, \
+    AnonymousTaskRunFactory, UserFactory
+
+
+class TestTrending(Test):
+
+    def test_new_task_runs_are_ranked(self):
+        """Test TRENDING ranks the projects and users of new task runs"""
+        app, other_app = AppFactory.create_batch(2)
+        user = UserFactory.create()
+        trending.rebuild()
+        TaskRunFactory.create(task=TaskFactory.create(app=app), user=user)
+        TaskRunFactory.create(task=TaskFactory.create(app=app), user=user)
+        AnonymousTaskRunFactory.create(task=TaskFactory.create(app=other_app))
+
+        assert trending.top_apps() == [(app.id, 2), (other_app.id, 1)], \
+            trending.top_apps()
+        assert trending.top_users() == [(user.id, 2)], trending.top_users()
+
+    def test_rankings_are_built_from_db(self):
+        """Test TRENDING builds the rankings of the last 24 hours from the
+        DB"""
+        app = AppFactory.create()
+        task = TaskFactory.create(app=app)
+        TaskRunFactory.create(task=task)
+        old = datetime.datetime.utcnow() - datetime.timedelta(days=2)
+        TaskRunFactory.create(task=task, finish_time=old.isoformat())
+        self.redis_flushall()
+
+        assert trending.top_apps() == [(app.id, 1)], trending.top_apps()
+        assert sentinel.master.exists(trending.BUILT_KEY)
+
+    def test_rebuild_keeps_the_contributions_of_the_current_hour(self):
+        """Test TRENDING rebuild does not count twice the contributions of
+        the current hour"""
+        app = AppFactory.create()
+        TaskRunFactory.create(task=TaskFactory.create(app=app))
+
+        trending.rebuild()
+        trending.rebuild()
+
+        assert trending.top_apps() == [(app.id, 1)], trending.top_apps()
+
+    def test_top5_apps_24_hours_skips_hidden_projects(self):
+        """Test TRENDING get_top5_apps_24_hours does not list hidden
+        projects"""
+        app = AppFactory.create()
+        hidden = AppFactory.create(hidden=1)
+        AnonymousTaskRunFactory.create(task=TaskFactory.create(app=app))
+        AnonymousTaskRunFactory.create_batch(
+            2, task=TaskFactory.create(app=hidden, n_answers=2))
+
+        top5 = site_stats.get_top5_apps_24_hours()
+
+        assert [a['id'] for a in top5] == [app.id], top5
+        assert top5[0]['n_answers'] == 1, top5
+
+    def test_top5_users_24_hours(self):
+        """Test TRENDING get_top5_users_24_hours lists the active users"""
+        user = UserFactory.create()
+        TaskRunFactory.create(user=user)
+
+        top5 = site_stats.get_top5_users_24_hours()
+
+        assert top5 == [dict(id=user.id, fullname=user.fullname,
+                             name=user.name, n_answers=1)], top5
@@ -0,0 +1,131 @@
+# -*- coding: utf8 -*-
+# This file is part of PyBossa.
+#
+# Copyright (C) 2014 SF Isle of Man Limited
+#
+# PyBossa is free software: you can redistribute it and/or modify
+# it under the terms of the GNU Affero General Public License as published by
+# the Free Software Foundation, either version 3 of the License, or
+# (at your option) any later version.
+#
+# PyBossa is distributed in the hope that it will be useful,
+# but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+# GNU Affero General Public License for more details.
+#
+# You should have received a copy of the GNU Affero General Public License
+# along with PyBossa.  If not, see <http://www.gnu.org/licenses/>.
+
+from mock import patch
+from default import Test, sentinel
+from pybossa import volunteers
+from factories import AppFactory, TaskFactory, TaskRunFactory, \
+    AnonymousTaskRunFactory, UserFactory, task_repo
+
+
+class TestVolunteers(Test):
+
+    def test_count_builds_sketches_from_db(self):
+        """Test VOLUNTEERS count builds the sketches of a project from the DB"""
+        app = AppFactory.create()
+        task = TaskFactory.create(app=app)
+        TaskRunFactory.create_batch(2, task=task)
+        AnonymousTaskRunFactory.create(task=task)
+        AnonymousTaskRunFactory.create(task=task, user_ip='10.0.0.1')
+        self.redis_flushall()
+
+        assert volunteers.count(app.id) == (2, 2), volunteers.count(app.id)
+        assert sentinel.master.exists(volunteers._built_key(app.id))
+
+    def test_new_task_run_is_counted(self):
+        """Test VOLUNTEERS adds the volunteers of new task runs"""
+        app = AppFactory.create()
+        user = UserFactory.create()
+        task = TaskFactory.create(app=app)
+        assert volunteers.count(app.id) == (0, 0)
+
+        TaskRunFactory.create(task=task, user=user)
+        AnonymousTaskRunFactory.create(task=task)
+
+        assert volunteers.count(app.id) == (1, 1), volunteers.count(app.id)
+
+    def test_volunteer_is_counted_once(self):
+        """Test VOLUNTEERS counts every volunteer once"""
+        app = AppFactory.create()
+        user = UserFactory.create()
+        task, other_task = TaskFactory.create_batch(2, app=app)
+        TaskRunFactory.create(task=task, user=user)
+        TaskRunFactory.create(task=other_task, user=user)
+
+        assert volunteers.count(app.id) == (1, 0), volunteers.count(app.id)
+
+    @patch('pybossa.volunteers._enqueue_build')
+    def test_site_counts_every_project(self, enqueue_build):
+        """Test VOLUNTEERS counts the volunteers of the site"""
+        task, other_task = TaskFactory.create_batch(2)
+        AnonymousTaskRunFactory.create(task=task)
+        AnonymousTaskRunFactory.create(task=other_task)
+        AnonymousTaskRunFactory.create(task=other_task, user_ip='10.0.0.1')
+
+        assert volunteers.count() == (0, 2), volunteers.count()
+
+    @patch('pybossa.volunteers._enqueue_build')
+    def test_site_sketches_are_built_in_the_background(self, enqueue_build):
+        """Test VOLUNTEERS enqueues a single job building the site sketches,
+        counting in the DB meanwhile"""
+        AnonymousTaskRunFactory.create()
+        self.redis_flushall()
+
+        assert volunteers.count() == (0, 1), volunteers.count()
+        assert volunteers.count() == (0, 1), volunteers.count()
+        enqueue_build.assert_called_once_with(None)
+
+        volunteers.build()
+
+        assert volunteers.count() == (0, 1), volunteers.count()
+        assert not sentinel.master.exists(volunteers._lock_key(None))
+
+    def test_sketches_being_built_are_not_counted(self):
+        """Test VOLUNTEERS counts in the DB while another worker builds the
+        sketches of a project"""
+        app = AppFactory.create()
+        task = TaskFactory.create(app=app)
+        AnonymousTaskRunFactory.create(task=task)
+        AnonymousTaskRunFactory.create(task=task, user_ip='10.0.0.1')
+        self.redis_flushall()
+        sentinel.master.set(volunteers._lock_key(app.id), 1)
+        sentinel.master.execute_command(
+            'PFADD', volunteers._sketch_key(app.id, volunteers.ANON),
+            '10.0.0.1')
+
+        assert volunteers.count(app.id) == (0, 2), volunteers.count(app.id)
+
+    def test_count_many(self):
+        """Test VOLUNTEERS count_many counts many projects at once"""
+        app, other_app = AppFactory.create_batch(2)
+        AnonymousTaskRunFactory.create(task=TaskFactory.create(app=app))
+
+        counts = volunteers.count_many([app.id, other_app.id])
+
+        assert counts == [(0, 1), (0, 0)], counts
+
+    def test_deleted_task_run_is_not_counted(self):
+        """Test VOLUNTEERS counts a project again when a task run is deleted"""
+        app = AppFactory.create()
+        task = TaskFactory.create(app=app)
+        task_run = AnonymousTaskRunFactory.create(task=task)
+        assert volunteers.count(app.id) == (0, 1)
+
+        task_repo.delete(task_run)
+
+        assert volunteers.count(app.id) == (0, 0), volunteers.count(app.id)
+
+    def test_rebuild_counts_exactly(self):
+        """Test VOLUNTEERS rebuild writes the sketches anew from the DB"""
+        app = AppFactory.create()
+        AnonymousTaskRunFactory.create(task=TaskFactory.create(app=app))
+        sentinel.master.execute_command(
+            'PFADD', volunteers._sketch_key(app.id, volunteers.ANON), '10.0.0.1')
+
+        assert volunteers.rebuild(app.id) == (0, 1)
+        assert volunteers.count(app.id) == (0, 1), volunteers.count(app.id)